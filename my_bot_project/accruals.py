@@ -0,0 +1,89 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy import case, delete, func, insert, select, update
+
+from config import ACCRUAL_FOLD_BATCH
+from database import get_db_session, increment_inviter_stats
+from models import User, BalanceAccrual
+from user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+async def add_accruals(session, accruals):
+    # accruals: [(user_id, amount, kind, game_id), ...]，只追加不更新，不会产生行锁竞争
+    rows = [
+        dict(user_id=user_id, amount=amount, kind=kind, game_id=game_id)
+        for user_id, amount, kind, game_id in accruals
+        if user_id is not None and amount
+    ]
+    if rows:
+        await session.execute(insert(BalanceAccrual), rows)
+
+async def get_pending_accruals(user_id):
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(func.coalesce(func.sum(BalanceAccrual.amount), 0)).where(BalanceAccrual.user_id == user_id)
+        )
+        return result.scalar()
+
+async def get_user_balance(user):
+    # 展示给用户的余额 = 已合并的余额 + 尚未合并的手续费/邀约收益。
+    # 两者在同一条语句里读取（同一个快照）：缓存里的 user.balance 可能早于或晚于正在进行的 fold_accruals，
+    # 分开读会把一批收益算两次或漏掉
+    pending = (
+        select(func.coalesce(func.sum(BalanceAccrual.amount), 0))
+        .where(BalanceAccrual.user_id == User.id)
+        .scalar_subquery()
+    )
+    async with get_db_session() as session:
+        result = await session.execute(select(User.balance + pending).where(User.id == user.id))
+        return result.scalar()
+
+async def fold_accruals(batch_size=ACCRUAL_FOLD_BATCH):
+    # 一次取出一批记录删除，按用户汇总后一次性加到 users.balance 上
+    async with get_db_session() as session:
+        batch = (
+            select(BalanceAccrual.id)
+            .order_by(BalanceAccrual.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await session.execute(
+            delete(BalanceAccrual)
+            .where(BalanceAccrual.id.in_(batch.scalar_subquery()))
+            .returning(BalanceAccrual.user_id, BalanceAccrual.amount, BalanceAccrual.kind)
+            .execution_options(synchronize_session=False)
+        )
+        rows = result.all()
+
+        totals = defaultdict(int)
+        referrals = defaultdict(int)
+        for user_id, amount, kind in rows:
+            totals[user_id] += amount
+            if kind == 'referral':
+                referrals[user_id] += amount
+        balances = []
+        if totals:
+            result = await session.execute(
+                update(User)
+                .where(User.id.in_(totals))
+                .values(balance=User.balance + case(dict(totals), value=User.id, else_=0))
+                .returning(User.id, User.balance)
+                .execution_options(synchronize_session=False)
+            )
+            balances = result.all()
+        # 邀约收益同时累加到邀请人的汇总数据里
+        for inviter_id, amount in referrals.items():
+            await increment_inviter_stats(session, inviter_id, referral_earnings=amount)
+    for user_id, balance in balances:
+        user_cache.update_by_id(user_id, balance=balance)
+    return len(rows)
+
+async def fold_accruals_job(context):
+    try:
+        folded = await fold_accruals()
+        while folded >= ACCRUAL_FOLD_BATCH:
+            folded = await fold_accruals()
+    except Exception as e:
+        logger.error(f"Error folding balance accruals: {e}", exc_info=True)
@@ -0,0 +1,103 @@
+# 对比直接调用 Bot API 和经过 FloodControlRateLimiter 两种方式在高峰时的表现
+#
+# 假 Bot API（fake_bot_api.py --flood）按 Telegram 的频率限制返回 429。每个聊天同时产生：
+# 连续几次编辑同一条菜单消息（低优先级，可合并）、几条普通消息、一条对局结果（高优先级）。
+# 统计 429 次数、失败次数、实际发出的请求数以及各优先级的延迟。
+#
+# 用法：python benchmarks/bench_outbound.py --chats 200
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+from fake_bot_api import FakeBotApi, serve
+from flood_control import FloodControlRateLimiter, PRIORITY_HIGH
+
+BENCH_TOKEN = '123456:bench'
+
+def make_jobs(chats, edits, sends):
+    jobs = []
+    for chat_id in range(1, chats + 1):
+        for n in range(edits):
+            jobs.append(('menu', 'edit_message_text', dict(chat_id=chat_id, message_id=1, text=f'菜单 {n}'), None))
+        for n in range(sends):
+            jobs.append(('message', 'send_message', dict(chat_id=chat_id, text=f'消息 {n}'), None))
+        jobs.append(('result', 'send_message', dict(chat_id=chat_id, text='游戏结束！'), PRIORITY_HIGH))
+    random.Random(42).shuffle(jobs)
+    return jobs
+
+async def run_once(api, port, jobs, limiter):
+    api.reset()
+    bot = ExtBot(
+        BENCH_TOKEN,
+        base_url=f'http://127.0.0.1:{port}/bot',
+        request=HTTPXRequest(connection_pool_size=256, pool_timeout=60),
+        rate_limiter=limiter,
+    )
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+
+    async def run(kind, method, kwargs, priority):
+        started = time.perf_counter()
+        try:
+            if limiter is not None:
+                kwargs = dict(kwargs, rate_limit_args=priority)
+            await getattr(bot, method)(**kwargs)
+        except RetryAfter:
+            failures[kind] += 1
+            return
+        latencies[kind].append((time.perf_counter() - started) * 1000)
+
+    async with bot:
+        started = time.perf_counter()
+        await asyncio.gather(*(run(*job) for job in jobs))
+        elapsed = time.perf_counter() - started
+    return elapsed, latencies, failures, api.stats()
+
+def print_result(title, jobs, elapsed, latencies, failures, stats, limiter):
+    print(f"\n===== {title} =====")
+    print(f"{len(jobs)} requests in {elapsed:.2f} s, API calls {sum(v for k, v in stats['calls'].items() if k != 'getMe')}, "
+          f"429 responses {stats['flood_errors']}, failed {sum(failures.values())}")
+    if limiter is not None:
+        print(f"limiter: {limiter.metrics()}")
+    for kind in ('result', 'message', 'menu'):
+        values = sorted(latencies[kind])
+        if values:
+            print(f"  {kind:8s} ok {len(values):6d} failed {failures[kind]:6d}  "
+                  f"p50 {statistics.median(values):9.1f} ms  p95 {values[int(len(values) * 0.95) - 1]:9.1f} ms")
+        else:
+            print(f"  {kind:8s} ok      0 failed {failures[kind]:6d}")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, default=200)
+    parser.add_argument('--edits', type=int, default=5, help="每个聊天连续编辑同一条消息的次数")
+    parser.add_argument('--sends', type=int, default=2, help="每个聊天的普通消息数")
+    parser.add_argument('--latency', type=float, default=20, help="假 Bot API 每次调用的延迟（毫秒）")
+    parser.add_argument('--port', type=int, default=8082)
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.chats, args.edits, args.sends)
+    api = FakeBotApi(args.latency, flood=True)
+    runner = await serve(api, port=args.port)
+    try:
+        result = await run_once(api, args.port, jobs, None)
+        print_result("direct calls", jobs, *result, None)
+        limiter = FloodControlRateLimiter()
+        result = await run_once(api, args.port, jobs, limiter)
+        print_result("FloodControlRateLimiter", jobs, *result, limiter)
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+# 对比原来逐位写 Cell 的 payload 构造（参照实现 legacy_* 在 tests/test_payloads.py）和 payloads.py 的模板 + 缓存：
+# 每次不同金额（缓存不命中，走模板路径）、重复金额（缓存命中）、常量 payload 的构造和序列化。
+# 逐字节一致性由 tests/test_payloads.py 检查
+#
+# 用法：python benchmarks/bench_payloads.py --iterations 20000
+import argparse
+import os
+import random
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+sys.path.insert(0, os.path.join(PROJECT_DIR, 'tests'))
+
+import payloads
+from test_payloads import (
+    legacy_buy_payload, legacy_deposit_payload, legacy_sell_payload, legacy_withdraw_payload, random_address, random_ton,
+)
+from ton_interaction import (
+    DEPOSIT_DICE_PAYLOAD, TRADE_AMOUNT, create_buy_payload, create_deposit_payload, create_sell_payload,
+    create_withdraw_payload,
+)
+
+def timed(title, function, inputs):
+    started = time.perf_counter()
+    for args in inputs:
+        function(*args)
+    elapsed = time.perf_counter() - started
+    print(f"  {title:34s} {elapsed * 1e6 / len(inputs):8.2f} us/call")
+    return elapsed
+
+def clear_caches():
+    for function in (payloads.nano, payloads.address_bits, payloads.buy, payloads.sell, payloads.deposit,
+                     payloads.withdraw, payloads.boc):
+        function.cache_clear()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    n = args.iterations
+    unique_ton = [(random_ton(rng),) for _ in range(n)]
+    repeated_ton = [(1.234567,)] * n
+    sells = [(TRADE_AMOUNT, ton) for (ton,) in unique_ton]
+    recipients = [(TRADE_AMOUNT, random_address(rng)) for _ in range(n)]
+    constant = [(TRADE_AMOUNT,)] * n
+
+    clear_caches()
+    print("buy, distinct amounts (cache misses):")
+    timed("legacy", legacy_buy_payload, unique_ton)
+    timed("template", create_buy_payload, unique_ton)
+    print("buy, repeated quote (cache hits):")
+    timed("legacy", legacy_buy_payload, repeated_ton)
+    timed("cached", create_buy_payload, repeated_ton)
+    clear_caches()
+    print("sell, distinct amounts:")
+    timed("legacy", legacy_sell_payload, sells)
+    timed("template", create_sell_payload, sells)
+    clear_caches()
+    print("withdraw to distinct recipients:")
+    timed("legacy", legacy_withdraw_payload, recipients)
+    timed("template", create_withdraw_payload, recipients)
+    print("constant deposit payload + BOC:")
+    timed("legacy build + to_boc", lambda amount: legacy_deposit_payload(amount).to_boc(False), constant)
+    timed("precomputed + cached boc", lambda amount: payloads.boc(DEPOSIT_DICE_PAYLOAD), constant)
+
+if __name__ == "__main__":
+    main()
+
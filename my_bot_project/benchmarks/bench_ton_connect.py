@@ -0,0 +1,99 @@
+# 用 fake_bridge 测试 ton_connect.BridgeListener：
+#   - 打开 --sessions 个待连接会话，全部共用一条 SSE 订阅
+#   - 假钱包分批批准，统计从钱包发出消息到 on_connect 回调的延迟，以及 bridge 上的订阅次数
+#   - 一部分会话被钱包拒绝，检查 on_reject；剩下的等待过期，检查 expire()
+#
+# 用法：python benchmarks/bench_ton_connect.py --sessions 500
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+from tonsdk.utils import Address
+
+import fake_bridge
+from ton_connect import BridgeListener
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--wave', type=int, default=50, help="每批同时批准的钱包数")
+    parser.add_argument('--port', type=int, default=8084)
+    args = parser.parse_args()
+
+    bridge, runner = await fake_bridge.start(args.port, heartbeat=1)
+    bridge_url = f"http://127.0.0.1:{args.port}/bridge"
+    listener = BridgeListener(bridge_url=bridge_url, ttl=3, reconnect_delay=0.1)
+
+    sent_at = {}
+    latencies = []
+    approved = {}
+    rejected = set()
+    done = asyncio.Event()
+
+    async def on_connect(bot, session, address):
+        latencies.append(time.perf_counter() - sent_at[session.client_id])
+        approved[session.telegram_id] = address
+        if len(approved) + len(rejected) >= expected:
+            done.set()
+
+    async def on_reject(bot, session):
+        rejected.add(session.telegram_id)
+        if len(approved) + len(rejected) >= expected:
+            done.set()
+
+    listener.on_connect = on_connect
+    listener.on_reject = on_reject
+
+    sessions = [listener.open(telegram_id, telegram_id, telegram_id) for telegram_id in range(1, args.sessions + 1)]
+    assert listener.open(1, 1, 1) is sessions[0], "re-opening within ttl should reuse the session"
+    await asyncio.sleep(0.2)
+
+    # 90% 批准，5% 拒绝，剩下的过期
+    approve = sessions[:args.sessions * 9 // 10]
+    reject = sessions[len(approve):len(approve) + args.sessions // 20]
+    expire = sessions[len(approve) + len(reject):]
+    expected = len(approve) + len(reject)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as http:
+        for start in range(0, len(approve), args.wave):
+            wave = []
+            for session in approve[start:start + args.wave]:
+                sent_at[session.client_id] = time.perf_counter()
+                wallet = fake_bridge.FakeWallet()
+                address = f"0:{session.telegram_id:064x}"
+                wave.append(wallet.send(http, bridge_url, wallet.connect_message(session.client_id, address)))
+            await asyncio.gather(*wave)
+        await asyncio.gather(*[
+            wallet.send(http, bridge_url, wallet.reject_message(session.client_id))
+            for wallet, session in ((fake_bridge.FakeWallet(), session) for session in reject)
+        ])
+    await asyncio.wait_for(done.wait(), 30)
+    elapsed = time.perf_counter() - started
+
+    # tonconnect 返回 user-friendly 格式的地址，换回 raw 格式比较
+    assert all(Address(approved[session.telegram_id]).to_string(False) == f"0:{session.telegram_id:064x}" for session in approve)
+    assert rejected == {session.telegram_id for session in reject}
+    latencies.sort()
+    print(f"{len(approve)} approvals + {len(reject)} rejections handled in {elapsed:.2f} s")
+    print(f"approval latency p50 {statistics.median(latencies) * 1000:.1f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms")
+    print(f"bridge {bridge.stats()}  listener {listener.metrics()}")
+
+    await asyncio.sleep(listener.ttl)
+    expired = listener.expire()
+    assert {session.telegram_id for session in expired} == {session.telegram_id for session in expire}
+    await asyncio.sleep(0.2)
+    print(f"expired {len(expired)} sessions, bridge {bridge.stats()}  listener {listener.metrics()}")
+
+    await listener.shutdown()
+    await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+# 对比读取汇率 + 池子信息的几种方式（假 Toncenter，见 fake_toncenter.py）：
+#   - 每次调用新建 HTTP 会话、两个方法分开请求（原来的做法）
+#   - 共享会话（连接保持），两个方法分开请求
+#   - 共享会话，两个方法放在一个批量请求里
+# 然后在一定比例的 429/503 下检查重试后所有调用都能成功，并打印客户端统计。
+#
+# 用法：python benchmarks/bench_toncenter.py --reads 200 --latency 30
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_toncenter import EXCHANGE_RATE, FakeToncenter, serve
+from toncenter import ToncenterClient
+
+ADDRESS = 'EQ...'
+METHODS = ['get_pool_info', 'get_exchange_rate']
+
+async def read_unpooled(endpoint):
+    client = ToncenterClient(endpoint, api_key=None)
+    try:
+        return [await client.run_get_method(ADDRESS, method) for method in METHODS]
+    finally:
+        await client.close()
+
+async def run(title, api, reads, concurrency, read):
+    api.reset()
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            pool_info, exchange_rate = await read()
+            assert exchange_rate[0] == EXCHANGE_RATE, exchange_rate
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(reads)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    stats = api.stats()
+    print(f"{title:28s} {reads / elapsed:8.1f} reads/s  p50 {statistics.median(latencies):7.1f} ms  "
+          f"p99 {latencies[int(len(latencies) * 0.99) - 1]:7.1f} ms  "
+          f"HTTP requests {stats['http_requests']:5d}  connections {stats['connections']:4d}")
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--reads', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=30, help="假 Toncenter 每次请求的延迟（毫秒）")
+    parser.add_argument('--failure-rate', type=float, default=0.2, help="重试测试时返回 429/503 的比例")
+    parser.add_argument('--port', type=int, default=8083)
+    args = parser.parse_args()
+
+    endpoint = f'http://127.0.0.1:{args.port}/api/v2/jsonRPC'
+    api = FakeToncenter(args.latency)
+    runner = await serve(api, port=args.port)
+    try:
+        await run("new session per read", api, args.reads, args.concurrency, lambda: read_unpooled(endpoint))
+
+        client = ToncenterClient(endpoint, api_key=None)
+        await run("pooled, separate calls", api, args.reads, args.concurrency,
+                  lambda: asyncio.gather(*(client.run_get_method(ADDRESS, method) for method in METHODS)))
+        await run("pooled, batched", api, args.reads, args.concurrency,
+                  lambda: client.run_get_methods(ADDRESS, METHODS))
+        await client.close()
+
+        api.failure_rate = args.failure_rate
+        client = ToncenterClient(endpoint, api_key=None, max_retries=8, retry_base=0.05)
+        await run(f"batched, {args.failure_rate:.0%} failures", api, args.reads, args.concurrency,
+                  lambda: client.run_get_methods(ADDRESS, METHODS))
+        print(f"server failures {api.failures}, client metrics {client.metrics()}")
+        await client.close()
+    finally:
+        await runner.cleanup()
+
+if __name__ == "__main__":
+    asyncio.run(main())
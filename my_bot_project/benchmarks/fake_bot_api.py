@@ -0,0 +1,203 @@
+# 本地的假 Telegram Bot API，用于压测：
+#   - getUpdates 从预先加载的 update 列表里分发（支持 offset 和长轮询）
+#   - sendMessage / editMessageText / sendPhoto / sendDice 等返回构造的 Message，并按方法计数
+#   - 可以给每次调用加固定延迟，模拟到 Telegram 的网络耗时
+#   - --flood 时模拟 Telegram 的发送频率限制（全局每秒条数、每个聊天每秒条数和突发条数），超出时返回 429
+#
+# 单独运行：python benchmarks/fake_bot_api.py --port 8081 --latency 20 --flood
+# 然后让机器人使用 BOT_API_BASE_URL=http://127.0.0.1:8081/bot
+# 控制接口：POST /__load（update JSON 数组）、POST /__reset、GET /__stats
+import argparse
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot',
+            'can_join_groups': True, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+MESSAGE_METHODS = {'sendMessage', 'sendPhoto', 'sendDice', 'editMessageText', 'editMessageReplyMarkup', 'editMessageCaption'}
+
+class Bucket:
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self):
+        # 有令牌时返回 0，否则返回需要等待的秒数
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class FakeBotApi:
+
+    def __init__(self, latency_ms=0, flood=False, global_rate=30, chat_rate=1, chat_burst=3):
+        self.latency = latency_ms / 1000
+        self.flood = flood
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.reset()
+
+    def reset(self):
+        self.updates = []
+        self.calls = Counter()
+        self.chats = Counter()
+        self.flood_errors = 0
+        self._global_bucket = Bucket(self.global_rate, self.global_rate)
+        self._chat_buckets = {}
+        self.sent_at = []  # (发送时间, 方法, chat_id, text)
+        self.message_id = 0
+        self.first_update_at = None
+        self.last_call_at = None
+        self._new_updates = asyncio.Event()
+
+    def load(self, updates):
+        self.updates.extend(updates)
+        self._new_updates.set()
+
+    def stats(self):
+        return {
+            'calls': dict(self.calls),
+            'pending_updates': len(self.updates),
+            'chats': len(self.chats),
+            'flood_errors': self.flood_errors,
+            'first_update_at': self.first_update_at,
+            'last_call_at': self.last_call_at,
+        }
+
+    def make_app(self):
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post('/__load', self.handle_load)
+        app.router.add_post('/__reset', self.handle_reset)
+        app.router.add_get('/__stats', self.handle_stats)
+        app.router.add_route('*', '/bot{token}/{method}', self.handle_method)
+        return app
+
+    async def handle_load(self, request):
+        self.load(await request.json())
+        return web.json_response({'ok': True})
+
+    async def handle_reset(self, request):
+        self.reset()
+        return web.json_response({'ok': True})
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats())
+
+    async def _params(self, request):
+        if request.content_type == 'application/json':
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            params[key] = value if isinstance(value, str) else '<file>'
+        return params
+
+    async def handle_method(self, request):
+        method = request.match_info['method']
+        params = await self._params(request)
+        if method == 'getUpdates':
+            result = await self.get_updates(params)
+        else:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            retry_after = self.check_flood(method, params)
+            if retry_after:
+                self.flood_errors += 1
+                return web.json_response({
+                    'ok': False, 'error_code': 429,
+                    'description': f'Too Many Requests: retry after {retry_after}',
+                    'parameters': {'retry_after': retry_after},
+                }, status=429)
+            result = self.call(method, params)
+        self.calls[method] += 1
+        self.last_call_at = time.time()
+        return web.json_response({'ok': True, 'result': result})
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        timeout = float(params.get('timeout') or 0)
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = self.updates[:limit]
+        if batch and self.first_update_at is None:
+            self.first_update_at = time.time()
+        return batch
+
+    def check_flood(self, method, params):
+        if not self.flood or method not in MESSAGE_METHODS:
+            return 0
+        chat_id = params.get('chat_id')
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = Bucket(self.chat_rate, self.chat_burst)
+        wait = max(bucket.take(), self._global_bucket.take())
+        return math.ceil(wait) if wait else 0
+
+    def call(self, method, params):
+        if method == 'getMe':
+            return BOT_USER
+        if method in MESSAGE_METHODS:
+            chat_id = int(params.get('chat_id') or 0)
+            self.chats[chat_id] += 1
+            self.sent_at.append((time.monotonic(), method, chat_id, params.get('text')))
+            if 'message_id' in params:
+                message_id = int(params['message_id'])
+            else:
+                self.message_id += 1
+                message_id = self.message_id
+            message = {
+                'message_id': message_id,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': 'private'},
+                'from': BOT_USER,
+            }
+            if 'text' in params:
+                message['text'] = params['text']
+            if method == 'sendDice':
+                message['dice'] = {'emoji': params.get('emoji', '🎲'), 'value': 1 + message_id % 6}
+            return message
+        # answerCallbackQuery、deleteWebhook、setWebhook 等
+        return True
+
+async def serve(api, host='127.0.0.1', port=8081):
+    runner = web.AppRunner(api.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+async def main():
+    parser = argparse.ArgumentParser(description="本地假 Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency', type=float, default=0, help="每次调用的延迟（毫秒）")
+    parser.add_argument('--updates', help="启动时加载的 update JSON 数组文件")
+    parser.add_argument('--flood', action='store_true', help="模拟 Telegram 的发送频率限制")
+    args = parser.parse_args()
+
+    api = FakeBotApi(args.latency, flood=args.flood)
+    if args.updates:
+        with open(args.updates, encoding='utf-8') as f:
+            api.load(json.load(f))
+    await serve(api, args.host, args.port)
+    print(f"Fake Bot API listening on http://{args.host}:{args.port}/bot<token>/")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
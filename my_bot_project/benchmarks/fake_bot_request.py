@@ -0,0 +1,45 @@
+# 进程内的假 Bot API 传输层（telegram.request.BaseRequest），压测时通过 build_application(request=...) 替换 HTTPX：
+#   - 不走网络，返回值由 fake_bot_api.FakeBotApi.call 构造，和假 HTTP Bot API 的行为一致
+#   - 可以给每次调用加固定延迟，模拟到 Telegram 的网络耗时
+#   - 按聊天记录发出的文本，压测脚本从里面读取机器人的回复（例如邀请链接）
+import asyncio
+import json
+from collections import defaultdict
+
+from telegram.request import BaseRequest
+
+from fake_bot_api import FakeBotApi
+
+class FakeBotRequest(BaseRequest):
+
+    def __init__(self, latency_ms=0):
+        self.latency = latency_ms / 1000
+        self.api = FakeBotApi()
+        self.texts = defaultdict(list)  # chat_id -> 发出的文本
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def reset(self):
+        self.api.reset()
+        self.texts.clear()
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data is not None else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.api.calls[api_method] += 1
+        result = self.api.call(api_method, params)
+        text = params.get('text') or params.get('caption')
+        if text and 'chat_id' in params:
+            self.texts[int(params['chat_id'])].append(text)
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
@@ -0,0 +1,143 @@
+# 本地的假 TON Connect bridge（HTTP bridge 协议的最小实现），用于测试 ton_connect.BridgeListener：
+#   - GET  /bridge/events?client_id=a,b,...&last_event_id=N：SSE 订阅，先补发 id > N 的消息，之后实时推送，定期发心跳
+#   - POST /bridge/message?client_id=<发送方>&to=<接收方>：body 是 base64 的加密消息，推送给订阅了 to 的连接
+#   - FakeWallet 模拟钱包：用自己的密钥对加密 connect / connect_error 事件发给会话
+#
+# 单独运行：python benchmarks/fake_bridge.py --port 8084
+# 然后让机器人使用 TON_CONNECT_BRIDGE_URL=http://127.0.0.1:8084/bridge
+# 控制接口：GET /__stats；POST /__approve?client_id=...&address=... 以一个新钱包批准连接
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+
+import aiohttp
+from aiohttp import web
+from nacl.public import Box, PrivateKey, PublicKey
+
+class FakeBridge:
+
+    def __init__(self, heartbeat=5):
+        self.heartbeat = heartbeat
+        self._ids = itertools.count(1)
+        self.messages = []  # (event_id, to, data)
+        self._streams = []  # (client_ids, queue)
+        self.subscriptions = 0
+
+    def stats(self):
+        return {
+            'subscriptions': self.subscriptions,
+            'open_streams': len(self._streams),
+            'messages': len(self.messages),
+        }
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_get('/__stats', self.handle_stats)
+        app.router.add_post('/__approve', self.handle_approve)
+        app.router.add_get('/bridge/events', self.handle_events)
+        app.router.add_post('/bridge/message', self.handle_message)
+        return app
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats())
+
+    async def handle_approve(self, request):
+        self.publish(*FakeWallet().connect_message(request.query['client_id'], request.query['address']))
+        return web.json_response({'ok': True})
+
+    async def handle_message(self, request):
+        body = await request.text()
+        self.publish(request.query['client_id'], request.query['to'], body)
+        return web.json_response({'message': 'OK', 'statusCode': 200})
+
+    def publish(self, sender, to, message):
+        # 和真实 bridge 一样，推送的数据里只有 from 和 message，不带 to
+        event_id = next(self._ids)
+        data = json.dumps({'from': sender, 'message': message})
+        self.messages.append((event_id, to, data))
+        for client_ids, queue in self._streams:
+            if to in client_ids:
+                queue.put_nowait((event_id, data))
+
+    async def handle_events(self, request):
+        client_ids = set(request.query.get('client_id', '').split(','))
+        last_event_id = int(request.query.get('last_event_id') or 0)
+        self.subscriptions += 1
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        queue = asyncio.Queue()
+        for event_id, to, data in self.messages:
+            if event_id > last_event_id and to in client_ids:
+                queue.put_nowait((event_id, data))
+        stream = (client_ids, queue)
+        self._streams.append(stream)
+        try:
+            while True:
+                try:
+                    event_id, data = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    await response.write(b'event: heartbeat\ndata: heartbeat\n\n')
+                    continue
+                await response.write(f'id: {event_id}\nevent: message\ndata: {data}\n\n'.encode())
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        finally:
+            self._streams.remove(stream)
+        return response
+
+# connect 事件里 ton_addr 项必须带 walletStateInit（tonconnect 会解码它），内容这里用不到
+WALLET_STATE_INIT = base64.b64encode(bytes(64)).decode()
+
+class FakeWallet:
+    # 一个钱包：自己的密钥对，公钥 hex 是它在 bridge 上的 client_id
+
+    def __init__(self):
+        self.private_key = PrivateKey.generate()
+        self.client_id = self.private_key.public_key.encode().hex()
+
+    def encrypt(self, to, event):
+        box = Box(self.private_key, PublicKey(bytes.fromhex(to)))
+        # Box.encrypt 的结果就是 nonce + 密文
+        return base64.b64encode(bytes(box.encrypt(json.dumps(event).encode()))).decode()
+
+    def connect_message(self, to, address):
+        event = {
+            'event': 'connect',
+            'id': 1,
+            'payload': {
+                'items': [{'name': 'ton_addr', 'address': address, 'network': '-239', 'walletStateInit': WALLET_STATE_INIT}],
+                'device': {'platform': 'iphone', 'appName': 'fake-wallet', 'appVersion': '1.0', 'maxProtocolVersion': 2},
+            },
+        }
+        return self.client_id, to, self.encrypt(to, event)
+
+    def reject_message(self, to):
+        event = {'event': 'connect_error', 'id': 1, 'payload': {'code': 300, 'message': 'User declined the connection'}}
+        return self.client_id, to, self.encrypt(to, event)
+
+    async def send(self, http, bridge_url, message):
+        sender, to, body = message
+        async with http.post(f"{bridge_url}/message", params={'client_id': sender, 'to': to, 'ttl': '300'},
+                             data=body) as response:
+            response.raise_for_status()
+
+async def start(port, heartbeat=5):
+    bridge = FakeBridge(heartbeat)
+    runner = web.AppRunner(bridge.make_app())
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+    return bridge, runner
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8084)
+    parser.add_argument('--heartbeat', type=float, default=5)
+    args = parser.parse_args()
+    await start(args.port, args.heartbeat)
+    print(f"fake TON Connect bridge on http://127.0.0.1:{args.port}/bridge")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,114 @@
+# 本地的假 Toncenter JSON-RPC（/api/v2/jsonRPC），用于测试 toncenter.py：
+#   - 支持单个请求和批量请求（JSON 数组）
+#   - runGetMethod：get_exchange_rate / get_pool_info 返回固定的栈，其它方法返回 exit_code 11
+#   - sendBoc：记录收到的 BOC
+#   - 可以给每次 HTTP 请求加固定延迟，按比例返回 429/503 模拟限流和故障
+#   - 统计 HTTP 请求数、JSON-RPC 调用数和 TCP 连接数（用来确认连接复用）
+#
+# 单独运行：python benchmarks/fake_toncenter.py --port 8083 --latency 50 --failure-rate 0.1
+# 然后让机器人使用 TONCENTER_ENDPOINT=http://127.0.0.1:8083/api/v2/jsonRPC
+# 控制接口：POST /__reset、GET /__stats
+import argparse
+import asyncio
+import random
+from collections import Counter
+
+from aiohttp import web
+
+EXCHANGE_RATE = 1_500_000_000  # 10,000 DICE 对应的 nanoTON
+POOL_INFO = [('num', hex(1_000_000_000_000)), ('num', hex(666_666_000_000_000)), ('num', hex(30))]
+
+class FakeToncenter:
+
+    def __init__(self, latency_ms=0, failure_rate=0.0, seed=0):
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.reset()
+
+    def reset(self):
+        self.http_requests = 0
+        self.calls = Counter()
+        self.failures = 0
+        self.connections = set()
+        self.bocs = []
+
+    def stats(self):
+        return {
+            'http_requests': self.http_requests,
+            'calls': dict(self.calls),
+            'failures': self.failures,
+            'connections': len(self.connections),
+            'bocs': len(self.bocs),
+        }
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post('/__reset', self.handle_reset)
+        app.router.add_get('/__stats', self.handle_stats)
+        app.router.add_post('/api/v2/jsonRPC', self.handle_rpc)
+        return app
+
+    async def handle_reset(self, request):
+        self.reset()
+        return web.json_response({'ok': True})
+
+    async def handle_stats(self, request):
+        return web.json_response(self.stats())
+
+    async def handle_rpc(self, request):
+        self.http_requests += 1
+        self.connections.add(request.transport.get_extra_info('peername'))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            self.failures += 1
+            status = self.random.choice((429, 503))
+            return web.json_response({'ok': False, 'code': status, 'error': 'Ratelimit exceed'}, status=status)
+        payload = await request.json()
+        if isinstance(payload, list):
+            return web.json_response([self.call(item) for item in payload])
+        return web.json_response(self.call(payload))
+
+    def call(self, request):
+        method = request.get('method')
+        params = request.get('params') or {}
+        self.calls[method] += 1
+        response = {'jsonrpc': '2.0', 'id': request.get('id')}
+        if method == 'runGetMethod':
+            stack = {
+                'get_exchange_rate': [('num', hex(EXCHANGE_RATE))],
+                'get_pool_info': POOL_INFO,
+            }.get(params.get('method'))
+            if stack is None:
+                response['result'] = {'@type': 'smc.runResult', 'gas_used': 0, 'stack': [], 'exit_code': 11}
+            else:
+                response['result'] = {'@type': 'smc.runResult', 'gas_used': 1000, 'stack': stack, 'exit_code': 0}
+        elif method == 'sendBoc':
+            self.bocs.append(params.get('boc'))
+            response['result'] = {'@type': 'ok'}
+        else:
+            response['error'] = {'code': -32601, 'message': f'Method not found: {method}'}
+        return response
+
+async def serve(api, host='127.0.0.1', port=8083):
+    runner = web.AppRunner(api.make_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+async def main():
+    parser = argparse.ArgumentParser(description="本地假 Toncenter JSON-RPC")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8083)
+    parser.add_argument('--latency', type=float, default=0, help="每次 HTTP 请求的延迟（毫秒）")
+    parser.add_argument('--failure-rate', type=float, default=0, help="返回 429/503 的比例")
+    args = parser.parse_args()
+
+    api = FakeToncenter(args.latency, args.failure_rate)
+    await serve(api, args.host, args.port)
+    print(f"Fake Toncenter listening on http://{args.host}:{args.port}/api/v2/jsonRPC")
+    await asyncio.Event().wait()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,81 @@
+# 本地的假 TON 打款通道，替换 withdrawals.HighloadWalletProvider 用于测试提现队列：
+#   - 每次 broadcast 相当于一条上链的外部消息：固定延迟（出块 + 确认），收取固定 gas + 每条转账的转发费
+#   - 和 highload 钱包一样按 query_id 防重放：同一个 query_id 最多执行一次，过期后不再执行
+#   - 可以按比例让广播失败；其中 landed_rate 比例的失败消息其实已经上链（例如 sendBoc 超时），
+#     用来检查重复广播、processed? 核对、失败退款之后没有重复打款
+#   - max_messages=1 时模拟原来每次提现单独发一条消息的做法
+import asyncio
+import itertools
+import math
+import random
+import time
+from collections import Counter
+
+from withdrawals import SignedBatch
+
+# 手续费估算（nanoTON）：每条外部消息的计算费用 + 每个转账的转发费用
+EXTERNAL_MESSAGE_FEE = 5_000_000
+PER_TRANSFER_FEE = 1_000_000
+
+class MockTonProvider:
+
+    def __init__(self, latency_ms=0, failure_rate=0.0, landed_rate=0.5, max_messages=254, timeout=1, seed=0):
+        self.latency = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.landed_rate = landed_rate
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self.settle_delay = 0
+        self.random = random.Random(seed)
+        self._lock = asyncio.Lock()  # 同一个钱包的外部消息依次发出
+        self._query_ids = itertools.count(1)
+        self.reset()
+
+    def reset(self):
+        self.batches = []  # (query_id, payouts)
+        self._signed = {}  # query_id -> payouts
+        self._processed = set()
+        self.failures = 0
+        self.fees = 0
+        self.paid = Counter()  # 收款地址 -> 收到的转账次数
+
+    def sign_batch(self, payouts):
+        if len(payouts) > self.max_messages:
+            raise ValueError(f"{len(payouts)} payouts exceed wallet limit {self.max_messages}")
+        query_id = next(self._query_ids)
+        self._signed[query_id] = payouts
+        # 和链上一样，过期时间取整秒
+        return SignedBatch(query_id, math.ceil(time.time() + self.timeout), b'')
+
+    def _execute(self, signed):
+        # 钱包合约：过期的拒绝，执行过的 query_id 直接忽略
+        if time.time() >= signed.expires_at or signed.query_id in self._processed:
+            return
+        self._processed.add(signed.query_id)
+        payouts = self._signed[signed.query_id]
+        self.batches.append((signed.query_id, payouts))
+        self.fees += EXTERNAL_MESSAGE_FEE + PER_TRANSFER_FEE * len(payouts)
+        for payout in payouts:
+            self.paid[payout.destination] += 1
+
+    async def broadcast(self, signed):
+        async with self._lock:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            if self.failure_rate and self.random.random() < self.failure_rate:
+                self.failures += 1
+                if self.random.random() < self.landed_rate:
+                    self._execute(signed)
+                raise ConnectionError("mock provider: sendBoc failed")
+            self._execute(signed)
+
+    async def processed(self, query_id):
+        return query_id in self._processed
+
+    def stats(self):
+        return {
+            'batches': len(self.batches),
+            'transfers': sum(len(payouts) for _, payouts in self.batches),
+            'failures': self.failures,
+            'fees_ton': self.fees / 1e9,
+        }
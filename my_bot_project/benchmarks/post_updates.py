@@ -0,0 +1,75 @@
+# 把录制好的 update JSON POST 到本地 webhook 服务，检查返回码并统计入队延迟
+#
+# 用法（先以 BOT_RUN_MODE=webhook、不设置 WEBHOOK_URL 启动 bot.py）：
+#   python benchmarks/post_updates.py updates.jsonl --repeat 100 --concurrency 40
+#
+# updates.jsonl 每行一个 Telegram update（getUpdates / webhook 收到的原始 JSON），
+# 也可以是一个包含 update 数组的 .json 文件。重复发送时会改写 update_id 避免被当成重复 update
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiohttp
+
+from config import WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET
+from webhook import SECRET_HEADER
+
+def load_updates(path):
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            data = json.load(f)
+            return data if isinstance(data, list) else [data]
+        return [json.loads(line) for line in f if line.strip()]
+
+async def main():
+    parser = argparse.ArgumentParser(description="向本地 webhook 回放录制的 update")
+    parser.add_argument('path', help="录制的 update（.jsonl 或 .json）")
+    parser.add_argument('--url', default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=40)
+    args = parser.parse_args()
+
+    updates = load_updates(args.path)
+    payloads = []
+    for round_no in range(args.repeat):
+        for update in updates:
+            update = dict(update, update_id=update.get('update_id', 0) + round_no * len(updates))
+            payloads.append(json.dumps(update))
+
+    headers = {'Content-Type': 'application/json'}
+    if WEBHOOK_SECRET:
+        headers[SECRET_HEADER] = WEBHOOK_SECRET
+    statuses = Counter()
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def post(session, body):
+        async with semaphore:
+            started = time.perf_counter()
+            async with session.post(args.url, data=body, headers=headers) as response:
+                await response.read()
+                statuses[response.status] += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(post(session, body) for body in payloads))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"sent {len(payloads)} updates in {elapsed:.2f}s ({len(payloads) / elapsed:.0f}/s)")
+    print(f"status codes: {dict(statuses)}")
+    print(f"latency p50 {statistics.median(latencies):.2f} ms, "
+          f"p99 {latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]:.2f} ms, "
+          f"max {latencies[-1]:.2f} ms")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,169 +1,61 @@
+import asyncio
+import calendar
 import logging
 import os
-import random
-import string
 import uuid
-from io import BytesIO
-from contextlib import contextmanager
+from datetime import datetime, timedelta
 
 import telegram
-import qrcode
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, func
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, filters
-
-from models import User, GameHistory, Transaction
-from ton_interaction import get_exchange_rate, deposit_ton, deposit_dice, withdraw_ton, withdraw_dice
-from locales import get_message
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes, MessageHandler, TypeHandler, filters
+from tonsdk.utils import Address
+
+from accruals import get_user_balance, fold_accruals_job
+from callback_router import CallbackRouter, log_callback_metrics_job
+from config import (
+    ACCRUAL_FOLD_INTERVAL, BOT_API_BASE_URL, BOT_RUN_MODE, DEPOSIT_INDEX_INTERVAL, OUTBOUND_GLOBAL_RATE,
+    PENDING_GAME_SWEEP_INTERVAL, RATE_PREFETCH_INTERVAL, TON_CONNECT_EXPIRE_INTERVAL, UPDATE_METRICS_INTERVAL,
+    WITHDRAW_CHECK_INTERVAL,
+)
+from database import (
+    get_user_by_id, update_user_wallet, get_user_by_invite_code, create_user,
+    get_user_game_history_page, get_user_pending_games,
+    get_user_completed_games, get_invited_users_page, get_inviter_stats, get_user_transactions, get_user_deposits, update_user_info,
+)
+from deposit_indexer import index_deposits_job
+from flood_control import FloodControlRateLimiter, PRIORITY_HIGH
+from media_cache import media_cache, render_qr_png
+from message_cache import edit_message_text
+from pending_games import pending_game_store, expire_pending_games_job
+from settlement import settle_game
+from update_processor import PerUserUpdateProcessor, log_update_metrics_job
+from user_context import bot_context_types, get_current_user, load_user_context
+from webhook import run_webhook
+from withdrawals import WITHDRAW_AMOUNT, flush_withdrawals_job, withdrawal_queue
+from rate_cache import prefetch_job
+from toncenter import toncenter, log_toncenter_metrics_job
+from ton_connect import bridge_listener, expire_connections_job
+from ton_interaction import TRADE_AMOUNT, get_exchange_rate, rate_caches, deposit_ton, deposit_dice, deposit_wallet
+from wallet_sender import WalletSendError
+from templates import templates
 
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-DB_URL = os.getenv('DB_URL')
 
 if not BOT_TOKEN:
     raise ValueError("在 .env 文件中未找到 BOT_TOKEN")
 
+# 邀约页面每页显示的被邀请人数量
+INVITEES_PAGE_SIZE = 20
+
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-engine = create_engine(DB_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-@contextmanager
-def get_db_session():
-    session = SessionLocal()
-    try:
-        yield session
-        session.commit()
-    except Exception:
-        session.rollback()
-        raise
-    finally:
-        session.close()
-
-def get_user_by_id(user_id):
-    with get_db_session() as session:
-        return session.query(User).filter(User.id == user_id).first()
-
-def update_user_wallet(user_id, wallet_address):
-    with get_db_session() as session:
-        user = session.query(User).filter(User.id == user_id).first()
-        if user:
-            user.wallet_address = wallet_address
-            session.commit()
-
-def get_user_by_telegram_id(telegram_id):
-    with get_db_session() as session:
-        return session.query(User).filter(User.telegram_id == telegram_id).first()
-
-def get_user_by_invite_code(invite_code):
-    with get_db_session() as session:
-        user = session.query(User).filter(func.upper(User.invite_code) == func.upper(invite_code)).first()
-        return user
-    
-def create_user(telegram_id, username, inviter_id=None):
-    with get_db_session() as session:
-        new_user = User(
-            telegram_id=telegram_id,
-            username=username,
-            inviter_id=inviter_id,
-            balance=1000
-        )
-        session.add(new_user)
-        session.commit()
-        return new_user
-
-def generate_invite_code(user_id):
-    invite_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
-    with get_db_session() as session:
-        user = session.query(User).filter(User.id == user_id).first()
-        if user:
-            user.invite_code = invite_code
-            session.commit()
-    return invite_code
-
-def update_user_balance(telegram_id, amount, is_invite_earning=False):
-    with get_db_session() as session:
-        user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if user:
-            user.balance += amount
-            if is_invite_earning:
-                user.invite_earnings = (user.invite_earnings or 0) + amount
-            session.commit()
-
-def add_game_history(game_id, player_a_id, player_b_id, bet_amount, player_a_score, player_b_score, winner_id, win_amount, status):
-    with get_db_session() as session:
-        new_game = GameHistory(
-            game_id=game_id,
-            player_a_id=player_a_id,
-            player_b_id=player_b_id,
-            bet_amount=bet_amount,
-            player_a_score=player_a_score,
-            player_b_score=player_b_score,
-            winner_id=winner_id,
-            win_amount=win_amount,
-            status=status
-        )
-        session.add(new_game)
-        session.commit()
-
-def get_user_game_history(user_id, status='completed', limit=5, offset=0):
-    with get_db_session() as session:
-        return session.query(GameHistory).filter(
-            ((GameHistory.player_a_id == user_id) | (GameHistory.player_b_id == user_id)) &
-            (GameHistory.status == status)
-        ).order_by(GameHistory.created_at.desc()).limit(limit).offset(offset).all()
-
-def get_invited_users(user_id):
-    with get_db_session() as session:
-        invited_users = session.query(User).filter(User.inviter_id == user_id).all()
-        return invited_users
-
-def calculate_invite_earnings(user_id):
-    with get_db_session() as session:
-        earnings = session.query(func.sum(GameHistory.win_amount * 0.07)).join(User, GameHistory.winner_id == User.id).filter(User.inviter_id == user_id).scalar() or 0
-        return earnings
-
-def get_wallet_address(user_id):
-    with get_db_session() as session:
-        user = session.query(User).filter(User.id == user_id).first()
-        return user.wallet_address if user else None
-    
-def update_user_info(telegram_id, username):
-    with get_db_session() as session:
-        user = session.query(User).filter(User.telegram_id == telegram_id).first()
-        if user:
-            user.username = username
-            user.updated_at = func.now()
-            session.commit()
-
 def create_main_menu():
-    keyboard = [
-        [InlineKeyboardButton("🎮 开始游戏", callback_data='start_game')],
-        [InlineKeyboardButton("📜 对战历史", callback_data='game_history')],
-        [InlineKeyboardButton("🔗 邀约收益", callback_data='invite_earnings')],
-        [InlineKeyboardButton("💰 游戏余额", callback_data='balance')],
-        [InlineKeyboardButton("💱 充值/提现", callback_data='deposit_withdraw')],  # 新的合并按钮
-        [InlineKeyboardButton("🔗 连接钱包", callback_data='connect_wallet')],
-        [InlineKeyboardButton("❓ 帮助中心", callback_data='help')]
-    ]
-    return InlineKeyboardMarkup(keyboard)
-
-def update_user_info(telegram_id, username):
-    with get_db_session() as session:
-        try:
-            user = session.query(User).filter(User.telegram_id == telegram_id).first()
-            if user:
-                user.username = username
-                user.updated_at = func.now()
-                session.commit()
-        except SQLAlchemyError as e:
-            logger.error(f"Error updating user info: {e}")
-            session.rollback()
+    # 启动时构建好的共享键盘，不再每次创建
+    return templates.keyboard('main_menu')
 
 def create_game_share_button(game_id, bot_username):
     return InlineKeyboardButton(
@@ -171,22 +63,13 @@ def create_game_share_button(game_id, bot_username):
         url=f"https://t.me/share/url?url=https://t.me/{bot_username}?start={game_id}&text=来和我一起玩游戏吧！"
     )
 
-def create_game_history_keyboard(has_more, page=0):
-    keyboard = []
-    if page > 0:
-        keyboard.append(InlineKeyboardButton("上一页", callback_data=f"history_prev_{page}"))
-    if has_more:
-        keyboard.append(InlineKeyboardButton("下一页", callback_data=f"history_next_{page}"))
-    keyboard.append(InlineKeyboardButton("刷新", callback_data=f"history_refresh_{page}"))
-    keyboard.append(InlineKeyboardButton("返回主菜单", callback_data="main_menu"))
-    return InlineKeyboardMarkup([keyboard])
-
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     args = context.args
     telegram_id = str(update.effective_user.id)
     username = update.effective_user.username or "Unknown"
-    update_user_info(telegram_id, username)
-    user = get_user_by_telegram_id(telegram_id)
+    user = await get_current_user(update, context)
+    if user and user.username != username:
+        await update_user_info(telegram_id, username)
     
     if args and args[0]:
         game_id = args[0]
@@ -201,7 +84,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             del context.user_data['pending_game_id']
         else:
             await update.message.reply_text(
-                f"欢迎回来,{user.username}！您的当前余额是：{user.balance} 游戏币。",
+                f"欢迎回来,{user.username}！您的当前余额是：{await get_user_balance(user)} 游戏币。",
                 reply_markup=create_main_menu()
             )
     else:
@@ -210,23 +93,21 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def join_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game_id: str) -> None:
-    user = get_user_by_telegram_id(str(update.effective_user.id))
-    game = context.bot_data.get('pending_games', {}).get(game_id)
+    user = await get_current_user(update, context)
+    # 占用对局并扣除下注金额（同一个事务完成）
+    game, reason = await pending_game_store.join(game_id, user)
     
-    if not game:
+    if reason == 'not_found':
         await update.message.reply_text("对不起，这个游戏已经结束或不存在。", reply_markup=create_main_menu())
         return
 
-    if user['balance'] < game['bet_amount']:
+    if reason == 'insufficient_balance':
         await update.message.reply_text("您的余额不足以加入这个游戏。", reply_markup=create_main_menu())
         return
 
-    # 立即扣除下注金额
-    update_user_balance(user['telegram_id'], -game['bet_amount'])
-
-    creator = get_user_by_id(game['creator_id'])
+    creator = await get_user_by_id(game['creator_id'])
     await update.message.reply_text(
-        f"您已成功加入 @{creator['username']} 发起的 {game['bet_amount']} 游戏币的对决，"
+        f"您已成功加入 @{creator.username} 发起的 {game['bet_amount']} 游戏币的对决，"
         f"他的成绩是 {game['creator_score']}。\n"
         f"请发送三次骰子表情来尝试大过他吧！"
     )
@@ -247,7 +128,7 @@ async def handle_invite_code(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     logger.info(f"Attempting to register user {telegram_id} with invite code {invite_code}")
 
-    inviter = get_user_by_invite_code(invite_code)
+    inviter = await get_user_by_invite_code(invite_code)
     
     if not inviter:
         logger.error(f"Invalid invite code: {invite_code}")
@@ -255,7 +136,7 @@ async def handle_invite_code(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     try:
-        new_user = create_user(telegram_id, username, inviter.id)
+        new_user = await create_user(telegram_id, username, inviter.id)
         if new_user:
             logger.info(f"User {telegram_id} registered successfully")
             welcome_message = f"注册成功！您已通过 @{inviter.username} 的邀请获得了1000游戏币。"
@@ -274,16 +155,15 @@ async def handle_invite_code(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 async def show_balance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    user = get_user_by_telegram_id(str(query.from_user.id))
+    user = await get_current_user(update, context)
     
     if user:
-        await query.edit_message_text(f"您当前的余额是：{user['balance']} 游戏币。", reply_markup=create_main_menu())
+        await edit_message_text(query, templates.render('balance_is', balance=await get_user_balance(user)), reply_markup=create_main_menu())
     else:
-        await query.edit_message_text("未找到您的账户信息，请先注册。", reply_markup=create_main_menu())
+        await edit_message_text(query, templates.render('not_registered'), reply_markup=create_main_menu())
 
 async def show_token_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
 
     contract_address = "EQA..."  # DICE 代币合约地址
     total_supply = 1_000_000_000  # 总供应量
@@ -300,165 +180,76 @@ async def show_token_info(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         f"3. 卖出：向合约发送 10,000 DICE\n"
     )
 
-    keyboard = [
-        [InlineKeyboardButton("返回主菜单", callback_data='main_menu')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-
-    await query.edit_message_text(info_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await edit_message_text(query, info_text, reply_markup=templates.keyboard('back_to_menu'), parse_mode='Markdown')
 
 import html
 import urllib.parse
 
 async def check_deposit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # 充值由后台索引器（deposit_indexer.py）入账，这里只查本地数据库里上次查询之后的新充值
     query = update.callback_query
-    await query.answer()
-    user = get_user_by_telegram_id(str(query.from_user.id))
-    
-    # 这里应该检查用户的充值状态
-    # 假设我们有一个函数来检查充值状态
-    deposit_status = await check_user_deposit_status(user['id'])
-    
-    if deposit_status['completed']:
-        await query.edit_message_text(f"充值已完成。您的新余额是: {user['balance'] + deposit_status['amount']} DICE")
-        update_user_balance(user['telegram_id'], deposit_status['amount'])
+    user = await get_current_user(update, context)
+
+    last_seen = context.user_data.get('last_deposit_id')
+    since = None if last_seen else datetime.now() - timedelta(days=1)
+    deposits = await get_user_deposits(user.id, after_id=last_seen or 0, since=since)
+
+    if deposits:
+        context.user_data['last_deposit_id'] = deposits[0].id
+        total = sum(deposit.amount for deposit in deposits)
+        new_balance = await get_user_balance(user)
+        await edit_message_text(query, f"充值已完成（+{total} DICE）。您的新余额是: {new_balance} DICE")
     else:
-        await query.edit_message_text("充值尚未完成,请稍后再查询。")
+        await edit_message_text(query, "充值尚未完成,请稍后再查询。")
 
 async def start_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     
-    await query.edit_message_text("请输入您要提现的金额(DICE):")
+    await edit_message_text(query, "请输入您要提现的金额(DICE):")
     context.user_data['awaiting_withdraw_amount'] = True
 
 async def show_game_rules(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    
-    rules_text = (
-        "游戏规则:\n"
-        "1. 每局游戏需要两名玩家参与\n"
-        "2. 每位玩家轮流投掷3次骰子\n"
-        "3. 总点数高的玩家获胜\n"
-        "4. 赢家获得奖池的90%\n"
-        "5. 项目方收取3%的手续费\n"
-        "6. 邀请人可获得7%的奖励"
-    )
     
-    await query.edit_message_text(rules_text, reply_markup=create_main_menu())
+    await edit_message_text(query, templates.render('game_rules'), reply_markup=create_main_menu())
 
 async def show_faq(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     
-    faq_text = (
-        "常见问题:\n"
-        "Q: 如何充值?\n"
-        "A: 在主菜单中选择'充值/提现'选项,然后选择充值方式。\n\n"
-        "Q: 如何邀请朋友?\n"
-        "A: 在主菜单中选择'邀约收益'选项,获取您的邀请码。\n\n"
-        "Q: 游戏币和 DICE 代币有什么区别?\n"
-        "A: 游戏币用于游戏内下注,DICE 代币可以在 TON 网络上交易。\n\n"
-        "Q: 如何提现?\n"
-        "A: 在主菜单中选择'充值/提现'选项,然后选择提现方式。"
-    )
-    
-    await query.edit_message_text(faq_text, reply_markup=create_main_menu())
+    await edit_message_text(query, templates.render('faq'), reply_markup=create_main_menu())
 
-async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    query = update.callback_query
-    await query.answer()
-    
-    if query.data == 'start_game':
-        await start_game(update, context)
-    elif query.data == 'game_history':
-        await show_game_history(update, context)
-    elif query.data == 'invite_earnings':
-        await show_invite_earnings(update, context)
-    elif query.data == 'balance':
-        await show_balance(update, context)
-    elif query.data == 'deposit_withdraw':
-        await show_deposit_withdraw_options(update, context)
-    elif query.data == 'game_rules':
-        await show_game_rules(update, context)
-    elif query.data == 'faq':
-        await show_faq(update, context)
-    elif query.data.startswith('confirm_'):
-        await confirm_transaction(update, context)
-    elif query.data == 'cancel_transaction':
-        await cancel_transaction(update, context)
-    elif query.data == 'connect_wallet':
-        await connect_wallet(update, context)
-
-    if query.data == 'start_game':
-        await start_game(update, context)
-    elif query.data == 'game_history':
-        await show_game_history(update, context)
-    elif query.data == 'invite_earnings':
-        await show_invite_earnings(update, context)
-    elif query.data == 'balance':
-        await show_balance(update, context)
-    elif query.data == 'deposit_withdraw':
-        await deposit_withdraw(update, context)
-    elif query.data == 'connect_wallet':
-        await connect_wallet(update, context)
-    elif query.data == 'help':
-        await show_help(update, context)
-    elif query.data == 'main_menu':
-        await show_menu(update, context)
-    elif query.data == 'deposit_ton':
-        await deposit_ton_handler(update, context)
-    elif query.data == 'deposit_dice':
-        await deposit_dice_handler(update, context)
-    elif query.data == 'withdraw_ton':
-        await withdraw_ton_handler(update, context)
-    elif query.data == 'withdraw_dice':
-        await withdraw_dice_handler(update, context)
-    elif query.data == 'token_info':
-        await show_token_info(update, context)
-    elif query.data == 'check_deposit':
-        await check_deposit(update, context)
-    elif query.data == 'start_withdraw':
-        await start_withdraw(update, context)
-    elif query.data == 'game_rules':
-        await show_game_rules(update, context)
-    elif query.data == 'faq':
-        await show_faq(update, context)
-    elif query.data == 'main_menu':
-        await show_menu(update, context)
-    elif query.data == 'cancel_game':
-        await cancel_game(update, context)
-    elif query.data.startswith('history_'):
-        _, action, page = query.data.split('_')
-        page = int(page)
-        if action == 'prev':
-            await show_game_history(update, context, page - 1)
-        elif action == 'next':
-            await show_game_history(update, context, page + 1)
-        elif action == 'refresh':
-            await show_game_history(update, context, page)
-    else:
-        await query.edit_message_text("未知的操作。", reply_markup=create_main_menu())
+async def unknown_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    await edit_message_text(update.callback_query, templates.render('unknown_action'), reply_markup=create_main_menu())
+
+async def show_history_page(update: Update, context: ContextTypes.DEFAULT_TYPE, args: str) -> None:
+    # history_{prev|next|refresh}_{page}_{cursor}
+    action, page, cursor = args.split('_', 2)
+    page = int(page)
+    if action == 'prev':
+        await show_game_history(update, context, max(page - 1, 0), cursor, 'prev', edit=True)
+    elif action == 'next':
+        await show_game_history(update, context, page + 1, cursor, 'next', edit=True)
+    elif action == 'refresh':
+        await show_game_history(update, context, page, cursor or None, 'refresh', edit=True)
+
+async def show_invitees_page(update: Update, context: ContextTypes.DEFAULT_TYPE, args: str) -> None:
+    # invitees_{page}_{cursor}
+    page, cursor = args.split('_', 1)
+    await show_invite_earnings(update, context, int(page), cursor)
 
 async def show_deposit_withdraw_options(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    keyboard = [
-        [InlineKeyboardButton("充值 TON", callback_data='deposit_ton'),
-         InlineKeyboardButton("充值 DICE", callback_data='deposit_dice')],
-        [InlineKeyboardButton("提现 TON", callback_data='withdraw_ton'),
-         InlineKeyboardButton("提现 DICE", callback_data='withdraw_dice')],
-        [InlineKeyboardButton("返回主菜单", callback_data='main_menu')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await update.callback_query.edit_message_text("请选择充值或提现方式:", reply_markup=reply_markup)
+    await edit_message_text(
+        update.callback_query,
+        templates.render('deposit_withdraw_prompt'),
+        reply_markup=templates.keyboard('deposit_withdraw_options'),
+    )
 
-async def show_game_history(update: Update, context: ContextTypes.DEFAULT_TYPE, page=0) -> None:
+async def show_game_history(update: Update, context: ContextTypes.DEFAULT_TYPE, page=0, cursor=None, direction='next', edit=False) -> None:
+    # edit=True（翻页、刷新）时直接修改当前的历史消息，内容没有变化时不发请求
     query = update.callback_query
-    if query:
-        await query.answer()
     
     user_id = update.effective_user.id
-    user = get_user_by_telegram_id(str(user_id))
+    user = await get_current_user(update, context)
     
     logger.info(f"Showing game history for user: {user_id}, page: {page}")
     
@@ -467,9 +258,19 @@ async def show_game_history(update: Update, context: ContextTypes.DEFAULT_TYPE,
         await update.effective_message.reply_text("请先注册后再查看游戏历史。", reply_markup=create_main_menu())
         return
 
-    pending_games = get_user_pending_games(user['id'])
-    completed_games = get_user_game_history(user['id'], status='completed', limit=5, offset=page*5)
-    has_more = len(get_user_game_history(user['id'], status='completed', limit=1, offset=(page+1)*5)) > 0
+    # 刷新按钮带的是本页第一条记录的游标，需要包含它本身
+    history_cursor = decode_cursor(cursor) if cursor else None
+    pending_games, (completed_games, has_more) = await asyncio.gather(
+        get_user_pending_games(user.id),
+        get_user_game_history_page(
+            user.id, status='completed', limit=5, cursor=history_cursor,
+            direction=direction, inclusive=direction == 'refresh',
+        ),
+    )
+    if direction == 'prev':
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = page > 0, has_more
     
     logger.info(f"Retrieved {len(completed_games)} completed games and {len(pending_games)} pending games for user: {user_id}")
     
@@ -479,14 +280,14 @@ async def show_game_history(update: Update, context: ContextTypes.DEFAULT_TYPE,
         return
 
     try:
-        # 待分享的对战消息
-        if pending_games:
+        # 待分享的对战消息（翻页、刷新时不重复发送）
+        if pending_games and not edit:
             pending_text = "🕒 待分享的对战：\n\n"
             pending_buttons = []
             for game in pending_games:
                 invite_message = create_invite_message(user, game, context)
-                invite_link = f"https://t.me/{context.bot.username}?start={game['game_id']}"
-                pending_text += f"下注金额: {game['bet_amount']} 游戏币\n"
+                invite_link = f"https://t.me/{context.bot.username}?start={game.game_id}"
+                pending_text += f"下注金额: {game.bet_amount} 游戏币\n"
                 pending_text += f"分享链接: {invite_link}\n\n"
                 escaped_message = urllib.parse.quote(invite_message)
                 pending_buttons.append([InlineKeyboardButton(
@@ -513,389 +314,350 @@ async def show_game_history(update: Update, context: ContextTypes.DEFAULT_TYPE,
         else:
             completed_text += "暂无已完成的对战\n"
 
-        history_keyboard = create_game_history_keyboard(has_more, page)
-        await update.effective_message.reply_text(completed_text, reply_markup=history_keyboard)
+        history_keyboard = create_game_history_keyboard(completed_games, has_prev, has_next, page)
+        if edit and query:
+            await edit_message_text(query, completed_text, reply_markup=history_keyboard)
+        else:
+            await update.effective_message.reply_text(completed_text, reply_markup=history_keyboard)
 
     except Exception as e:
         logger.error(f"Error in show_game_history: {e}")
         await update.effective_message.reply_text("获取游戏历史时出错，请稍后再试。", reply_markup=create_main_menu())
 
-def create_game_history_keyboard(has_more, page=0):
+def to_base36(number):
+    digits = '0123456789abcdefghijklmnopqrstuvwxyz'
+    encoded = ''
+    while True:
+        number, remainder = divmod(number, 36)
+        encoded = digits[remainder] + encoded
+        if number == 0:
+            return encoded
+
+def encode_cursor(created_at, row_id):
+    # 游标 = (created_at, id)，编码成紧凑的 36 进制串放进 callback_data（上限 64 字节）
+    micros = calendar.timegm(created_at.timetuple()) * 1_000_000 + created_at.microsecond
+    return f"{to_base36(micros)}.{to_base36(row_id)}"
+
+def decode_cursor(cursor):
+    micros, game_id = (int(part, 36) for part in cursor.split('.'))
+    return datetime(1970, 1, 1) + timedelta(microseconds=micros), game_id
+
+def create_game_history_keyboard(games, has_prev, has_next, page=0):
     keyboard = []
-    if page > 0:
-        keyboard.append(InlineKeyboardButton("上一页", callback_data=f"history_prev_{page}"))
-    if has_more:
-        keyboard.append(InlineKeyboardButton("下一页", callback_data=f"history_next_{page}"))
-    keyboard.append(InlineKeyboardButton("刷新", callback_data=f"history_refresh_{page}"))
+    if games and has_prev:
+        keyboard.append(InlineKeyboardButton("上一页", callback_data=f"history_prev_{page}_{encode_cursor(games[0]['created_at'], games[0]['id'])}"))
+    if games and has_next:
+        keyboard.append(InlineKeyboardButton("下一页", callback_data=f"history_next_{page}_{encode_cursor(games[-1]['created_at'], games[-1]['id'])}"))
+    refresh_cursor = encode_cursor(games[0]['created_at'], games[0]['id']) if games and page > 0 else ''
+    keyboard.append(InlineKeyboardButton("刷新", callback_data=f"history_refresh_{page}_{refresh_cursor}"))
     keyboard.append(InlineKeyboardButton("返回主菜单", callback_data="main_menu"))
     return InlineKeyboardMarkup([keyboard])
 
 def create_invite_message(user, game, context):
-    invite_link = f"https://t.me/{context.bot.username}?start={game['game_id']}"
+    # 纯文本：只会被 URL 编码进分享链接，不经过 HTML/Markdown 解析，不能做 HTML 转义
+    invite_link = f"https://t.me/{context.bot.username}?start={game.game_id}"
     return (
-        f"@{html.escape(user['username'] or 'Unknown')} 发起了一个{game['bet_amount']}游戏币的挑战！\n"
+        f"@{user.username or 'Unknown'} 发起了一个{game.bet_amount}游戏币的挑战！\n"
         f"点击链接加入游戏：{invite_link}\n\n"
-        f"快使用我的邀请码 {html.escape(user['invite_code'] or 'Unknown')} 获取1000代币空投！！"
+        f"快使用我的邀请码 {user.invite_code or 'Unknown'} 获取1000代币空投！！"
     )
 
 async def show_pending_games(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    user_id = query.from_user.id
-    user = get_user_by_telegram_id(str(user_id))
+    user = await get_current_user(update, context)
     
-    pending_games = get_user_pending_games(user['id'])
+    pending_games = await get_user_pending_games(user.id)
     
     if not pending_games:
-        await query.edit_message_text("您没有等待挑战的游戏。", reply_markup=create_main_menu())
+        await edit_message_text(query, "您没有等待挑战的游戏。", reply_markup=create_main_menu())
         return
-    if query.message.text != history_text:
-        await query.edit_message_text(history_text, reply_markup=create_main_menu())
-    else:
-        await query.answer("游戏历史没有变化")
-    history_text = "您的游戏历史：\n\n"
     message = "您的等待挑战游戏：\n\n"
     for game in pending_games:
-        message += f"🕒 下注金额: {game['bet_amount']} 游戏币\n"
-        message += f"   创建时间: {game['created_at']}\n"
-        message += f"   邀请链接: https://t.me/{context.bot.username}?start={game['game_id']}\n"
-        message += f"   [点击转发](tg://msg_url?url=https://t.me/{context.bot.username}?start={game['game_id']}&text={create_invite_message(user, game)})\n\n"
-
-    keyboard = [
-        [InlineKeyboardButton("返回", callback_data='game_history')],
-        [InlineKeyboardButton("返回主菜单", callback_data='main_menu')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        message += f"🕒 下注金额: {game.bet_amount} 游戏币\n"
+        message += f"   创建时间: {game.created_at}\n"
+        message += f"   邀请链接: https://t.me/{context.bot.username}?start={game.game_id}\n"
+        invite_message = urllib.parse.quote(create_invite_message(user, game, context))
+        message += f"   [点击转发](tg://msg_url?url=https://t.me/{context.bot.username}?start={game.game_id}&text={invite_message})\n\n"
+
+    reply_markup = templates.keyboard('back_to_history')
 
-    await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown', disable_web_page_preview=True)
+    await edit_message_text(query, message, reply_markup=reply_markup, parse_mode='Markdown', disable_web_page_preview=True)
 
 async def connect_wallet(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    query = update.callback_query
-    await query.answer()
-    
-    connection_id = str(uuid.uuid4())
-    connect_url = f"https://app.tonkeeper.com/ton-connect?id={connection_id}"
-    
-    qr = qrcode.make(connect_url)
-    qr_io = BytesIO()
-    qr.save(qr_io, 'PNG')
-    qr_io.seek(0)
-    
-    keyboard = [
-        [InlineKeyboardButton("我已完成连接", callback_data=f'check_wallet_{connection_id}')],
-        [InlineKeyboardButton("取消", callback_data='cancel_wallet_connection')]
-    ]
+    # 钱包批准后由 bridge_listener 推送结果，不需要用户再点按钮；有效期内重复点击复用同一个会话，二维码只渲染、上传一次
+    user = await get_current_user(update, context)
+    session = bridge_listener.open(update.effective_user.id, user.id, update.effective_chat.id)
+    connect_url = session.universal_link()
+
+    keyboard = [[InlineKeyboardButton("取消", callback_data='cancel_wallet_connection')]]
     reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await context.bot.send_photo(
-        chat_id=update.effective_chat.id,
-        photo=qr_io,
-        caption="请使用TON钱包扫描此QR码来连接您的钱包。完成后点击下方按钮。",
+
+    message = await media_cache.send_photo(
+        context.bot,
+        update.effective_chat.id,
+        f'qr:{connect_url}',
+        render_qr_png,
+        connect_url,
+        caption="请使用TON钱包扫描此QR码来连接您的钱包，钱包确认后会自动完成。",
         reply_markup=reply_markup
     )
+    session.message_id = message.message_id
 
-async def check_wallet_connection(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def cancel_wallet_connection(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
-    
-    connection_id = query.data.split('_')[-1]
-    
-    try:
-        wallet_address = await get_wallet_address(connection_id)  # 这个函数需要实现
-        if wallet_address:
-            user = get_user_by_telegram_id(str(query.from_user.id))
-            update_user_wallet(user['id'], wallet_address)
-            await query.edit_message_text(f"钱包连接成功! 地址: {wallet_address[:6]}...{wallet_address[-4:]}")
-        else:
-            await query.edit_message_text("钱包连接失败,请重试。", reply_markup=create_main_menu())
-    except Exception as e:
-        logger.error(f"Wallet connection error: {e}")
-        await query.edit_message_text("连接过程中发生错误,请重试或联系客服。", reply_markup=create_main_menu())
-
-async def wallet_connected(update: Update, context: ContextTypes.DEFAULT_TYPE, wallet_address: str):
-    user = get_user_by_telegram_id(str(update.effective_user.id))
-    
-    # 更新用户的钱包地址
-    update_user_wallet(user['id'], wallet_address)
-    
+    bridge_listener.close(update.effective_user.id)
+    await query.delete_message()
     await context.bot.send_message(
         chat_id=update.effective_chat.id,
-        text=f"钱包连接成功! 地址: {wallet_address[:6]}...{wallet_address[-4:]}"
+        text=templates.render('choose_action'),
+        reply_markup=create_main_menu()
+    )
+
+async def wallet_connected(bot, session, wallet_address):
+    # bridge_listener 收到钱包的 connect 事件后调用；二维码消息是图片，只能编辑 caption
+    wallet_address = Address(wallet_address).to_string(True, True, False)
+    await update_user_wallet(session.user_id, wallet_address)
+    await bot.edit_message_caption(
+        chat_id=session.chat_id,
+        message_id=session.message_id,
+        caption=f"钱包连接成功! 地址: {wallet_address[:6]}...{wallet_address[-4:]}",
+        reply_markup=create_main_menu(),
+    )
+
+async def wallet_rejected(bot, session):
+    await bot.edit_message_caption(
+        chat_id=session.chat_id,
+        message_id=session.message_id,
+        caption="钱包拒绝了连接请求，请重试。",
+        reply_markup=create_main_menu(),
     )
 
 async def deposit_ton_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     exchange_rate = await get_exchange_rate()
     ton_amount = exchange_rate / 1e9
-    await update.callback_query.edit_message_text(
-        f"您将使用 {ton_amount:.6f} TON 购买 10,000 DICE。请确认交易。",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("确认", callback_data='confirm_deposit_ton'),
-            InlineKeyboardButton("取消", callback_data='cancel_transaction')
-        ]])
+    await edit_message_text(
+        update.callback_query,
+        templates.render('confirm_deposit_ton', ton_amount=ton_amount),
+        reply_markup=templates.keyboard('confirm_deposit_ton'),
     )
 
 async def deposit_dice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.edit_message_text(
-        "您将存入 10,000 DICE。请确认交易。",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("确认", callback_data='confirm_deposit_dice'),
-            InlineKeyboardButton("取消", callback_data='cancel_transaction')
-        ]])
+    await edit_message_text(
+        update.callback_query,
+        templates.render('confirm_deposit_dice'),
+        reply_markup=templates.keyboard('confirm_deposit_dice'),
     )
 
 async def withdraw_ton_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     exchange_rate = await get_exchange_rate()
     ton_amount = exchange_rate / 1e9
-    await update.callback_query.edit_message_text(
-        f"您将出售 10,000 DICE 以获得 {ton_amount:.6f} TON。请确认交易。",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("确认", callback_data='confirm_withdraw_ton'),
-            InlineKeyboardButton("取消", callback_data='cancel_transaction')
-        ]])
+    await edit_message_text(
+        update.callback_query,
+        templates.render('confirm_withdraw_ton', ton_amount=ton_amount),
+        reply_markup=templates.keyboard('confirm_withdraw_ton'),
     )
 
 async def withdraw_dice_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.edit_message_text(
-        "您将提取 10,000 DICE。请确认交易。",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton("确认", callback_data='confirm_withdraw_dice'),
-            InlineKeyboardButton("取消", callback_data='cancel_transaction')
-        ]])
+    await edit_message_text(
+        update.callback_query,
+        templates.render('confirm_withdraw_dice'),
+        reply_markup=templates.keyboard('confirm_withdraw_dice'),
     )
 
-async def confirm_transaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def confirm_transaction(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
+    # action: deposit_ton / deposit_dice / withdraw_ton / withdraw_dice
     query = update.callback_query
-    action = query.data.split('_')[1:]
-    user = get_user_by_telegram_id(str(query.from_user.id))
+    direction, asset = action.split('_', 1)
+    user = await get_current_user(update, context)
     
+    if direction == 'withdraw':
+        await request_withdrawal(query, user, asset)
+        context.user_data.clear()
+        return
+
+    wallet = deposit_wallet()
+    if wallet is None:
+        await edit_message_text(query, "充值暂不可用，请联系客服。", reply_markup=create_main_menu())
+        context.user_data.clear()
+        return
     try:
-        if action[1] == 'deposit':
-            if action[2] == 'ton':
-                result = await deposit_ton(context.user_data['wallet'])
-                if result.success:
-                    update_user_balance(user['telegram_id'], result.amount)
-            else:
-                result = await deposit_dice(context.user_data['wallet'])
-                if result.success:
-                    update_user_balance(user['telegram_id'], result.amount)
-        else:  # withdraw
-            if action[2] == 'ton':
-                result = await withdraw_ton(context.user_data['wallet'])
-                if result.success:
-                    update_user_balance(user['telegram_id'], -result.amount)
-            else:
-                result = await withdraw_dice(context.user_data['wallet'])
-                if result.success:
-                    update_user_balance(user['telegram_id'], -result.amount)
-        
-        if result.success:
-            await query.edit_message_text(f"交易成功！您的新余额是: {user['balance']}")
-        else:
-            await query.edit_message_text("交易失败，请重试。")
+        expected_ton = await get_exchange_rate() / 1e9 if asset == 'ton' else None
     except Exception as e:
         logger.error(f"Transaction error: {e}")
-        await query.edit_message_text("交易过程中发生错误，请重试或联系客服。")
-    
-    # 清除用户数据
+        await edit_message_text(query, "交易过程中发生错误，请重试或联系客服。")
+        context.user_data.clear()
+        return
+    # 等待上链可能要几分钟（seqno 过期会重新签名），放到后台任务里，不占住这个用户后面的 update
+    await edit_message_text(query, "充值已提交，正在等待链上确认……")
+    context.application.create_task(send_deposit(query, wallet, asset, expected_ton), update=update)
     context.user_data.clear()
 
-async def check_user_deposit_status(user_id):
-    # 这里应该实现检查用户充值状态的逻辑
-    # 返回一个字典，包含 'completed' 和 'amount' 键
-    return {'completed': False, 'amount': 0}  # 示例返回值
+async def send_deposit(query, wallet, asset, expected_ton):
+    # 结果只有交易 hash；余额由充值索引器（deposit_indexer.py）在链上确认后入账，这里不加余额
+    try:
+        if asset == 'ton':
+            tx_hash = await deposit_ton(wallet, expected_ton)
+        else:
+            tx_hash = await deposit_dice(wallet)
+        text = f"交易已上链（{tx_hash}），确认后余额会自动更新。"
+    except WalletSendError as e:
+        logger.error(f"Deposit send failed: {e}")
+        text = "交易失败，请重试。"
+    except Exception as e:
+        logger.error(f"Transaction error: {e}", exc_info=True)
+        text = "交易过程中发生错误，请重试或联系客服。"
+    try:
+        await edit_message_text(query, text, reply_markup=create_main_menu())
+    except Exception as e:
+        logger.error(f"Could not report deposit result: {e}")
+
+async def request_withdrawal(query, user, asset):
+    # 提现不再直接上链：扣款后加入提现队列，由后台任务和其他提现一起批量打款
+    if not user.wallet_address:
+        await edit_message_text(query, "请先连接钱包后再提现。", reply_markup=create_main_menu())
+        return
+    try:
+        payout = await get_exchange_rate() if asset == 'ton' else TRADE_AMOUNT
+        new_balance = await withdrawal_queue.enqueue(user, asset, WITHDRAW_AMOUNT, payout)
+    except Exception as e:
+        logger.error(f"Withdrawal error: {e}")
+        await edit_message_text(query, "交易过程中发生错误，请重试或联系客服。")
+        return
+    if new_balance is None:
+        await edit_message_text(query, "余额不足，无法提现。", reply_markup=create_main_menu())
+    else:
+        await edit_message_text(query, f"提现申请已提交，将在几分钟内到账。您的新余额是: {new_balance}")
 
 async def show_transaction_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()
     
-    user = get_user_by_telegram_id(str(query.from_user.id))
+    user = await get_current_user(update, context)
     
-    with get_db_session() as session:
-        transactions = session.query(Transaction).filter_by(user_id=user.id).order_by(Transaction.created_at.desc()).limit(10).all()
+    transactions = await get_user_transactions(user.id, limit=10)
     
     if not transactions:
-        await query.edit_message_text("您还没有任何交易记录。", reply_markup=create_main_menu())
+        await edit_message_text(query, "您还没有任何交易记录。", reply_markup=create_main_menu())
         return
     
     message = "您的最近10笔交易记录:\n\n"
     for tx in transactions:
         message += f"{tx.created_at.strftime('%Y-%m-%d %H:%M')} - {tx.type.capitalize()} {tx.amount} DICE - {tx.status.capitalize()}\n"
     
-    await query.edit_message_text(message, reply_markup=create_main_menu())
+    await edit_message_text(query, message, reply_markup=create_main_menu())
 
 
 async def cancel_transaction(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.callback_query.edit_message_text("交易已取消。", reply_markup=create_main_menu())
+    await edit_message_text(update.callback_query, templates.render('transaction_cancelled'), reply_markup=create_main_menu())
     context.user_data.clear()
 
 async def show_completed_games(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    user_id = query.from_user.id
-    user = get_user_by_telegram_id(str(user_id))
+    user = await get_current_user(update, context)
     
-    completed_games = get_user_completed_games(user.id)
+    completed_games = await get_user_completed_games(user.id)
     
     if not completed_games:
-        await query.edit_message_text("您没有已完成的游戏记录。", reply_markup=create_main_menu())
+        await edit_message_text(query, "您没有已完成的游戏记录。", reply_markup=create_main_menu())
         return
 
     message = "您的游戏历史记录：\n\n"
     for game in completed_games:
-        opponent = game.player_b.username if game.player_a_id == user.id else game.player_a.username
-        user_score = game.player_a_score if game.player_a_id == user.id else game.player_b_score
-        opponent_score = game.player_b_score if game.player_a_id == user.id else game.player_a_score
-        result = "胜利" if game.winner_id == user.id else "失败"
+        opponent = game['player_b_username'] if game['player_a_id'] == user.id else game['player_a_username']
+        user_score = game['player_a_score'] if game['player_a_id'] == user.id else game['player_b_score']
+        opponent_score = game['player_b_score'] if game['player_a_id'] == user.id else game['player_a_score']
+        result = "胜利" if game['winner_id'] == user.id else "失败"
         
         message += f"🎮 对手: {opponent}\n"
-        message += f"   下注金额: {game.bet_amount} 游戏币\n"
+        message += f"   下注金额: {game['bet_amount']} 游戏币\n"
         message += f"   得分: {user_score} - {opponent_score}\n"
         message += f"   结果: {result}\n"
-        message += f"   时间: {game.created_at}\n\n"
-
-    keyboard = [
-        [InlineKeyboardButton("返回", callback_data='game_history')],
-        [InlineKeyboardButton("返回主菜单", callback_data='main_menu')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+        message += f"   时间: {game['created_at']}\n\n"
 
-    await query.edit_message_text(message, reply_markup=reply_markup)
+    reply_markup = templates.keyboard('back_to_history')
 
-def create_invite_message(user, game, context):
-    invite_link = f"https://t.me/{context.bot.username}?start={game['game_id']}"
-    return (
-        f"@{user['username'] or 'Unknown'} 发起了一个{game['bet_amount']}游戏币的挑战！\n"
-        f"点击链接加入游戏：{invite_link}\n\n"
-        f"快使用我的邀请码 {user['invite_code'] or 'Unknown'} 获取1000代币空投！！"
-    )
+    await edit_message_text(query, message, reply_markup=reply_markup)
 
-def get_user_pending_games(user_id):
-    with get_db_session() as session:
-        try:
-            pending_games = session.query(GameHistory).filter(
-                GameHistory.player_a_id == user_id,
-                GameHistory.player_b_id == None,
-                GameHistory.status == 'pending'
-            ).order_by(GameHistory.created_at.desc()).all()
-            return pending_games
-        except SQLAlchemyError as e:
-            logger.error(f"Error fetching user pending games: {e}")
-            return []
-
-def get_user_completed_games(user_id):
-    with get_db_session() as session:
-        try:
-            completed_games = session.query(GameHistory, User.username.label('player_a_username'), User.username.label('player_b_username')).join(
-                User, GameHistory.player_a_id == User.id, isouter=True
-            ).join(
-                User, GameHistory.player_b_id == User.id, isouter=True
-            ).filter(
-                ((GameHistory.player_a_id == user_id) | (GameHistory.player_b_id == user_id)) &
-                (GameHistory.status == 'completed')
-            ).order_by(GameHistory.created_at.desc()).limit(10).all()
-            return completed_games
-        except SQLAlchemyError as e:
-            logger.error(f"Error fetching user completed games: {e}")
-            return []
-
-async def show_invite_earnings(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def show_invite_earnings(update: Update, context: ContextTypes.DEFAULT_TYPE, page=0, cursor=None) -> None:
     query = update.callback_query
-    user = get_user_by_telegram_id(str(query.from_user.id))
+    user = await get_current_user(update, context)
     if user:
-        if user['invite_code']:
-            invite_code = user['invite_code']
-            invited_users = get_invited_users(user['id'])
-            
-            message = f"您的邀请码是: {invite_code}\n"
-            message += f"总邀约收益: {user.get('invite_earnings', 0)} 游戏币\n\n"  # 使用 get 方法，如果 'invite_earnings' 不存在，默认为 0
-            message += "已邀请用户:\n"
+        reply_markup = create_main_menu()
+        if user.invite_code:
+            # 汇总数据和当前页的被邀请人各一次查询，与邀请人数无关
+            (invitee_count, referral_earnings), (invited_users, has_more) = await asyncio.gather(
+                get_inviter_stats(user.id),
+                get_invited_users_page(user.id, limit=INVITEES_PAGE_SIZE, cursor=decode_cursor(cursor) if cursor else None),
+            )
+
+            message = f"您的邀请码是: {user.invite_code}\n"
+            message += f"总邀约收益: {referral_earnings} 游戏币\n"
+            message += f"已邀请用户 ({invitee_count} 人):\n"
             for invited_user in invited_users:
-                message += f"- {invited_user['username']}\n"
+                message += f"- {invited_user.username}\n"
+            if has_more:
+                last = invited_users[-1]
+                reply_markup = InlineKeyboardMarkup([
+                    [InlineKeyboardButton("更多", callback_data=f"invitees_{page + 1}_{encode_cursor(last.created_at, last.id)}")],
+                    [InlineKeyboardButton("返回主菜单", callback_data='main_menu')],
+                ])
         else:
             message = "您还没有邀请码。完成注册后即可获得专属邀请码。"
         
-        await query.edit_message_text(message, reply_markup=create_main_menu())
+        await edit_message_text(query, message, reply_markup=reply_markup)
     else:
-        await query.edit_message_text("未找到您的账户信息，请先注册。", reply_markup=create_main_menu())
+        await edit_message_text(query, templates.render('not_registered'), reply_markup=create_main_menu())
         
 async def deposit_withdraw(update: Update, context: ContextTypes.DEFAULT_TYPE):
     exchange_rate = await get_exchange_rate()  # 假设这个函数从智能合约获取当前汇率
     ton_amount = exchange_rate / 1e9  # 将nanotons转换为TON
     
-    keyboard = [
-        [InlineKeyboardButton(f"使用 TON 充值 ({ton_amount:.6f} TON)", callback_data='deposit_ton')],
-        [InlineKeyboardButton("使用 10,000 DICE 充值", callback_data='deposit_dice')],
-        [InlineKeyboardButton(f"提现为 TON ({ton_amount:.6f} TON)", callback_data='withdraw_ton')],
-        [InlineKeyboardButton("提现为 10,000 DICE", callback_data='withdraw_dice')],
-        [InlineKeyboardButton("返回主菜单", callback_data='main_menu')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await update.callback_query.edit_message_text("请选择充值或提现方式：", reply_markup=reply_markup)
+    await edit_message_text(
+        update.callback_query,
+        templates.render('deposit_withdraw_prompt'),
+        reply_markup=templates.keyboard('deposit_withdraw', ton_amount=ton_amount),
+    )
 
 async def show_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
-
-    help_text = (
-        "🎮 游戏规则：\n"
-        "1. 每局游戏需要两名玩家参与\n"
-        "2. 每位玩家轮流投掷3次骰子\n"
-        "3. 总点数高的玩家获胜\n"
-        "4. 赢家获得奖池的90%\n\n"
-        "💰 如何赚钱：\n"
-        "1. 参与游戏并获胜\n"
-        "2. 邀请好友注册，获得他们游戏收益的7%\n"
-        "3. 持有 DICE 代币，参与项目增值\n\n"
-        "如需更多帮助，请联系客服：@customer_service"
-    )
-
-    keyboard = [
-        [InlineKeyboardButton("返回主菜单", callback_data='main_menu')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
 
-    await query.edit_message_text(help_text, reply_markup=reply_markup)
+    await edit_message_text(query, templates.render('help'), reply_markup=templates.keyboard('back_to_menu'))
 
 async def start_game(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    user = get_user_by_telegram_id(str(query.from_user.id))
+    user = await get_current_user(update, context)
     
     if not user:
-        await query.edit_message_text("请先注册后再开始游戏。", reply_markup=create_main_menu())
+        await edit_message_text(query, templates.render('register_before_game'), reply_markup=create_main_menu())
         return
 
     context.user_data['game_state'] = 'awaiting_bet'
-    await query.edit_message_text(
-        f"您当前的余额是：{user['balance']} 游戏币。\n"
-        "请输入您要下注的金额（必须是100的倍数，最小100，最大1000）：",
-        reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("取消", callback_data='cancel_game')]])
+    await edit_message_text(
+        query,
+        templates.render('bet_prompt', balance=await get_user_balance(user)),
+        reply_markup=templates.keyboard('cancel_game'),
     )
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     try:
-        # 检查游戏状态
+        # 检查游戏状态；等待邀请码的新用户状态也是空闲，要先处理邀请码
         game_state = context.user_data.get('game_state', 'idle')
-        
-        if game_state == 'idle':
-            # 如果游戏状态是空闲，只显示主菜单
-            await update.message.reply_text("请选择一个操作：", reply_markup=create_main_menu())
-            return
-        
-        if 'awaiting_invite_code' in context.user_data and context.user_data['awaiting_invite_code']:
+
+        if context.user_data.get('awaiting_invite_code'):
             await handle_invite_code(update, context)
         elif game_state == 'awaiting_bet':
             await process_bet(update, context)
         else:
             # 如果不是以上任何状态，显示主菜单
-            await update.message.reply_text("请选择一个操作：", reply_markup=create_main_menu())
+            await update.message.reply_text(templates.render('choose_action'), reply_markup=create_main_menu())
     except Exception as e:
         logger.error(f"Error in handle_message: {e}", exc_info=True)
-        await update.message.reply_text("发生错误，请稍后重试或联系客服。", reply_markup=create_main_menu())
+        await update.message.reply_text(templates.render('error_retry'), reply_markup=create_main_menu())
         # 重置用户状态
         context.user_data.clear()
         context.user_data['game_state'] = 'idle'
 
 async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    user = get_user_by_telegram_id(str(update.message.from_user.id))
+    user = await get_current_user(update, context)
     try:
         bet_amount = int(update.message.text)
     except ValueError:
@@ -906,56 +668,35 @@ async def process_bet(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         await update.message.reply_text("下注金额必须是100的倍数，最小100，最大1000。请重新输入：")
         return
 
-    if user['balance'] < bet_amount:
+    # 扣除下注金额并写入 pending 对局（同一个事务完成）
+    game_id = str(uuid.uuid4())
+    if await pending_game_store.create(game_id, user, bet_amount) is None:
         await update.message.reply_text("余额不足，请重新输入较小的金额：")
         return
 
-    # 立即扣除下注金额
-    update_user_balance(user['telegram_id'], -bet_amount)
-
-    game_id = str(uuid.uuid4())
     context.user_data['game_id'] = game_id
     context.user_data['bet_amount'] = bet_amount
     context.user_data['dice_count'] = 0
     context.user_data['total_score'] = 0
     context.user_data['game_state'] = 'rolling_dice'
     
-    # 添加游戏历史记录，状态为 'pending'
-    add_game_history(game_id, user['id'], None, bet_amount, 0, 0, None, 0, 'pending')
-
-    if 'pending_games' not in context.bot_data:
-        context.bot_data['pending_games'] = {}
-    context.bot_data['pending_games'][game_id] = {
-        'game_id': game_id,
-        'bet_amount': bet_amount,
-        'creator_id': user['id'],
-        'creator_score': 0
-    }
-    
     await update.message.reply_text("请发送骰子表情来进行游戏。您需要发送3次骰子。")
 
 async def cancel_game(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
-    await query.answer()
 
-    user = get_user_by_telegram_id(str(query.from_user.id))
+    user = await get_current_user(update, context)
     game_id = context.user_data.get('game_id')
     
-    if game_id and game_id in context.bot_data.get('pending_games', {}):
-        game = context.bot_data['pending_games'][game_id]
-        bet_amount = game['bet_amount']
-        
-        # 退还下注金额
-        update_user_balance(user['telegram_id'], bet_amount)
-        
-        # 清理游戏数据
-        del context.bot_data['pending_games'][game_id]
+    if game_id:
+        # 退还下注金额并清理游戏数据
+        await pending_game_store.cancel(game_id, user)
 
     # 重置用户数据
     context.user_data.clear()
     context.user_data['game_state'] = 'idle'
 
-    await query.edit_message_text("游戏已取消，下注金额已退还。", reply_markup=create_main_menu())
+    await edit_message_text(query, "游戏已取消，下注金额已退还。", reply_markup=create_main_menu())
 
 
 async def handle_dice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -971,25 +712,25 @@ async def handle_dice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         context.user_data['dice_count'] = context.user_data.get('dice_count', 0) + 1
 
         if context.user_data['dice_count'] < 3:
-            await update.message.reply_text(f"您的第 {context.user_data['dice_count']} 次骰子点数为 {dice_value}。还需要再投 {3 - context.user_data['dice_count']} 次骰子。")
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id,
+                text=f"您的第 {context.user_data['dice_count']} 次骰子点数为 {dice_value}。还需要再投 {3 - context.user_data['dice_count']} 次骰子。",
+                rate_limit_args=PRIORITY_HIGH,
+            )
         else:
             game_id = context.user_data['game_id']
             total_score = context.user_data['total_score']
             bet_amount = context.user_data['bet_amount']
-            game = context.bot_data['pending_games'].get(game_id)
+            game = await pending_game_store.get(game_id)
             
-            user = get_user_by_telegram_id(str(update.effective_user.id))
+            user = await get_current_user(update, context)
             
-            if game and game['creator_id'] != user['id']:
+            if game and game['creator_id'] != user.id:
                 # 这是挑战者
                 await finish_game(update, context, game_id, total_score)
             else:
-                # 这是游戏创建者，生成邀请链接
-                context.bot_data['pending_games'][game_id] = {
-                    'bet_amount': bet_amount,
-                    'creator_id': user['id'],
-                    'creator_score': total_score
-                }
+                # 这是游戏创建者，记录得分并生成邀请链接
+                await pending_game_store.set_creator_score(game_id, total_score)
                 
                 invite_link = f"https://t.me/{context.bot.username}?start={game_id}"
                 
@@ -999,9 +740,9 @@ async def handle_dice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 )
 
                 invite_message = (
-                    f"@{user['username'] or 'Unknown'} 发起了一个{bet_amount}游戏币的挑战！\n"
+                    f"@{user.username or 'Unknown'} 发起了一个{bet_amount}游戏币的挑战！\n"
                     f"点击链接加入游戏：{invite_link}\n\n"
-                    f"快使用我的邀请码 {user['invite_code'] or 'Unknown'} 获取1000代币空投！！"
+                    f"快使用我的邀请码 {user.invite_code or 'Unknown'} 获取1000代币空投！！"
                 )
  
                 await update.message.reply_text(invite_message)
@@ -1014,150 +755,175 @@ async def handle_dice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
 
     except Exception as e:
         logger.error(f"Error in handle_dice: {e}", exc_info=True)
-        await update.message.reply_text("发生错误，请稍后重试或联系客服。", reply_markup=create_main_menu())
-        # 重置游戏状态
+        await update.message.reply_text(templates.render('error_retry'), reply_markup=create_main_menu())
+        # 重置游戏状态，未完成的对局由过期清理任务退款
         context.user_data.clear()
         context.user_data['game_state'] = 'idle'
-        if 'game_id' in context.user_data:
-            game_id = context.user_data['game_id']
-            if game_id in context.bot_data.get('pending_games', {}):
-                del context.bot_data['pending_games'][game_id]
                 
 async def finish_game(update: Update, context: ContextTypes.DEFAULT_TYPE, game_id: str, challenger_score: int):
-    game = context.bot_data['pending_games'].get(game_id)
+    # 创建者的得分以数据库为准，创建者可能由另一个 worker 进程处理
+    game = await pending_game_store.get(game_id, fresh=True)
     if not game:
         await update.message.reply_text("游戏已结束或不存在。", reply_markup=create_main_menu())
         return
 
-    creator = get_user_by_id(game['creator_id'])
-    challenger = get_user_by_telegram_id(str(update.effective_user.id))
-    
-    creator_score = game['creator_score']
-    bet_amount = game['bet_amount']
-
-    if challenger_score > creator_score:
-        winner = challenger
-        loser = creator
-    elif challenger_score < creator_score:
-        winner = creator
-        loser = challenger
-    else:
-        # 平局，退还下注金额
-        update_user_balance(creator['telegram_id'], bet_amount)
-        update_user_balance(challenger['telegram_id'], bet_amount)
-        tie_message = f"游戏结束！双方平局，各自的分数是 {challenger_score}。下注金额已退还。"
-        await update.message.reply_text(tie_message, reply_markup=create_main_menu())
-        await context.bot.send_message(
-            chat_id=creator['telegram_id'],
-            text=tie_message,
-            reply_markup=create_main_menu()
-        )
-        # 清理游戏数据
-        del context.bot_data['pending_games'][game_id]
-        context.user_data.clear()
-        return
-
-    # 计算赢家获得的奖金（下注金额的90%）
-    win_amount = bet_amount * 0.9
-
-    # 计算上级邀约者的7%收益
-    inviter_amount = bet_amount * 0.07
-
-    # 计算项目方的3%收益
-    project_amount = bet_amount * 0.03
-
-    # 发送结果通知
-    winner_message = (
-        f"游戏结束！\n您的得分：{winner['id'] == creator['id'] and creator_score or challenger_score}\n"
-        f"对手得分：{winner['id'] == creator['id'] and challenger_score or creator_score}\n"
-        f"恭喜您赢得了 {win_amount} 游戏币！"
-    )
-    loser_message = (
-        f"游戏结束！\n您的得分：{loser['id'] == creator['id'] and creator_score or challenger_score}\n"
-        f"对手得分：{loser['id'] == creator['id'] and challenger_score or creator_score}\n"
-        f"很遗憾，您输掉了 {bet_amount} 游戏币。"
-    )
-
-    # 发送消息给挑战者
-    await update.message.reply_text(
-        winner['id'] == challenger['id'] and winner_message or loser_message,
-        reply_markup=create_main_menu()
-    )
-    
-    # 发送消息给创建者
-    await context.bot.send_message(
-        chat_id=creator['telegram_id'],
-        text=winner['id'] == creator['id'] and winner_message or loser_message,
-        reply_markup=create_main_menu()
+    creator, challenger = await asyncio.gather(
+        get_user_by_id(game['creator_id']),
+        get_current_user(update, context),
     )
 
-    # 更新赢家余额（下注金额的190%）
-    update_balance_amount = bet_amount * 1.9
-    update_user_balance(winner['telegram_id'], update_balance_amount)
-
-    # 处理上级邀约者的7%收益
-    inviter = get_user_by_id(winner.get('inviter_id'))
-    if inviter:
-        update_user_balance(inviter['telegram_id'], inviter_amount, is_invite_earning=True)
-
-    # 处理项目方的3%收益
-    project_account = get_user_by_id(1)  # 假设项目方账户的ID为1
-    if project_account:
-        update_user_balance(project_account['telegram_id'], project_amount)
+    # 一个事务内完成赢家奖金、邀约者 7%、项目方 3% 和对战记录
+    settlement = await settle_game(game_id, creator, challenger, game['creator_score'], challenger_score, game['bet_amount'])
 
     # 清理游戏数据
-    del context.bot_data['pending_games'][game_id]
-    
-    # 清理挑战者的用户数据
+    pending_game_store.discard(game_id)
+    if settlement is None:
+        await update.message.reply_text("游戏已结束或不存在。", reply_markup=create_main_menu())
+        return
+    # 创建者投完骰子时 handle_dice 已经重置了他的 user_data，这里只需要清理挑战者的
     context.user_data.clear()
-    
-    # 清理创建者的用户数据（如果创建者不是当前用户）
-    if creator['telegram_id'] != str(update.effective_user.id):
-        user_data = context.application.user_data.get(creator['telegram_id'])
-        if user_data:
-            user_data.clear()
+    context.user_data['game_state'] = 'idle'
 
-    # 添加游戏历史记录
-    add_game_history(game_id, creator['id'], challenger['id'], bet_amount, creator_score, challenger_score, winner['id'], win_amount, 'completed')
+    if settlement.is_tie:
+        challenger_message = creator_message = f"游戏结束！双方平局，各自的分数是 {challenger_score}。下注金额已退还。"
+    else:
+        winner_message = (
+            f"游戏结束！\n您的得分：{settlement.score_of(settlement.winner)}\n"
+            f"对手得分：{settlement.opponent_score_of(settlement.winner)}\n"
+            f"恭喜您赢得了 {settlement.win_amount} 游戏币！"
+        )
+        loser_message = (
+            f"游戏结束！\n您的得分：{settlement.score_of(settlement.loser)}\n"
+            f"对手得分：{settlement.opponent_score_of(settlement.loser)}\n"
+            f"很遗憾，您输掉了 {settlement.bet_amount} 游戏币。"
+        )
+        challenger_message = winner_message if settlement.winner.id == challenger.id else loser_message
+        creator_message = winner_message if settlement.winner.id == creator.id else loser_message
+
+    # 同时通知挑战者和创建者
+    await asyncio.gather(
+        context.bot.send_message(chat_id=update.effective_chat.id, text=challenger_message, reply_markup=create_main_menu(),
+                                 rate_limit_args=PRIORITY_HIGH),
+        context.bot.send_message(chat_id=creator.telegram_id, text=creator_message, reply_markup=create_main_menu(),
+                                 rate_limit_args=PRIORITY_HIGH),
+    )
 
-    # 重置游戏状态
-    context.user_data['game_state'] = 'idle'
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     if update.message:
-        await update.message.reply_text("请选择以下操作：", reply_markup=create_main_menu())
+        await update.message.reply_text(templates.render('menu_prompt'), reply_markup=create_main_menu())
     elif update.callback_query:
-        await update.callback_query.answer()
-        await update.callback_query.edit_message_text("请选择以下操作：", reply_markup=create_main_menu())
+        await edit_message_text(update.callback_query, templates.render('menu_prompt'), reply_markup=create_main_menu())
 
-def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
-    logger.error(f"Exception while handling an update: {context.error}", exc_info=True)
-    
+async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # 没有变化的编辑已经由 edit_message_text 在本地跳过，这里只兜底
     if isinstance(context.error, telegram.error.BadRequest) and "Message is not modified" in str(context.error):
         logger.info("Ignored 'Message is not modified' error")
         return
-    
+
+    logger.error(f"Exception while handling an update: {context.error}", exc_info=context.error)
+
     if update and isinstance(update, Update) and update.effective_message:
         error_message = "处理您的请求时发生错误。请稍后再试。"
         try:
-            update.effective_message.reply_text(error_message)
+            await update.effective_message.reply_text(error_message)
         except Exception as e:
             logger.error(f"Failed to send error message: {e}")
 
+# callback_data 路由表：固定 key 一次 dict 查找，带参数的按前缀匹配
+callback_router = CallbackRouter(fallback=unknown_callback)
+for key, handler in {
+    'start_game': start_game,
+    'game_history': show_game_history,
+    'invite_earnings': show_invite_earnings,
+    'balance': show_balance,
+    'deposit_withdraw': deposit_withdraw,
+    'connect_wallet': connect_wallet,
+    'cancel_wallet_connection': cancel_wallet_connection,
+    'help': show_help,
+    'main_menu': show_menu,
+    'deposit_ton': deposit_ton_handler,
+    'deposit_dice': deposit_dice_handler,
+    'withdraw_ton': withdraw_ton_handler,
+    'withdraw_dice': withdraw_dice_handler,
+    'token_info': show_token_info,
+    'check_deposit': check_deposit,
+    'start_withdraw': start_withdraw,
+    'game_rules': show_game_rules,
+    'faq': show_faq,
+    'cancel_game': cancel_game,
+    'cancel_transaction': cancel_transaction,
+}.items():
+    callback_router.exact(key, handler)
+callback_router.prefix('history_', show_history_page)
+callback_router.prefix('invitees_', show_invitees_page)
+callback_router.prefix('confirm_', confirm_transaction)
+
+async def close_clients(application):
+    # 关闭进程内共享的 HTTP 会话和 bridge 订阅
+    await toncenter.close()
+    await bridge_listener.shutdown()
+
+def build_application(run_jobs=True, updater=True, workers=1, request=None):
+    # 不同用户的 update 并行处理，同一用户的 update 按顺序处理。
+    # 多进程部署时由 supervisor 负责接收 update（updater=False），定期任务只在一个 worker 上运行（run_jobs），
+    # 全局发送频率由 workers 个进程平分。request 用来替换 Bot API 的传输层（压测）
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .base_url(BOT_API_BASE_URL)
+        .context_types(bot_context_types)
+        .concurrent_updates(PerUserUpdateProcessor())
+        .rate_limiter(FloodControlRateLimiter(global_rate=OUTBOUND_GLOBAL_RATE / workers))
+        .post_shutdown(close_clients)
+    )
+    if request is not None:
+        builder = builder.request(request)
+    if not updater:
+        builder = builder.updater(None)
+    application = builder.build()
+    bridge_listener.bot = application.bot
+    bridge_listener.on_connect = wallet_connected
+    bridge_listener.on_reject = wallet_rejected
+
+    # 每个 update 先加载一次当前用户，后面的 handler 直接从 context 读取
+    application.add_handler(TypeHandler(Update, load_user_context), group=-1)
+
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
+    application.add_handler(CallbackQueryHandler(callback_router.dispatch))
+    application.add_handler(MessageHandler(filters.Dice.ALL, handle_dice))
+    
+    application.add_error_handler(error_handler)
+
+    if run_jobs:
+        # 定期把手续费/邀约收益合并进用户余额
+        application.job_queue.run_repeating(fold_accruals_job, interval=ACCRUAL_FOLD_INTERVAL, first=ACCRUAL_FOLD_INTERVAL)
+        # 定期清理过期的待挑战对局并退还下注金额
+        application.job_queue.run_repeating(expire_pending_games_job, interval=PENDING_GAME_SWEEP_INTERVAL, first=PENDING_GAME_SWEEP_INTERVAL)
+        # 跟踪合约的链上交易，给充值入账
+        application.job_queue.run_repeating(index_deposits_job, interval=DEPOSIT_INDEX_INTERVAL, first=DEPOSIT_INDEX_INTERVAL)
+        # 提现攒批打款
+        application.job_queue.run_repeating(flush_withdrawals_job, interval=WITHDRAW_CHECK_INTERVAL, first=WITHDRAW_CHECK_INTERVAL)
+    # 汇率缓存是每个进程自己的，每个 worker 都预取
+    application.job_queue.run_repeating(prefetch_job, interval=RATE_PREFETCH_INTERVAL, first=0, data=rate_caches)
+    # 连接钱包的会话是每个进程自己的，每个 worker 都清理
+    application.job_queue.run_repeating(
+        expire_connections_job, interval=TON_CONNECT_EXPIRE_INTERVAL, first=TON_CONNECT_EXPIRE_INTERVAL,
+    )
+    application.job_queue.run_repeating(log_update_metrics_job, interval=UPDATE_METRICS_INTERVAL, first=UPDATE_METRICS_INTERVAL)
+    application.job_queue.run_repeating(
+        log_callback_metrics_job, interval=UPDATE_METRICS_INTERVAL, first=UPDATE_METRICS_INTERVAL, data=callback_router,
+    )
+    application.job_queue.run_repeating(log_toncenter_metrics_job, interval=UPDATE_METRICS_INTERVAL, first=UPDATE_METRICS_INTERVAL)
+    return application
+
 def main() -> None:
     try:
-        application = Application.builder().token(BOT_TOKEN).build()
-
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
-        application.add_handler(CallbackQueryHandler(button_callback))
-        application.add_handler(MessageHandler(filters.Dice.ALL, handle_dice))
-
-        application.add_handler(CallbackQueryHandler(confirm_transaction, pattern='^confirm_'))
-        application.add_handler(CallbackQueryHandler(cancel_transaction, pattern='^cancel_transaction$'))
-        application.add_handler(CallbackQueryHandler(connect_wallet, pattern='^connect_wallet$'))
-        
-        application.add_error_handler(error_handler)
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        application = build_application()
+        if BOT_RUN_MODE == 'webhook':
+            run_webhook(application)
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
     except Exception as e:
         logger.error(f"Error in main: {e}")
 
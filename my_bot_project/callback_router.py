@@ -0,0 +1,106 @@
+import logging
+import time
+
+from message_cache import answer_callback
+
+logger = logging.getLogger(__name__)
+
+class _Route:
+    __slots__ = ('name', 'handler', 'answer', 'parameterized', 'hits', 'total_ms', 'max_ms')
+
+    def __init__(self, name, handler, answer, parameterized):
+        self.name = name
+        self.handler = handler
+        self.answer = answer
+        self.parameterized = parameterized
+        self.hits = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+class CallbackRouter:
+    # callback_data -> handler：固定的 key 用 dict 一次查找，带参数的前缀（history_、confirm_ 等）用前缀树匹配。
+    # 带参数的 handler 额外收到去掉前缀后的部分。
+    # 每个 callback 在调用 handler 之前统一应答一次；需要自己带文字应答的 handler 注册时传 answer=False
+
+    def __init__(self, fallback=None):
+        self._exact = {}
+        self._trie = {}
+        self._fallback = _Route('<unknown>', fallback, True, False) if fallback else None
+
+    def exact(self, key, handler, answer=True):
+        self._exact[key] = _Route(key, handler, answer, False)
+
+    def prefix(self, prefix, handler, answer=True):
+        node = self._trie
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[None] = _Route(prefix + '*', handler, answer, True)
+
+    def resolve(self, data):
+        route = self._exact.get(data)
+        if route is not None:
+            return route, None
+        # 取最长的匹配前缀
+        match, end = None, 0
+        node = self._trie
+        for index, char in enumerate(data):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                match, end = node[None], index + 1
+        if match is not None:
+            return match, data[end:]
+        return self._fallback, None
+
+    async def dispatch(self, update, context):
+        query = update.callback_query
+        route, args = self.resolve(query.data or '')
+        if route is None:
+            logger.warning(f"No route for callback data: {query.data}")
+            await answer_callback(query)
+            return
+        if route.answer:
+            await answer_callback(query)
+        started = time.perf_counter()
+        try:
+            if route.parameterized:
+                await route.handler(update, context, args)
+            else:
+                await route.handler(update, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            route.hits += 1
+            route.total_ms += elapsed
+            route.max_ms = max(route.max_ms, elapsed)
+
+    def routes(self):
+        routes = list(self._exact.values())
+        stack = [self._trie]
+        while stack:
+            node = stack.pop()
+            for char, child in node.items():
+                if char is None:
+                    routes.append(child)
+                else:
+                    stack.append(child)
+        if self._fallback is not None:
+            routes.append(self._fallback)
+        return routes
+
+    def metrics(self):
+        return {
+            route.name: {
+                'hits': route.hits,
+                'avg_ms': round(route.total_ms / route.hits, 2),
+                'max_ms': round(route.max_ms, 2),
+            }
+            for route in sorted(self.routes(), key=lambda route: -route.hits)
+            if route.hits
+        }
+
+async def log_callback_metrics_job(context):
+    # job data 是要记录的 CallbackRouter
+    metrics = context.job.data.metrics()
+    if metrics:
+        logger.info(f"Callback route metrics: {metrics}")
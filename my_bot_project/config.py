@@ -15,3 +15,139 @@ DB_PASSWORD = os.getenv('DB_PASSWORD')
 DB_NAME = os.getenv('DB_NAME')
 DB_PORT = os.getenv('DB_PORT')
 DB_SSL = os.getenv('DB_SSL')
+
+# 数据库连接 URL（同步驱动，供 models.py 使用）
+DB_URL = os.getenv('DB_URL')
+
+def _to_async_db_url(url):
+    # 将 postgresql:// 之类的同步 URL 转换为 asyncpg 驱动的 URL
+    if not url:
+        return url
+    for prefix in ('postgresql+psycopg2://', 'postgresql://', 'postgres://'):
+        if url.startswith(prefix):
+            return 'postgresql+asyncpg://' + url[len(prefix):]
+    return url
+
+# 异步数据库连接 URL，未设置时由 DB_URL 推导
+ASYNC_DB_URL = os.getenv('ASYNC_DB_URL') or _to_async_db_url(DB_URL)
+
+# 异步连接池大小
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+
+# 项目方账户（收取 3% 手续费）的用户 ID
+PROJECT_ACCOUNT_ID = int(os.getenv('PROJECT_ACCOUNT_ID', '1'))
+
+# 分成比例（百分比，按单方下注金额计算）
+WINNER_SHARE = 90   # 赢家获得对手下注的 90%
+INVITER_SHARE = 7   # 赢家的上级邀约者获得 7%
+PROJECT_SHARE = 3   # 项目方收取 3%
+
+# 手续费/邀约收益合并任务的执行间隔（秒）和每批处理的记录数
+ACCRUAL_FOLD_INTERVAL = int(os.getenv('ACCRUAL_FOLD_INTERVAL', '30'))
+ACCRUAL_FOLD_BATCH = int(os.getenv('ACCRUAL_FOLD_BATCH', '1000'))
+
+# 用户缓存（按 telegram_id）的最大条目数和过期时间（秒）
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', '300'))
+
+# 等待挑战的对局：内存索引上限、过期时间（秒）、清理任务间隔（秒）和每批处理数量
+PENDING_GAME_CACHE_SIZE = int(os.getenv('PENDING_GAME_CACHE_SIZE', '10000'))
+PENDING_GAME_TTL = int(os.getenv('PENDING_GAME_TTL', str(24 * 3600)))
+PENDING_GAME_SWEEP_INTERVAL = int(os.getenv('PENDING_GAME_SWEEP_INTERVAL', '300'))
+PENDING_GAME_SWEEP_BATCH = int(os.getenv('PENDING_GAME_SWEEP_BATCH', '500'))
+
+# update 处理：同时运行的 handler 数量上限、在途（排队 + 运行）update 数量上限、指标日志间隔（秒）
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '64'))
+UPDATE_QUEUE_LIMIT = int(os.getenv('UPDATE_QUEUE_LIMIT', '1024'))
+UPDATE_METRICS_INTERVAL = int(os.getenv('UPDATE_METRICS_INTERVAL', '60'))
+
+# 运行模式：polling（默认）或 webhook
+BOT_RUN_MODE = os.getenv('BOT_RUN_MODE', 'polling')
+
+# webhook 模式：本地监听地址/端口/路径；对外 URL（不含路径，为空时不调用 setWebhook，便于本地测试）；
+# secret token（校验 X-Telegram-Bot-Api-Secret-Token 请求头）；同时处理的请求数（也作为 setWebhook 的 max_connections，最大 100）；
+# update 队列积压上限（超过后返回 503 让 Telegram 稍后重发）
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))
+WEBHOOK_QUEUE_LIMIT = int(os.getenv('WEBHOOK_QUEUE_LIMIT', str(UPDATE_QUEUE_LIMIT)))
+
+# Bot API 地址（token 会拼接在后面），压测时可以指向本地的假 Bot API
+BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL', 'https://api.telegram.org/bot')
+
+# 多进程部署（supervisor.py）：worker 进程数量（默认等于 CPU 核数），长轮询超时（秒）
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', str(os.cpu_count() or 1)))
+SHARD_POLL_TIMEOUT = int(os.getenv('SHARD_POLL_TIMEOUT', '30'))
+
+# 发送频率限制（参考 Telegram 的限制）：全局每秒消息数；私聊每秒消息数和允许的突发条数；群组每分钟消息数；
+# 收到 429 后的最大重试次数；保留令牌桶的聊天数上限
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', '3'))
+OUTBOUND_GROUP_PER_MINUTE = int(os.getenv('OUTBOUND_GROUP_PER_MINUTE', '20'))
+OUTBOUND_MAX_RETRIES = int(os.getenv('OUTBOUND_MAX_RETRIES', '3'))
+OUTBOUND_MAX_CHATS = int(os.getenv('OUTBOUND_MAX_CHATS', '10000'))
+
+# 消息内容指纹缓存（跳过内容没有变化的编辑）的最大条目数
+MESSAGE_CACHE_SIZE = int(os.getenv('MESSAGE_CACHE_SIZE', '10000'))
+
+# 消息模板和键盘的默认语言
+DEFAULT_LANGUAGE = os.getenv('DEFAULT_LANGUAGE', 'zh')
+
+# 图片缓存（二维码等）：缓存的图片和 file_id 条目数上限；渲染二维码的线程数
+MEDIA_CACHE_SIZE = int(os.getenv('MEDIA_CACHE_SIZE', '1024'))
+QR_RENDER_WORKERS = int(os.getenv('QR_RENDER_WORKERS', '2'))
+
+# 链上汇率/池子信息缓存：有效期（秒）；过期后仍可先返回旧值的时长（秒）；后台预取间隔（秒，应小于有效期）
+RATE_CACHE_TTL = int(os.getenv('RATE_CACHE_TTL', '30'))
+RATE_CACHE_MAX_STALE = int(os.getenv('RATE_CACHE_MAX_STALE', '300'))
+RATE_PREFETCH_INTERVAL = int(os.getenv('RATE_PREFETCH_INTERVAL', '20'))
+
+# Toncenter JSON-RPC：地址和 API key；同时进行的请求数（也是保持的连接数）；单次请求超时（秒）；
+# 临时错误的最大重试次数和退避基数（秒）
+TONCENTER_ENDPOINT = os.getenv('TONCENTER_ENDPOINT', 'https://testnet.toncenter.com/api/v2/jsonRPC')
+TONCENTER_API_KEY = os.getenv('TONCENTER_API_KEY', 'your_api_key_here')
+TONCENTER_CONCURRENCY = int(os.getenv('TONCENTER_CONCURRENCY', '8'))
+TONCENTER_TIMEOUT = float(os.getenv('TONCENTER_TIMEOUT', '10'))
+TONCENTER_MAX_RETRIES = int(os.getenv('TONCENTER_MAX_RETRIES', '3'))
+TONCENTER_RETRY_BASE = float(os.getenv('TONCENTER_RETRY_BASE', '0.5'))
+
+# 链上充值索引器：轮询间隔（秒）；每次 getTransactions 取的交易数；每个事务入账的交易数
+DEPOSIT_INDEX_INTERVAL = int(os.getenv('DEPOSIT_INDEX_INTERVAL', '10'))
+DEPOSIT_INDEX_PAGE = int(os.getenv('DEPOSIT_INDEX_PAGE', '100'))
+DEPOSIT_INDEX_BATCH = int(os.getenv('DEPOSIT_INDEX_BATCH', '500'))
+
+# 提现队列：攒够多少条立即打款；一批最多多少条；最早的一条最多等待多久（秒）；检查间隔（秒）；
+# 单条提现最多尝试发送几次；热钱包（highload wallet v2）助记词
+WITHDRAW_BATCH_SIZE = int(os.getenv('WITHDRAW_BATCH_SIZE', '50'))
+WITHDRAW_MAX_BATCH = int(os.getenv('WITHDRAW_MAX_BATCH', '200'))
+WITHDRAW_MAX_WAIT = int(os.getenv('WITHDRAW_MAX_WAIT', '60'))
+WITHDRAW_CHECK_INTERVAL = int(os.getenv('WITHDRAW_CHECK_INTERVAL', '5'))
+WITHDRAW_MAX_ATTEMPTS = int(os.getenv('WITHDRAW_MAX_ATTEMPTS', '3'))
+HOT_WALLET_MNEMONIC = os.getenv('HOT_WALLET_MNEMONIC', '')
+
+# 钱包发送：最多同时在途的 seqno 数；外部消息的有效期（秒）；确认轮询间隔（秒）；单个转账最多重新签名的次数
+WALLET_SENDER_WINDOW = int(os.getenv('WALLET_SENDER_WINDOW', '4'))
+WALLET_MESSAGE_TTL = int(os.getenv('WALLET_MESSAGE_TTL', '60'))
+WALLET_POLL_INTERVAL = float(os.getenv('WALLET_POLL_INTERVAL', '2'))
+WALLET_MAX_RESIGNS = int(os.getenv('WALLET_MAX_RESIGNS', '5'))
+
+# 发送充值消息（买入 / 存入 DICE）的钱包（wallet v4r2）助记词；未设置时充值不可用
+DEPOSIT_WALLET_MNEMONIC = os.getenv('DEPOSIT_WALLET_MNEMONIC', '')
+
+# 合约消息 payload 的缓存条目数（每种构造函数各一份）
+PAYLOAD_CACHE_SIZE = int(os.getenv('PAYLOAD_CACHE_SIZE', '4096'))
+
+# TON Connect：bridge 地址；钱包 app 的域名（tonconnect 拼出 https://<域名>/ton-connect 连接链接）；dApp manifest 地址；钱包连接请求的有效期（秒）；
+# 清理过期连接的间隔（秒）；一条 bridge 订阅最多包含的连接数（受 URL 长度限制）；bridge 订阅断开后重连的等待时间（秒）
+TON_CONNECT_BRIDGE_URL = os.getenv('TON_CONNECT_BRIDGE_URL', 'https://bridge.tonapi.io/bridge')
+TON_CONNECT_WALLET_APP = os.getenv('TON_CONNECT_WALLET_APP', 'app.tonkeeper.com')
+TON_CONNECT_MANIFEST_URL = os.getenv('TON_CONNECT_MANIFEST_URL', '')
+WALLET_CONNECT_TTL = int(os.getenv('WALLET_CONNECT_TTL', '300'))
+TON_CONNECT_EXPIRE_INTERVAL = int(os.getenv('TON_CONNECT_EXPIRE_INTERVAL', '30'))
+TON_CONNECT_IDS_PER_SUBSCRIPTION = int(os.getenv('TON_CONNECT_IDS_PER_SUBSCRIPTION', '100'))
+TON_CONNECT_RECONNECT_DELAY = float(os.getenv('TON_CONNECT_RECONNECT_DELAY', '3'))
@@ -0,0 +1,339 @@
+import logging
+import random
+import string
+from contextlib import asynccontextmanager
+
+from sqlalchemy import func, select, tuple_, union_all, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import aliased
+
+from config import ASYNC_DB_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW
+from models import User, GameHistory, Transaction, BalanceAccrual, InviterStats
+from user_cache import user_cache
+from utils import normalize_address
+
+logger = logging.getLogger(__name__)
+
+# 基于 asyncpg 的异步引擎，数据库 I/O 不再阻塞 telegram 的事件循环
+# SQLite（aiosqlite，本地压测用）由 SQLAlchemy 选择连接池，不接受 pool_size
+_pool_options = {} if (ASYNC_DB_URL or '').startswith('sqlite') else dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_pre_ping=True,
+)
+async_engine = create_async_engine(ASYNC_DB_URL, **_pool_options)
+# expire_on_commit=False：会话关闭后返回的 ORM 对象仍然可以读取属性
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+def upsert(session, table):
+    # INSERT ... ON CONFLICT，PostgreSQL 和 SQLite 的写法一致
+    insert = sqlite_insert if session.bind.dialect.name == 'sqlite' else pg_insert
+    return insert(table)
+
+async def increment_inviter_stats(session, inviter_id, invitee_count=0, referral_earnings=0):
+    statement = upsert(session, InviterStats).values(
+        inviter_id=inviter_id, invitee_count=invitee_count, referral_earnings=referral_earnings
+    )
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[InviterStats.inviter_id],
+            set_=dict(
+                invitee_count=InviterStats.invitee_count + statement.excluded.invitee_count,
+                referral_earnings=InviterStats.referral_earnings + statement.excluded.referral_earnings,
+                updated_at=func.now(),
+            ),
+        )
+    )
+
+@asynccontextmanager
+async def get_db_session():
+    session = AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+async def get_user_by_id(user_id):
+    if user_id is None:
+        return None
+    user = user_cache.get_by_id(user_id)
+    if user is not None:
+        return user
+    async with get_db_session() as session:
+        return user_cache.put(await session.get(User, user_id))
+
+async def update_user_wallet(user_id, wallet_address):
+    async with get_db_session() as session:
+        user = await session.get(User, user_id)
+        if user:
+            user.wallet_address = wallet_address
+            user.wallet_address_raw = normalize_address(wallet_address)
+    user_cache.update_by_id(user_id, wallet_address=wallet_address, wallet_address_raw=normalize_address(wallet_address))
+
+async def get_user_by_telegram_id(telegram_id):
+    user = user_cache.get(telegram_id)
+    if user is not None:
+        return user
+    async with get_db_session() as session:
+        result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+        return user_cache.put(result.scalars().first())
+
+async def get_user_by_invite_code(invite_code):
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(User).where(func.upper(User.invite_code) == func.upper(invite_code))
+        )
+        return result.scalars().first()
+
+async def create_user(telegram_id, username, inviter_id=None):
+    async with get_db_session() as session:
+        new_user = User(
+            telegram_id=telegram_id,
+            username=username,
+            inviter_id=inviter_id,
+            balance=1000
+        )
+        session.add(new_user)
+        await session.flush()
+        if inviter_id is not None:
+            await increment_inviter_stats(session, inviter_id, invitee_count=1)
+    return user_cache.put(new_user)
+
+async def generate_invite_code(user_id):
+    invite_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    async with get_db_session() as session:
+        user = await session.get(User, user_id)
+        if user:
+            user.invite_code = invite_code
+    user_cache.update_by_id(user_id, invite_code=invite_code)
+    return invite_code
+
+async def adjust_balance(telegram_id, delta):
+    # 单条 UPDATE ... RETURNING 完成加减余额，没有读-改-写窗口，返回最新余额
+    async with get_db_session() as session:
+        result = await session.execute(
+            update(User)
+            .where(User.telegram_id == telegram_id)
+            .values(balance=User.balance + delta)
+            .returning(User.balance)
+            .execution_options(synchronize_session=False)
+        )
+        balance = result.scalar()
+    if balance is not None:
+        user_cache.update(telegram_id, balance=balance)
+    return balance
+
+def debit_statement(telegram_id, cost):
+    # 带余额校验的扣款语句：余额不足时不更新任何行，否则返回扣款后的余额。
+    # 校验时把尚未合并的手续费/邀约收益一并算入，和展示给用户的余额保持一致
+    pending = (
+        select(func.coalesce(func.sum(BalanceAccrual.amount), 0))
+        .where(BalanceAccrual.user_id == User.id)
+        .scalar_subquery()
+    )
+    return (
+        update(User)
+        .where(User.telegram_id == telegram_id, User.balance + pending >= cost)
+        .values(balance=User.balance - cost)
+        .returning(User.balance)
+        .execution_options(synchronize_session=False)
+    )
+
+async def debit_balance(telegram_id, cost):
+    # 余额不足返回 None，否则返回扣款后的余额
+    async with get_db_session() as session:
+        result = await session.execute(debit_statement(telegram_id, cost))
+        balance = result.scalar()
+    if balance is not None:
+        user_cache.update(telegram_id, balance=balance)
+    return balance
+
+async def update_user_balance(telegram_id, amount):
+    return await adjust_balance(telegram_id, amount)
+
+async def add_game_history(game_id, player_a_id, player_b_id, bet_amount, player_a_score, player_b_score, winner_id, win_amount, status):
+    async with get_db_session() as session:
+        new_game = GameHistory(
+            game_id=game_id,
+            player_a_id=player_a_id,
+            player_b_id=player_b_id,
+            bet_amount=bet_amount,
+            player_a_score=player_a_score,
+            player_b_score=player_b_score,
+            winner_id=winner_id,
+            win_amount=win_amount,
+            status=status
+        )
+        session.add(new_game)
+
+async def get_user_game_history(user_id, status='completed', limit=5, offset=0):
+    # 返回带双方用户名的行（RowMapping），可以直接用 game['player_a_username'] 访问
+    player_a = aliased(User)
+    player_b = aliased(User)
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(
+                *GameHistory.__table__.columns,
+                player_a.username.label('player_a_username'),
+                player_b.username.label('player_b_username'),
+            )
+            .outerjoin(player_a, GameHistory.player_a_id == player_a.id)
+            .outerjoin(player_b, GameHistory.player_b_id == player_b.id)
+            .where(
+                ((GameHistory.player_a_id == user_id) | (GameHistory.player_b_id == user_id)) &
+                (GameHistory.status == status)
+            )
+            .order_by(GameHistory.created_at.desc())
+            .limit(limit)
+            .offset(offset)
+        )
+        return result.mappings().all()
+
+async def get_user_game_history_page(user_id, status='completed', limit=5, cursor=None, direction='next', inclusive=False):
+    # 基于 (created_at, id) 的游标分页，只查一次 limit+1 行，页数再深耗时也不变。
+    # direction='next' 取游标之后（更早）的记录，'prev' 取游标之前（更新）的记录。
+    # 返回 (rows, has_more)，has_more 表示沿 direction 方向是否还有下一页
+    newer = direction == 'prev'
+    key = tuple_(GameHistory.created_at, GameHistory.id)
+    if newer:
+        order_by = (GameHistory.created_at.asc(), GameHistory.id.asc())
+    else:
+        order_by = (GameHistory.created_at.desc(), GameHistory.id.desc())
+
+    def side(player_column):
+        # 玩家 A/B 各自走 (player, status, created_at, id) 索引，有序取 limit+1 行后再合并
+        query = select(GameHistory.id, GameHistory.created_at).where(player_column == user_id, GameHistory.status == status)
+        if cursor:
+            if newer:
+                query = query.where(key >= tuple_(*cursor) if inclusive else key > tuple_(*cursor))
+            else:
+                query = query.where(key <= tuple_(*cursor) if inclusive else key < tuple_(*cursor))
+        return query.order_by(*order_by).limit(limit + 1)
+
+    page_ids = union_all(side(GameHistory.player_a_id), side(GameHistory.player_b_id)).subquery()
+    player_a = aliased(User)
+    player_b = aliased(User)
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(
+                *GameHistory.__table__.columns,
+                player_a.username.label('player_a_username'),
+                player_b.username.label('player_b_username'),
+            )
+            .join(page_ids, GameHistory.id == page_ids.c.id)
+            .outerjoin(player_a, GameHistory.player_a_id == player_a.id)
+            .outerjoin(player_b, GameHistory.player_b_id == player_b.id)
+            .order_by(*order_by)
+            .limit(limit + 1)
+        )
+        rows = result.mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if newer:
+        rows.reverse()
+    return rows, has_more
+
+async def get_user_pending_games(user_id):
+    async with get_db_session() as session:
+        try:
+            result = await session.execute(
+                select(GameHistory).where(
+                    GameHistory.player_a_id == user_id,
+                    GameHistory.player_b_id == None,
+                    GameHistory.status == 'pending'
+                ).order_by(GameHistory.created_at.desc())
+            )
+            return result.scalars().all()
+        except SQLAlchemyError as e:
+            logger.error(f"Error fetching user pending games: {e}")
+            return []
+
+async def get_user_completed_games(user_id):
+    try:
+        return await get_user_game_history(user_id, status='completed', limit=10)
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching user completed games: {e}")
+        return []
+
+async def get_invited_users(user_id):
+    async with get_db_session() as session:
+        result = await session.execute(select(User).where(User.inviter_id == user_id))
+        return result.scalars().all()
+
+async def get_invited_users_page(user_id, limit=20, cursor=None):
+    # 按注册时间倒序的游标分页，返回 (users, has_more)
+    query = select(User).where(User.inviter_id == user_id)
+    if cursor:
+        query = query.where(tuple_(User.created_at, User.id) < tuple_(*cursor))
+    async with get_db_session() as session:
+        result = await session.execute(query.order_by(User.created_at.desc(), User.id.desc()).limit(limit + 1))
+        users = result.scalars().all()
+    return users[:limit], len(users) > limit
+
+async def get_inviter_stats(user_id):
+    # 一次查询返回 (邀请人数, 邀约收益)，收益包含尚未合并的 referral 记录
+    pending = (
+        select(func.coalesce(func.sum(BalanceAccrual.amount), 0))
+        .where(BalanceAccrual.user_id == user_id, BalanceAccrual.kind == 'referral')
+        .scalar_subquery()
+    )
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(
+                func.coalesce(select(InviterStats.invitee_count).where(InviterStats.inviter_id == user_id).scalar_subquery(), 0),
+                func.coalesce(select(InviterStats.referral_earnings).where(InviterStats.inviter_id == user_id).scalar_subquery(), 0) + pending,
+            )
+        )
+        invitee_count, referral_earnings = result.one()
+    return invitee_count, referral_earnings
+
+async def calculate_invite_earnings(user_id):
+    _, referral_earnings = await get_inviter_stats(user_id)
+    return referral_earnings
+
+async def get_wallet_address(user_id):
+    user = await get_user_by_id(user_id)
+    return user.wallet_address if user else None
+
+async def update_user_info(telegram_id, username):
+    async with get_db_session() as session:
+        try:
+            result = await session.execute(select(User).where(User.telegram_id == telegram_id))
+            user = result.scalars().first()
+            if user:
+                user.username = username
+                user.updated_at = func.now()
+        except SQLAlchemyError as e:
+            logger.error(f"Error updating user info: {e}")
+            await session.rollback()
+            return
+    user_cache.update(telegram_id, username=username)
+
+async def get_user_deposits(user_id, after_id=0, since=None, limit=10):
+    # 索引器已入账的充值，check_deposit 只读本地数据库
+    query = select(Transaction).where(
+        Transaction.user_id == user_id, Transaction.type == 'deposit', Transaction.status == 'completed',
+        Transaction.id > after_id,
+    )
+    if since is not None:
+        query = query.where(Transaction.created_at >= since)
+    async with get_db_session() as session:
+        result = await session.execute(query.order_by(Transaction.id.desc()).limit(limit))
+        return result.scalars().all()
+
+async def get_user_transactions(user_id, limit=10):
+    async with get_db_session() as session:
+        result = await session.execute(
+            select(Transaction)
+            .where(Transaction.user_id == user_id)
+            .order_by(Transaction.created_at.desc())
+            .limit(limit)
+        )
+        return result.scalars().all()
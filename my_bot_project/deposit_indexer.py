@@ -0,0 +1,127 @@
+import base64
+import logging
+from collections import defaultdict
+
+from sqlalchemy import case, select, update
+from tonsdk.boc import Cell
+
+from config import DEPOSIT_INDEX_BATCH, DEPOSIT_INDEX_PAGE
+from database import get_db_session, upsert
+from models import ChainCursor, Transaction, User
+from ton_interaction import DICE_CONTRACT_ADDRESS, OP_BUY, OP_DEPOSIT, TRADE_AMOUNT
+from toncenter import toncenter
+from user_cache import user_cache
+from utils import normalize_address
+
+logger = logging.getLogger(__name__)
+
+CURSOR_NAME = 'deposits'
+NANO = 10 ** 9
+
+def decode_deposit(tx):
+    # 从合约收到的一笔交易里解析充值：返回 (tx_hash, lt, 发送方 raw 地址, DICE 数量)，不是充值时返回 None。
+    # 只认 create_buy_payload（op 2）和 create_deposit_payload（op 4）产生的消息
+    in_msg = tx.get('in_msg') or {}
+    sender = normalize_address(in_msg.get('source'))
+    body = (in_msg.get('msg_data') or {}).get('body')
+    if sender is None or not body:
+        return None
+    try:
+        payload = Cell.one_from_boc(base64.b64decode(body)).begin_parse()
+        op = payload.read_uint(32)
+        if op not in (OP_BUY, OP_DEPOSIT):
+            return None
+        coins = payload.read_coins()
+    except Exception:
+        return None
+    if op == OP_BUY:
+        # 买入：payload 里是报价的 TON 数量，附带的 TON 不足时不入账
+        if int(in_msg.get('value') or 0) < coins:
+            return None
+        amount = TRADE_AMOUNT // NANO
+    else:
+        # 存入：payload 里是 to_nano(带 9 位小数的 DICE 数量)
+        amount = coins // NANO // NANO
+    if amount <= 0:
+        return None
+    transaction_id = tx['transaction_id']
+    return transaction_id['hash'], int(transaction_id['lt']), sender, amount
+
+async def get_cursor():
+    async with get_db_session() as session:
+        cursor = await session.get(ChainCursor, CURSOR_NAME)
+        return cursor.lt if cursor else 0
+
+async def credit_deposits(session, deposits):
+    # 一批充值在一个事务里入账：按 tx_hash 插入 Transaction（已存在的跳过，保证幂等），
+    # 只给新插入且匹配到用户的记录加余额，每个用户一条 UPDATE
+    senders = {sender for _, _, sender, _ in deposits}
+    result = await session.execute(
+        select(User.wallet_address_raw, User.id).where(User.wallet_address_raw.in_(senders))
+    )
+    users = dict(result.all())
+    rows = [
+        dict(
+            user_id=users.get(sender), amount=amount, type='deposit',
+            status='completed' if sender in users else 'unmatched', tx_hash=tx_hash, lt=lt,
+        )
+        for tx_hash, lt, sender, amount in deposits
+    ]
+    result = await session.execute(
+        upsert(session, Transaction)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=[Transaction.tx_hash])
+        .returning(Transaction.user_id, Transaction.amount, Transaction.status)
+    )
+    totals = defaultdict(int)
+    unmatched = 0
+    for user_id, amount, status in result.all():
+        if status == 'completed':
+            totals[user_id] += amount
+        else:
+            unmatched += 1
+    if unmatched:
+        logger.warning(f"{unmatched} deposits from unknown wallets recorded as unmatched")
+    if not totals:
+        return []
+    result = await session.execute(
+        update(User)
+        .where(User.id.in_(totals))
+        .values(balance=User.balance + case(dict(totals), value=User.id, else_=0))
+        .returning(User.id, User.balance)
+        .execution_options(synchronize_session=False)
+    )
+    return result.all()
+
+async def save_cursor(session, lt, tx_hash):
+    statement = upsert(session, ChainCursor).values(name=CURSOR_NAME, lt=lt, tx_hash=tx_hash)
+    await session.execute(
+        statement.on_conflict_do_update(
+            index_elements=[ChainCursor.name],
+            set_=dict(lt=statement.excluded.lt, tx_hash=statement.excluded.tx_hash),
+        )
+    )
+
+async def index_deposits(batch_size=DEPOSIT_INDEX_BATCH):
+    # 一轮索引：拉取游标之后的所有交易，按 lt 顺序分批入账，每批和游标在同一个事务里提交
+    transactions = await toncenter.transactions_after(DICE_CONTRACT_ADDRESS, await get_cursor(), DEPOSIT_INDEX_PAGE)
+    credited = 0
+    for start in range(0, len(transactions), batch_size):
+        chunk = transactions[start:start + batch_size]
+        deposits = [deposit for deposit in map(decode_deposit, chunk) if deposit is not None]
+        last = chunk[-1]['transaction_id']
+        async with get_db_session() as session:
+            balances = await credit_deposits(session, deposits) if deposits else []
+            await save_cursor(session, int(last['lt']), last['hash'])
+        for user_id, balance in balances:
+            user_cache.update_by_id(user_id, balance=balance)
+        credited += len(balances)
+    return len(transactions), credited
+
+async def index_deposits_job(context):
+    try:
+        scanned, credited = await index_deposits()
+        if scanned:
+            logger.info(f"Deposit indexer scanned {scanned} transactions, credited {credited} users")
+    except Exception as e:
+        logger.error(f"Error indexing deposits: {e}", exc_info=True)
@@ -0,0 +1,246 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config import (
+    OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST, OUTBOUND_GROUP_PER_MINUTE,
+    OUTBOUND_MAX_RETRIES, OUTBOUND_MAX_CHATS,
+)
+
+logger = logging.getLogger(__name__)
+
+# 优先级（数字越小越先发送），通过 rate_limit_args 传入（只有 bot 的方法接受，Message.reply_text 等快捷方法不接受），例如
+#   await context.bot.send_message(chat_id, text, rate_limit_args=PRIORITY_HIGH)
+# 没有指定时：新消息为 PRIORITY_NORMAL，编辑消息（菜单、翻页）为 PRIORITY_LOW
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# 受 Telegram 发送频率限制的接口；answerCallbackQuery、getUpdates 等直接放行
+MESSAGE_ENDPOINT_PREFIXES = ('send', 'edit', 'copyMessage', 'forwardMessage')
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'paused_until', 'lock')
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = None
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        # 距离下一个可用令牌还需要等待的秒数
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity and self.paused_until <= now and not (self.lock and self.lock.locked())
+
+class _PendingEdit:
+    __slots__ = ('superseded', 'result')
+
+    def __init__(self, loop):
+        self.superseded = loop.create_future()  # 被更新的编辑取代时设置为新编辑的 _PendingEdit
+        self.result = loop.create_future()      # 本次（或取代它的）编辑的最终结果
+
+class FloodControlRateLimiter(BaseRateLimiter):
+    # 所有 Bot API 调用都经过这里（ApplicationBuilder.rate_limiter），handler 不需要改调用方式：
+    # - 每个聊天一个令牌桶（私聊约 1 条/秒，允许短暂突发；群组 20 条/分钟），再经过全局令牌桶（30 条/秒）
+    # - 全局令牌按优先级分配：对局结果等 PRIORITY_HIGH 先发，菜单编辑最后
+    # - 同一条消息还在排队的编辑会被更新的编辑取代，只发送最后一次
+    # - 收到 429 时按 retry_after 暂停全部发送后重试
+
+    def __init__(self, global_rate=OUTBOUND_GLOBAL_RATE, chat_rate=OUTBOUND_CHAT_RATE, chat_burst=OUTBOUND_CHAT_BURST,
+                 group_per_minute=OUTBOUND_GROUP_PER_MINUTE, max_retries=OUTBOUND_MAX_RETRIES, max_chats=OUTBOUND_MAX_CHATS):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_per_minute / 60
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, max(1, global_rate))
+        self._chats = {}
+        self._waiters = []  # (priority, seq, future)
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._pump_task = None
+        self._pending_edits = {}
+        self.sent = 0
+        self.coalesced = 0
+        self.retried = 0
+        self.throttled = 0
+
+    async def initialize(self):
+        self._wakeup = asyncio.Event()
+        self._pump_task = asyncio.create_task(self._pump())
+
+    async def shutdown(self):
+        if self._pump_task is not None:
+            self._pump_task.cancel()
+            try:
+                await self._pump_task
+            except asyncio.CancelledError:
+                pass
+            self._pump_task = None
+
+    def metrics(self):
+        return {
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+            'retried': self.retried,
+            'throttled': self.throttled,
+            'waiting': len(self._waiters),
+            'chats': len(self._chats),
+        }
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= self.max_chats:
+                now = time.monotonic()
+                for key in [key for key, value in self._chats.items() if value.idle(now)]:
+                    del self._chats[key]
+            # 群组/频道的 chat_id 为负数
+            if chat_id.startswith('-'):
+                bucket = TokenBucket(self.group_rate, 1)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            bucket.lock = asyncio.Lock()
+            self._chats[chat_id] = bucket
+        return bucket
+
+    async def _acquire_chat(self, chat_id):
+        # 同一个聊天的消息按顺序排队
+        bucket = self._chat_bucket(chat_id)
+        async with bucket.lock:
+            while (delay := bucket.delay(time.monotonic())) > 0:
+                self.throttled += 1
+                await asyncio.sleep(delay)
+            bucket.consume(time.monotonic())
+
+    async def _acquire_global(self, priority):
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._wakeup.set()
+        await future
+
+    async def _pump(self):
+        # 有全局令牌时分给优先级最高（同优先级先到先得）的请求
+        while True:
+            if not self._waiters:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._global.delay(time.monotonic())
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._global.consume(time.monotonic())
+            future.set_result(None)
+
+    async def _throttle(self, chat_id, priority):
+        if chat_id is not None:
+            await self._acquire_chat(chat_id)
+        await self._acquire_global(priority)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if not endpoint.startswith(MESSAGE_ENDPOINT_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        chat_id = data.get('chat_id')
+        if chat_id is not None:
+            chat_id = str(chat_id)
+        if rate_limit_args is not None:
+            priority = rate_limit_args
+        elif endpoint.startswith('edit'):
+            priority = PRIORITY_LOW
+        else:
+            priority = PRIORITY_NORMAL
+
+        edit = None
+        if endpoint.startswith('edit'):
+            key = (endpoint, chat_id, data.get('message_id'), data.get('inline_message_id'))
+            edit = _PendingEdit(asyncio.get_running_loop())
+            previous = self._pending_edits.get(key)
+            if previous is not None:
+                previous.superseded.set_result(edit)
+            self._pending_edits[key] = edit
+
+        try:
+            for attempt in range(self.max_retries + 1):
+                if edit is not None and attempt == 0:
+                    if not await self._throttle_edit(edit, chat_id, priority):
+                        # 被更新的编辑取代，直接返回最后一次编辑的结果
+                        self.coalesced += 1
+                        return await self._final_result(edit)
+                    if self._pending_edits.get(key) is edit:
+                        del self._pending_edits[key]
+                else:
+                    await self._throttle(chat_id, priority)
+                try:
+                    result = await callback(*args, **kwargs)
+                except RetryAfter as e:
+                    if attempt == self.max_retries:
+                        raise
+                    self.retried += 1
+                    logger.warning(f"Flood limit on {endpoint} (chat {chat_id}), retrying in {e.retry_after} s")
+                    self._global.pause(e.retry_after)
+                    continue
+                self.sent += 1
+                if edit is not None:
+                    edit.result.set_result(result)
+                return result
+        except BaseException as e:
+            # 把失败传给被这次编辑取代的请求
+            if edit is not None and not edit.result.done() and not edit.superseded.done():
+                if isinstance(e, Exception):
+                    edit.result.set_exception(e)
+                    edit.result.exception()  # 没有被取代的请求时避免 "exception was never retrieved"
+                else:
+                    edit.result.cancel()
+            raise
+        finally:
+            if edit is not None and self._pending_edits.get(key) is edit:
+                del self._pending_edits[key]
+
+    async def _throttle_edit(self, edit, chat_id, priority):
+        # 等待发送名额，期间如果被取代则放弃；返回是否需要发送
+        throttle = asyncio.ensure_future(self._throttle(chat_id, priority))
+        await asyncio.wait({throttle, edit.superseded}, return_when=asyncio.FIRST_COMPLETED)
+        if edit.superseded.done():
+            if throttle.done():
+                # 已经拿到名额，仍然按取代处理，令牌不退还
+                throttle.result()
+            else:
+                throttle.cancel()
+            return False
+        throttle.result()
+        return True
+
+    @staticmethod
+    async def _final_result(edit):
+        while edit.superseded.done():
+            edit = edit.superseded.result()
+        return await asyncio.shield(edit.result)
@@ -2,14 +2,182 @@ MESSAGES = {
     'en': {
         'welcome': "Welcome to the Dice Game!",
         'balance': "Your current balance is: {} DICE",
-        # ... 其他英文消息
+        'menu_prompt': "Please choose an option:",
+        'choose_action': "Please choose an action:",
+        'balance_is': "Your current balance is: {balance} coins.",
+        'not_registered': "Account not found, please register first.",
+        'register_before_game': "Please register before starting a game.",
+        'unknown_action': "Unknown action.",
+        'error_retry': "Something went wrong, please try again later or contact support.",
+        'transaction_cancelled': "Transaction cancelled.",
+        'deposit_withdraw_prompt': "Choose how to deposit or withdraw:",
+        'bet_prompt': "Your current balance is: {balance} coins.\n"
+                      "Enter your bet (a multiple of 100, between 100 and 1000):",
+        'confirm_deposit_ton': "You will buy 10,000 DICE with {ton_amount:.6f} TON. Please confirm.",
+        'confirm_deposit_dice': "You will deposit 10,000 DICE. Please confirm.",
+        'confirm_withdraw_ton': "You will sell 10,000 DICE for {ton_amount:.6f} TON. Please confirm.",
+        'confirm_withdraw_dice': "You will withdraw 10,000 DICE. Please confirm.",
+        'game_rules': "Game rules:\n"
+                      "1. Each game has two players\n"
+                      "2. Each player rolls the dice 3 times\n"
+                      "3. The higher total wins\n"
+                      "4. The winner gets 90% of the pot\n"
+                      "5. The project takes a 3% fee\n"
+                      "6. Inviters receive a 7% reward",
+        'faq': "FAQ:\n"
+               "Q: How do I deposit?\n"
+               "A: Choose 'Deposit/Withdraw' in the main menu and pick a method.\n\n"
+               "Q: How do I invite friends?\n"
+               "A: Choose 'Referrals' in the main menu to get your invite code.\n\n"
+               "Q: What is the difference between coins and DICE tokens?\n"
+               "A: Coins are used for betting in the game, DICE tokens trade on the TON network.\n\n"
+               "Q: How do I withdraw?\n"
+               "A: Choose 'Deposit/Withdraw' in the main menu and pick a method.",
+        'help': "🎮 Game rules:\n"
+                "1. Each game has two players\n"
+                "2. Each player rolls the dice 3 times\n"
+                "3. The higher total wins\n"
+                "4. The winner gets 90% of the pot\n\n"
+                "💰 How to earn:\n"
+                "1. Play and win games\n"
+                "2. Invite friends and earn 7% of their winnings\n"
+                "3. Hold DICE tokens and share in the project's growth\n\n"
+                "For more help contact support: @customer_service",
+        'btn_start_game': "🎮 Play",
+        'btn_game_history': "📜 Game history",
+        'btn_invite_earnings': "🔗 Referrals",
+        'btn_balance': "💰 Balance",
+        'btn_deposit_withdraw': "💱 Deposit/Withdraw",
+        'btn_connect_wallet': "🔗 Connect wallet",
+        'btn_help': "❓ Help",
+        'btn_back': "Back",
+        'btn_back_to_menu': "Back to main menu",
+        'btn_confirm': "Confirm",
+        'btn_cancel': "Cancel",
+        'btn_deposit_ton': "Deposit TON",
+        'btn_deposit_dice': "Deposit DICE",
+        'btn_withdraw_ton': "Withdraw TON",
+        'btn_withdraw_dice': "Withdraw DICE",
+        'btn_deposit_ton_amount': "Deposit with TON ({ton_amount:.6f} TON)",
+        'btn_deposit_dice_amount': "Deposit 10,000 DICE",
+        'btn_withdraw_ton_amount': "Withdraw as TON ({ton_amount:.6f} TON)",
+        'btn_withdraw_dice_amount': "Withdraw 10,000 DICE",
     },
     'zh': {
         'welcome': "欢迎来到骰子游戏!",
         'balance': "您当前的余额是: {} DICE",
-        # ... 其他中文消息
+        'menu_prompt': "请选择以下操作：",
+        'choose_action': "请选择一个操作：",
+        'balance_is': "您当前的余额是：{balance} 游戏币。",
+        'not_registered': "未找到您的账户信息，请先注册。",
+        'register_before_game': "请先注册后再开始游戏。",
+        'unknown_action': "未知的操作。",
+        'error_retry': "发生错误，请稍后重试或联系客服。",
+        'transaction_cancelled': "交易已取消。",
+        'deposit_withdraw_prompt': "请选择充值或提现方式：",
+        'bet_prompt': "您当前的余额是：{balance} 游戏币。\n"
+                      "请输入您要下注的金额（必须是100的倍数，最小100，最大1000）：",
+        'confirm_deposit_ton': "您将使用 {ton_amount:.6f} TON 购买 10,000 DICE。请确认交易。",
+        'confirm_deposit_dice': "您将存入 10,000 DICE。请确认交易。",
+        'confirm_withdraw_ton': "您将出售 10,000 DICE 以获得 {ton_amount:.6f} TON。请确认交易。",
+        'confirm_withdraw_dice': "您将提取 10,000 DICE。请确认交易。",
+        'game_rules': "游戏规则:\n"
+                      "1. 每局游戏需要两名玩家参与\n"
+                      "2. 每位玩家轮流投掷3次骰子\n"
+                      "3. 总点数高的玩家获胜\n"
+                      "4. 赢家获得奖池的90%\n"
+                      "5. 项目方收取3%的手续费\n"
+                      "6. 邀请人可获得7%的奖励",
+        'faq': "常见问题:\n"
+               "Q: 如何充值?\n"
+               "A: 在主菜单中选择'充值/提现'选项,然后选择充值方式。\n\n"
+               "Q: 如何邀请朋友?\n"
+               "A: 在主菜单中选择'邀约收益'选项,获取您的邀请码。\n\n"
+               "Q: 游戏币和 DICE 代币有什么区别?\n"
+               "A: 游戏币用于游戏内下注,DICE 代币可以在 TON 网络上交易。\n\n"
+               "Q: 如何提现?\n"
+               "A: 在主菜单中选择'充值/提现'选项,然后选择提现方式。",
+        'help': "🎮 游戏规则：\n"
+                "1. 每局游戏需要两名玩家参与\n"
+                "2. 每位玩家轮流投掷3次骰子\n"
+                "3. 总点数高的玩家获胜\n"
+                "4. 赢家获得奖池的90%\n\n"
+                "💰 如何赚钱：\n"
+                "1. 参与游戏并获胜\n"
+                "2. 邀请好友注册，获得他们游戏收益的7%\n"
+                "3. 持有 DICE 代币，参与项目增值\n\n"
+                "如需更多帮助，请联系客服：@customer_service",
+        'btn_start_game': "🎮 开始游戏",
+        'btn_game_history': "📜 对战历史",
+        'btn_invite_earnings': "🔗 邀约收益",
+        'btn_balance': "💰 游戏余额",
+        'btn_deposit_withdraw': "💱 充值/提现",
+        'btn_connect_wallet': "🔗 连接钱包",
+        'btn_help': "❓ 帮助中心",
+        'btn_back': "返回",
+        'btn_back_to_menu': "返回主菜单",
+        'btn_confirm': "确认",
+        'btn_cancel': "取消",
+        'btn_deposit_ton': "充值 TON",
+        'btn_deposit_dice': "充值 DICE",
+        'btn_withdraw_ton': "提现 TON",
+        'btn_withdraw_dice': "提现 DICE",
+        'btn_deposit_ton_amount': "使用 TON 充值 ({ton_amount:.6f} TON)",
+        'btn_deposit_dice_amount': "使用 10,000 DICE 充值",
+        'btn_withdraw_ton_amount': "提现为 TON ({ton_amount:.6f} TON)",
+        'btn_withdraw_dice_amount': "提现为 10,000 DICE",
     }
 }
 
+# 固定键盘：每行是 (按钮文字的消息 key, callback_data) 列表，启动时由 templates.py 按语言构建
+KEYBOARDS = {
+    'main_menu': [
+        [('btn_start_game', 'start_game')],
+        [('btn_game_history', 'game_history')],
+        [('btn_invite_earnings', 'invite_earnings')],
+        [('btn_balance', 'balance')],
+        [('btn_deposit_withdraw', 'deposit_withdraw')],
+        [('btn_connect_wallet', 'connect_wallet')],
+        [('btn_help', 'help')],
+    ],
+    'back_to_menu': [
+        [('btn_back_to_menu', 'main_menu')],
+    ],
+    'back_to_history': [
+        [('btn_back', 'game_history')],
+        [('btn_back_to_menu', 'main_menu')],
+    ],
+    'cancel_game': [
+        [('btn_cancel', 'cancel_game')],
+    ],
+    'deposit_withdraw_options': [
+        [('btn_deposit_ton', 'deposit_ton'), ('btn_deposit_dice', 'deposit_dice')],
+        [('btn_withdraw_ton', 'withdraw_ton'), ('btn_withdraw_dice', 'withdraw_dice')],
+        [('btn_back_to_menu', 'main_menu')],
+    ],
+    # 按钮文字带汇率，渲染时传入 ton_amount
+    'deposit_withdraw': [
+        [('btn_deposit_ton_amount', 'deposit_ton')],
+        [('btn_deposit_dice_amount', 'deposit_dice')],
+        [('btn_withdraw_ton_amount', 'withdraw_ton')],
+        [('btn_withdraw_dice_amount', 'withdraw_dice')],
+        [('btn_back_to_menu', 'main_menu')],
+    ],
+    'confirm_deposit_ton': [[('btn_confirm', 'confirm_deposit_ton'), ('btn_cancel', 'cancel_transaction')]],
+    'confirm_deposit_dice': [[('btn_confirm', 'confirm_deposit_dice'), ('btn_cancel', 'cancel_transaction')]],
+    'confirm_withdraw_ton': [[('btn_confirm', 'confirm_withdraw_ton'), ('btn_cancel', 'cancel_transaction')]],
+    'confirm_withdraw_dice': [[('btn_confirm', 'confirm_withdraw_dice'), ('btn_cancel', 'cancel_transaction')]],
+}
+
+# 启动时展开成 (语言, key) -> 文本 的扁平表，缺失的 key 已经用英文补齐
+_LOOKUP = {
+    (lang, key): messages.get(key, MESSAGES['en'].get(key))
+    for lang, messages in MESSAGES.items()
+    for key in MESSAGES['en'].keys() | messages.keys()
+}
+
 def get_message(key, lang='en'):
-    return MESSAGES.get(lang, MESSAGES['en']).get(key, MESSAGES['en'].get(key, key))
\ No newline at end of file
+    text = _LOOKUP.get((lang, key))
+    if text is None:
+        text = _LOOKUP.get(('en', key), key)
+    return text
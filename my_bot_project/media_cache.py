@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import qrcode
+
+from config import MEDIA_CACHE_SIZE, QR_RENDER_WORKERS
+
+logger = logging.getLogger(__name__)
+
+def render_qr_png(data):
+    # 纯 CPU 计算，在线程池里执行
+    qr_io = BytesIO()
+    qrcode.make(data).save(qr_io, 'PNG')
+    return qr_io.getvalue()
+
+class MediaCache:
+    # key -> 渲染好的图片字节 / 上传后 Telegram 返回的 file_id，有界 LRU。
+    # 图片只在第一次用到时渲染（在线程池里，不占用事件循环），只上传一次，之后都按 file_id 发送
+
+    def __init__(self, maxsize=MEDIA_CACHE_SIZE, workers=QR_RENDER_WORKERS):
+        self.maxsize = maxsize
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media-render')
+        self._rendered = OrderedDict()
+        self._file_ids = OrderedDict()
+        self._rendering = {}  # 正在渲染的 key -> Future，同一张图并发请求时只渲染一次
+        self.renders = 0
+        self.uploads = 0
+        self.reused = 0
+
+    def _put(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    async def render(self, key, renderer, *args):
+        content = self._rendered.get(key)
+        if content is not None:
+            self._rendered.move_to_end(key)
+            return content
+        future = self._rendering.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._rendering[key] = loop.run_in_executor(self._executor, renderer, *args)
+            try:
+                content = await future
+            finally:
+                del self._rendering[key]
+            self.renders += 1
+            self._put(self._rendered, key, content)
+            return content
+        return await asyncio.shield(future)
+
+    def file_id(self, key):
+        return self._file_ids.get(key)
+
+    async def send_photo(self, bot, chat_id, key, renderer, *args, **kwargs):
+        # 有 file_id 就直接引用；没有才渲染并上传，上传成功后记下 file_id 并丢掉图片字节
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self.reused += 1
+            return await bot.send_photo(chat_id=chat_id, photo=file_id, **kwargs)
+        content = await self.render(key, renderer, *args)
+        message = await bot.send_photo(chat_id=chat_id, photo=content, **kwargs)
+        self.uploads += 1
+        if message.photo:
+            self._put(self._file_ids, key, message.photo[-1].file_id)
+            self._rendered.pop(key, None)
+        return message
+
+    def metrics(self):
+        return {
+            'renders': self.renders,
+            'uploads': self.uploads,
+            'reused': self.reused,
+            'file_ids': len(self._file_ids),
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+media_cache = MediaCache()
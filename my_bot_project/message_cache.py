@@ -0,0 +1,82 @@
+import logging
+from collections import OrderedDict
+
+from telegram.error import BadRequest
+
+from config import MESSAGE_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+class MessageFingerprintCache:
+    # (chat_id, message_id) -> 消息当前内容的指纹（文本 + 键盘 + parse_mode 的哈希），有界 LRU。
+    # 编辑前先比较指纹，内容没有变化就不调用 Bot API
+
+    def __init__(self, maxsize=MESSAGE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._fingerprints = OrderedDict()
+        self._answered = OrderedDict()  # 已经应答过的 callback query id
+        self.skipped = 0
+        self.edited = 0
+
+    def __len__(self):
+        return len(self._fingerprints)
+
+    @staticmethod
+    def fingerprint(text, reply_markup=None, parse_mode=None):
+        return hash((text, reply_markup, parse_mode))
+
+    @staticmethod
+    def key_of(query):
+        message = query.message
+        if message is not None:
+            return message.chat_id, message.message_id
+        return query.inline_message_id
+
+    def _put(self, entries, key, value):
+        entries[key] = value
+        entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def current(self, query):
+        key = self.key_of(query)
+        fingerprint = self._fingerprints.get(key)
+        if fingerprint is None and query.message is not None and query.message.text is not None:
+            # 第一次见到这条消息：以 callback 里带的消息内容为准（带格式的消息无法还原原文，不做比较）
+            if not query.message.entities:
+                fingerprint = self.fingerprint(query.message.text, query.message.reply_markup)
+        return fingerprint
+
+    def remember(self, query, fingerprint):
+        self._put(self._fingerprints, self.key_of(query), fingerprint)
+
+    def mark_answered(self, query):
+        # 返回 False 表示这个 callback 已经应答过
+        if query.id in self._answered:
+            return False
+        self._put(self._answered, query.id, True)
+        return True
+
+message_cache = MessageFingerprintCache()
+
+async def answer_callback(query, *args, **kwargs):
+    # 每个 callback query 只应答一次，重复调用直接忽略
+    if message_cache.mark_answered(query):
+        await query.answer(*args, **kwargs)
+
+async def edit_message_text(query, text, reply_markup=None, **kwargs):
+    # 代替 query.edit_message_text：内容和当前消息相同时只应答 callback，不发请求
+    fingerprint = message_cache.fingerprint(text, reply_markup, kwargs.get('parse_mode'))
+    if message_cache.current(query) == fingerprint:
+        message_cache.skipped += 1
+        await answer_callback(query)
+        return query.message
+    try:
+        result = await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    except BadRequest as e:
+        if 'Message is not modified' not in str(e):
+            raise
+        result = query.message
+    message_cache.edited += 1
+    message_cache.remember(query, fingerprint)
+    return result
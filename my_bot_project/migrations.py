@@ -0,0 +1,174 @@
+import argparse
+import logging
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, insert, inspect, select, text, update
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import CreateIndex
+
+from config import INVITER_SHARE
+from models import Base, engine, ChainCursor, User, GameHistory, InviterStats, Transaction
+from utils import normalize_address
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 记录已执行迁移的版本表，不放在 Base.metadata 里
+migration_metadata = MetaData()
+schema_version = Table(
+    'schema_version', migration_metadata,
+    Column('version', Integer, primary_key=True),
+    Column('description', String),
+    Column('applied_at', DateTime, default=func.now()),
+)
+
+def _create_tables(conn):
+    # 原来的 Base.metadata.create_all：只建不存在的表
+    for table in Base.metadata.sorted_tables:
+        table.create(conn, checkfirst=True)
+
+def _create_indexes(conn, index_names):
+    # 大表上在线建索引：PostgreSQL 使用 CREATE INDEX CONCURRENTLY，不阻塞写入。
+    # 用 IF NOT EXISTS 跳过已有的索引：新库在迁移 1 建表时已经建好，SQLite 的 get_indexes 也不返回表达式索引
+    indexes = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    concurrently = conn.dialect.name == 'postgresql'
+    for name in index_names:
+        index = indexes[name]
+        logger.info(f"Creating index {name} if missing")
+        index.dialect_options['postgresql']['concurrently'] = concurrently
+        try:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+        finally:
+            index.dialect_options['postgresql']['concurrently'] = False
+
+# 每个迁移只建固定的一组索引，不随 models.py 新增的索引变化：
+# 后面的迁移才加的列（wallet_address_raw、batch_id 等），在前面的迁移执行时还不存在
+INDEX_PACK = [
+    'ix_game_history_player_a_status_created',
+    'ix_game_history_player_b_status_created',
+    'ix_game_history_pending_creator',
+    'ix_game_history_game_id',
+    'ix_users_inviter_created',
+    'ix_users_upper_invite_code',
+]
+DEPOSIT_INDEXES = ['ix_users_wallet_address_raw', 'ix_transactions_tx_hash', 'ix_transactions_user_type_id']
+WITHDRAWAL_INDEXES = ['ix_transactions_type_status_id', 'ix_transactions_batch_id']
+
+def _index_pack(conn):
+    _create_indexes(conn, INDEX_PACK)
+
+def _inviter_stats(conn):
+    # 建表并用现有数据回填：邀请人数来自 users，历史邀约收益按结算规则（下注金额的 7%）计算
+    InviterStats.__table__.create(conn, checkfirst=True)
+    invitee = aliased(User)
+    invitee_counts = (
+        select(User.inviter_id, func.count().label('invitee_count'))
+        .where(User.inviter_id.is_not(None))
+        .group_by(User.inviter_id)
+        .subquery()
+    )
+    earnings = (
+        select(invitee.inviter_id, func.sum(GameHistory.bet_amount * INVITER_SHARE // 100).label('referral_earnings'))
+        .join(invitee, GameHistory.winner_id == invitee.id)
+        .where(invitee.inviter_id.is_not(None), GameHistory.status == 'completed')
+        .group_by(invitee.inviter_id)
+        .subquery()
+    )
+    conn.execute(
+        insert(InviterStats).from_select(
+            ['inviter_id', 'invitee_count', 'referral_earnings'],
+            select(
+                invitee_counts.c.inviter_id,
+                invitee_counts.c.invitee_count,
+                func.coalesce(earnings.c.referral_earnings, 0),
+            ).outerjoin(earnings, earnings.c.inviter_id == invitee_counts.c.inviter_id)
+        )
+    )
+
+def _add_columns(conn, table, names):
+    # 给已有的表补上 models.py 里新增的列（只加不存在的列，不改已有数据）
+    existing = {column['name'] for column in inspect(conn).get_columns(table.name)}
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        logger.info(f"Adding column {table.name}.{name}")
+        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {name} {column.type.compile(conn.dialect)}"))
+
+def _deposit_indexer(conn):
+    # 充值索引器需要的列和游标表，并回填已有钱包地址的 raw 格式
+    _add_columns(conn, User.__table__, ['wallet_address_raw'])
+    _add_columns(conn, Transaction.__table__, ['tx_hash', 'lt'])
+    ChainCursor.__table__.create(conn, checkfirst=True)
+    rows = conn.execute(select(User.id, User.wallet_address).where(User.wallet_address.is_not(None))).all()
+    for user_id, wallet_address in rows:
+        raw = normalize_address(wallet_address)
+        if raw is not None:
+            conn.execute(update(User).where(User.id == user_id).values(wallet_address_raw=raw))
+
+def _deposit_indexes(conn):
+    _create_indexes(conn, DEPOSIT_INDEXES)
+
+def _withdrawal_queue(conn):
+    _add_columns(conn, Transaction.__table__, ['asset', 'destination', 'payout', 'batch_id', 'attempts'])
+
+def _withdrawal_indexes(conn):
+    _create_indexes(conn, WITHDRAWAL_INDEXES)
+
+def _withdrawal_confirmation(conn):
+    # 广播出去的批次记下 query_id 和过期时间，重启后仍能用 processed? 核对
+    _add_columns(conn, Transaction.__table__, ['query_id', 'expires_at'])
+
+# (版本号, 描述, 迁移函数, 是否在事务中执行)
+MIGRATIONS = [
+    (1, 'baseline tables', _create_tables, True),
+    (2, 'index pack for history, pending games, invites and invite codes', _index_pack, False),
+    (3, 'inviter_stats aggregate table', _inviter_stats, True),
+    (4, 'deposit indexer cursor, wallet raw address and transaction hash columns', _deposit_indexer, True),
+    (5, 'indexes for wallet lookup and transaction hashes', _deposit_indexes, False),
+    (6, 'withdrawal queue columns', _withdrawal_queue, True),
+    (7, 'indexes for the withdrawal queue', _withdrawal_indexes, False),
+    (8, 'withdrawal query_id and expiry columns', _withdrawal_confirmation, True),
+]
+
+def current_version(bind=engine):
+    migration_metadata.create_all(bind)
+    with bind.connect() as conn:
+        return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+def upgrade(bind=engine, target=None):
+    version = current_version(bind)
+    for number, description, migrate, transactional in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        logger.info(f"Applying migration {number}: {description}")
+        if transactional:
+            with bind.begin() as conn:
+                migrate(conn)
+                conn.execute(insert(schema_version).values(version=number, description=description))
+        else:
+            with bind.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                migrate(conn)
+                conn.execute(insert(schema_version).values(version=number, description=description))
+        version = number
+    return version
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库迁移")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    upgrade_parser = subparsers.add_parser('upgrade', help="执行未应用的迁移")
+    upgrade_parser.add_argument('--target', type=int, default=None, help="迁移到指定版本")
+    subparsers.add_parser('current', help="显示当前版本")
+    subparsers.add_parser('history', help="列出所有迁移")
+    args = parser.parse_args()
+
+    if args.command == 'upgrade':
+        print(f"Database is at version {upgrade(target=args.target)}")
+    elif args.command == 'current':
+        print(current_version())
+    elif args.command == 'history':
+        version = current_version()
+        for number, description, _, _ in MIGRATIONS:
+            print(f"{'*' if number <= version else ' '} {number}: {description}")
+
+if __name__ == "__main__":
+    main()
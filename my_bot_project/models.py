@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, func
+from sqlalchemy import create_engine, BigInteger, Column, Integer, String, ForeignKey, DateTime, Index, func
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, sessionmaker
 import os
@@ -20,6 +20,7 @@ class User(Base):
     balance = Column(Integer, default=1000)
     inviter_id = Column(Integer, ForeignKey('users.id'))
     wallet_address = Column(String)
+    wallet_address_raw = Column(String)  # wallet_address 的 raw 格式（utils.normalize_address），充值入账时按它匹配发送方
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
@@ -54,9 +55,73 @@ class Transaction(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     amount = Column(Integer)
     type = Column(String)  # 'deposit' or 'withdraw'
-    status = Column(String)  # 'pending', 'completed', 'failed'
+    status = Column(String)  # 'pending', 'completed', 'failed'; 链上充值找不到用户时为 'unmatched'；提现另有 'sending', 'broadcast', 'sent', 'unresolved'
+    tx_hash = Column(String)  # 链上交易 hash，充值按它去重
+    lt = Column(BigInteger)  # 链上交易的逻辑时间
+    asset = Column(String)  # 提现：'ton' 或 'dice'
+    destination = Column(String)  # 提现的收款地址
+    payout = Column(BigInteger)  # 提现实际打出的数量（nanoTON 或带 9 位小数的 DICE）
+    batch_id = Column(String)  # 提现所在的打款批次
+    attempts = Column(Integer, default=0)  # 提现发送次数
+    query_id = Column(String)  # 提现批次签名用的 highload query_id（十进制字符串，可能超出 BIGINT 范围）
+    expires_at = Column(BigInteger)  # 该 query_id 的过期时间（unix 秒）
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
 
     user = relationship("User")
-Base.metadata.create_all(engine)
\ No newline at end of file
+
+class ChainCursor(Base):
+    # 链上索引器的进度：已经处理到的最后一笔交易（逻辑时间 + hash）
+    __tablename__ = 'chain_cursors'
+
+    name = Column(String, primary_key=True)
+    lt = Column(BigInteger, default=0, nullable=False)
+    tx_hash = Column(String)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+class BalanceAccrual(Base):
+    # 项目方手续费和邀约收益先追加到这里，由后台任务定期合并进 users.balance，
+    # 避免每局结算都去锁同一行
+    __tablename__ = 'balance_accruals'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), index=True)
+    amount = Column(Integer)
+    kind = Column(String)  # 'fee' or 'referral'
+    game_id = Column(String)
+    created_at = Column(DateTime, default=func.now())
+
+class InviterStats(Base):
+    # 每个邀请人的汇总数据，在注册和合并邀约收益时增量维护，邀约页面不再扫描全表
+    __tablename__ = 'inviter_stats'
+
+    inviter_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    invitee_count = Column(Integer, default=0, nullable=False)
+    referral_earnings = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+
+# 热点查询使用的索引，由 migrations.py 创建；新增的索引要写进新迁移自己的索引列表
+# get_user_game_history：(player_a_id OR player_b_id) + status，按 created_at 倒序
+Index('ix_game_history_player_a_status_created', GameHistory.player_a_id, GameHistory.status, GameHistory.created_at, GameHistory.id)
+Index('ix_game_history_player_b_status_created', GameHistory.player_b_id, GameHistory.status, GameHistory.created_at, GameHistory.id)
+# get_user_pending_games：只索引等待挑战的对局
+Index(
+    'ix_game_history_pending_creator', GameHistory.player_a_id, GameHistory.created_at,
+    postgresql_where=(GameHistory.player_b_id.is_(None)) & (GameHistory.status == 'pending'),
+    sqlite_where=(GameHistory.player_b_id.is_(None)) & (GameHistory.status == 'pending'),
+)
+# 结算时按 game_id 更新对局记录
+Index('ix_game_history_game_id', GameHistory.game_id)
+# get_invited_users
+Index('ix_users_inviter_created', User.inviter_id, User.created_at)
+# get_user_by_invite_code 比较 upper(invite_code)
+Index('ix_users_upper_invite_code', func.upper(User.invite_code))
+# 充值索引器按发送方地址找用户
+Index('ix_users_wallet_address_raw', User.wallet_address_raw)
+# 同一笔链上交易只入账一次
+Index('ix_transactions_tx_hash', Transaction.tx_hash, unique=True)
+# check_deposit / get_user_transactions：按用户取最近的记录
+Index('ix_transactions_user_type_id', Transaction.user_id, Transaction.type, Transaction.id)
+# 提现队列：按 id 顺序取 pending 记录；按批次更新状态
+Index('ix_transactions_type_status_id', Transaction.type, Transaction.status, Transaction.id)
+Index('ix_transactions_batch_id', Transaction.batch_id)
\ No newline at end of file
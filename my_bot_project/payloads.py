@@ -0,0 +1,73 @@
+from functools import lru_cache
+
+from tonsdk.boc import Cell
+from tonsdk.utils import Address, to_nano
+
+from config import PAYLOAD_CACHE_SIZE
+
+# 合约消息的 op code
+OP_BUY = 2
+OP_SELL = 3
+OP_DEPOSIT = 4
+OP_WITHDRAW = 5
+
+# Cell 最多 1023 位，tonsdk 的 BitString 底层是 128 字节的 bytearray
+CELL_BYTES = 128
+
+# 这里返回的 Cell 会被缓存、在多次调用之间共享，调用方只能读取（作为消息体、序列化），不能修改
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def nano(value):
+    # to_nano 用 999 位精度的 Decimal 计算，很慢；报价在汇率缓存有效期内是同一批数值
+    return to_nano(value, 'ton')
+
+def coins_bits(amount):
+    # 和 BitString.write_coins 相同的编码：4 位字节数 + 按字节对齐的金额，返回 (值, 位数)
+    if amount < 0:
+        raise ValueError(f"Negative coins amount: {amount}")
+    length = (amount.bit_length() + 7) // 8
+    if length > 15:
+        raise ValueError(f"Coins amount too large: {amount}")
+    return length << length * 8 | amount, 4 + length * 8
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def address_bits(address):
+    # 和 BitString.write_address 相同的编码：addr_std$10、无 anycast、8 位 workchain、256 位 hash
+    address = Address(address)
+    hash_part = int.from_bytes(address.hash_part, 'big')
+    return (0b100 << 8 | address.wc & 0xff) << 256 | hash_part, 267
+
+def build_cell(op, *fields):
+    # 快速路径：op 和各字段（(值, 位数)）先拼成一个整数，再一次性写进 Cell 的底层数组，不逐位写入
+    value, bits = op, 32
+    for field_value, field_bits in fields:
+        value = value << field_bits | field_value
+        bits += field_bits
+    cell = Cell()
+    cell.bits.array = bytearray((value << CELL_BYTES * 8 - bits).to_bytes(CELL_BYTES, 'big'))
+    cell.bits.cursor = bits
+    return cell
+
+# 以下构造函数的金额参数都是 nano 单位的整数，相同参数直接返回缓存的 Cell
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def buy(ton_nano):
+    return build_cell(OP_BUY, coins_bits(ton_nano))
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def sell(amount_nano, ton_nano):
+    return build_cell(OP_SELL, coins_bits(amount_nano), coins_bits(ton_nano))
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def deposit(amount_nano):
+    return build_cell(OP_DEPOSIT, coins_bits(amount_nano))
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def withdraw(amount_nano, recipient=None):
+    if recipient is None:
+        return build_cell(OP_WITHDRAW, coins_bits(amount_nano))
+    return build_cell(OP_WITHDRAW, coins_bits(amount_nano), address_bits(recipient))
+
+@lru_cache(maxsize=PAYLOAD_CACHE_SIZE)
+def boc(cell):
+    # 按 Cell 对象缓存序列化结果（Cell 没有定义 __eq__，按对象身份区分），配合上面缓存的 Cell 使用
+    return cell.to_boc(False)
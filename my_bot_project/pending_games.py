@@ -0,0 +1,211 @@
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from sqlalchemy import func, insert, select, update
+
+from config import PENDING_GAME_CACHE_SIZE, PENDING_GAME_TTL, PENDING_GAME_SWEEP_BATCH
+from database import get_db_session, debit_statement
+from models import User, GameHistory
+from user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+class PendingGameStore:
+    # 等待挑战的对局以 game_history 中 status='pending' 的记录为准（重启不丢、多进程共享），
+    # 内存里只保留一个有界的 game_id -> game 索引，命中时 O(1) 返回
+
+    def __init__(self, maxsize=PENDING_GAME_CACHE_SIZE, ttl=PENDING_GAME_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._games = OrderedDict()  # game_id -> (expires_at, game)
+
+    def __len__(self):
+        return len(self._games)
+
+    def _remember(self, game):
+        self._games[game['game_id']] = (time.monotonic() + self.ttl, game)
+        self._games.move_to_end(game['game_id'])
+        while len(self._games) > self.maxsize:
+            self._games.popitem(last=False)
+        return game
+
+    def discard(self, game_id):
+        self._games.pop(game_id, None)
+
+    async def create(self, game_id, creator, bet_amount):
+        # 扣除下注金额并写入 pending 记录，在同一个事务里完成；余额不足返回 None
+        async with get_db_session() as session:
+            balance = (await session.execute(debit_statement(creator.telegram_id, bet_amount))).scalar()
+            if balance is None:
+                return None
+            await session.execute(
+                insert(GameHistory).values(
+                    game_id=game_id,
+                    player_a_id=creator.id,
+                    bet_amount=bet_amount,
+                    player_a_score=0,
+                    player_b_score=0,
+                    win_amount=0,
+                    status='pending',
+                )
+            )
+        user_cache.update(creator.telegram_id, balance=balance)
+        return self._remember({
+            'game_id': game_id,
+            'bet_amount': bet_amount,
+            'creator_id': creator.id,
+            'creator_score': 0,
+            'challenger_id': None,
+        })
+
+    async def get(self, game_id, fresh=False):
+        # fresh=True 时跳过内存索引直接读库（多进程部署时创建者的得分可能是别的 worker 写入的）
+        entry = None if fresh else self._games.get(game_id)
+        if entry is not None:
+            expires_at, game = entry
+            if expires_at >= time.monotonic():
+                self._games.move_to_end(game_id)
+                return game
+            self.discard(game_id)
+
+        async with get_db_session() as session:
+            result = await session.execute(
+                select(GameHistory.game_id, GameHistory.bet_amount, GameHistory.player_a_id,
+                       GameHistory.player_a_score, GameHistory.player_b_id)
+                .where(GameHistory.game_id == game_id, GameHistory.status == 'pending')
+            )
+            row = result.first()
+        if row is None:
+            return None
+        return self._remember({
+            'game_id': row.game_id,
+            'bet_amount': row.bet_amount,
+            'creator_id': row.player_a_id,
+            'creator_score': row.player_a_score,
+            'challenger_id': row.player_b_id,
+        })
+
+    async def set_creator_score(self, game_id, creator_score):
+        async with get_db_session() as session:
+            await session.execute(
+                update(GameHistory)
+                .where(GameHistory.game_id == game_id, GameHistory.status == 'pending')
+                .values(player_a_score=creator_score)
+                .execution_options(synchronize_session=False)
+            )
+        game = await self.get(game_id)
+        if game is not None:
+            game['creator_score'] = creator_score
+        return game
+
+    async def join(self, game_id, challenger):
+        # 扣除挑战者的下注金额并占用对局，同一个事务里完成，避免两个人同时加入同一局。
+        # 返回 (game, reason)，reason 为 None 表示成功，否则是 'not_found' 或 'insufficient_balance'
+        game = await self.get(game_id)
+        if game is None or game['creator_id'] == challenger.id:
+            return None, 'not_found'
+        async with get_db_session() as session:
+            claimed = await session.execute(
+                update(GameHistory)
+                .where(
+                    GameHistory.game_id == game_id,
+                    GameHistory.status == 'pending',
+                    GameHistory.player_b_id.is_(None),
+                )
+                .values(player_b_id=challenger.id)
+                .returning(GameHistory.id)
+                .execution_options(synchronize_session=False)
+            )
+            if claimed.first() is None:
+                self.discard(game_id)
+                return None, 'not_found'
+            balance = (await session.execute(debit_statement(challenger.telegram_id, game['bet_amount']))).scalar()
+            if balance is None:
+                await session.rollback()
+                return game, 'insufficient_balance'
+        user_cache.update(challenger.telegram_id, balance=balance)
+        game['challenger_id'] = challenger.id
+        return game, None
+
+    async def cancel(self, game_id, creator):
+        # 创建者取消对局：标记为 cancelled 并退还下注金额；对局已被加入或不存在时返回 None
+        async with get_db_session() as session:
+            cancelled = await session.execute(
+                update(GameHistory)
+                .where(
+                    GameHistory.game_id == game_id,
+                    GameHistory.player_a_id == creator.id,
+                    GameHistory.status == 'pending',
+                    GameHistory.player_b_id.is_(None),
+                )
+                .values(status='cancelled')
+                .returning(GameHistory.bet_amount)
+                .execution_options(synchronize_session=False)
+            )
+            bet_amount = cancelled.scalar()
+            if bet_amount is None:
+                return None
+            balance = (await session.execute(
+                update(User)
+                .where(User.id == creator.id)
+                .values(balance=User.balance + bet_amount)
+                .returning(User.balance)
+                .execution_options(synchronize_session=False)
+            )).scalar()
+        self.discard(game_id)
+        user_cache.update(creator.telegram_id, balance=balance)
+        return bet_amount
+
+    async def expire_stale(self, batch_size=PENDING_GAME_SWEEP_BATCH):
+        # 一条语句完成一批过期对局：标记为 expired，并把创建者的下注金额按用户汇总退还。
+        # 只清理还没有人加入的对局：挑战者加入后对局仍是 pending（正在投骰子），不能中途退款
+        stale = (
+            select(GameHistory.id)
+            .where(
+                GameHistory.status == 'pending',
+                GameHistory.player_b_id.is_(None),
+                GameHistory.created_at < func.now() - timedelta(seconds=self.ttl),
+            )
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        expired = (
+            update(GameHistory)
+            .where(GameHistory.id.in_(stale.scalar_subquery()))
+            .values(status='expired')
+            .returning(GameHistory.player_a_id, GameHistory.bet_amount)
+            .cte('expired')
+        )
+        refunds = (
+            select(
+                expired.c.player_a_id.label('user_id'),
+                func.sum(expired.c.bet_amount).label('amount'),
+                func.count().label('stakes'),
+            )
+            .group_by(expired.c.player_a_id)
+            .cte('refunds')
+        )
+        async with get_db_session() as session:
+            result = await session.execute(
+                update(User)
+                .where(User.id == refunds.c.user_id)
+                .values(balance=User.balance + refunds.c.amount)
+                .returning(User.id, User.balance, refunds.c.stakes)
+                .execution_options(synchronize_session=False)
+            )
+            refunded = result.all()
+        for user_id, balance, _ in refunded:
+            user_cache.update_by_id(user_id, balance=balance)
+        return sum(stakes for _, _, stakes in refunded)
+
+pending_game_store = PendingGameStore()
+
+async def expire_pending_games_job(context):
+    try:
+        refunded = await pending_game_store.expire_stale()
+        if refunded:
+            logger.info(f"Expired pending games, refunded {refunded} stakes")
+    except Exception as e:
+        logger.error(f"Error expiring pending games: {e}", exc_info=True)
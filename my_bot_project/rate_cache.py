@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+
+from config import RATE_CACHE_MAX_STALE, RATE_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+class CachedValue:
+    # 链上只读数据（汇率、池子信息）的进程内缓存：
+    # - TTL 内直接返回缓存值；
+    # - 过期但不超过 max_stale 时先返回旧值，后台刷新（stale-while-revalidate）；
+    # - 同一时刻最多只有一个刷新请求，并发的调用者共享它的结果（single-flight）；
+    # - 没有可用的旧值时才等待刷新完成
+
+    def __init__(self, name, fetch, ttl=RATE_CACHE_TTL, max_stale=RATE_CACHE_MAX_STALE):
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.value = None
+        self.updated = None
+        self._refreshing = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def age(self):
+        if self.updated is None:
+            return None
+        return time.monotonic() - self.updated
+
+    async def _fetch(self):
+        try:
+            value = await self.fetch()
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.fetches += 1
+            self._refreshing = None
+        self.value = value
+        self.updated = time.monotonic()
+        return value
+
+    def refresh(self):
+        # 返回正在进行的刷新；没有的话新建一个
+        if self._refreshing is None:
+            self._refreshing = asyncio.ensure_future(self._fetch())
+            self._refreshing.add_done_callback(self._log_failure)
+        return self._refreshing
+
+    def _log_failure(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Failed to refresh {self.name}: {task.exception()}")
+
+    async def get(self):
+        age = self.age()
+        if age is not None and age < self.ttl:
+            self.hits += 1
+            return self.value
+        if age is not None and age < self.ttl + self.max_stale:
+            self.stale_hits += 1
+            self.refresh()
+            return self.value
+        self.misses += 1
+        return await asyncio.shield(self.refresh())
+
+    def metrics(self):
+        age = self.age()
+        return {
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'fetches': self.fetches,
+            'errors': self.errors,
+            'age': round(age, 1) if age is not None else None,
+        }
+
+async def prefetch_job(context):
+    # 定期在后台刷新，用户点击菜单时缓存总是新的；job data 是要刷新的 CachedValue 列表
+    # 失败由 CachedValue 记录日志，旧值继续可用
+    await asyncio.gather(*(cache.refresh() for cache in context.job.data), return_exceptions=True)
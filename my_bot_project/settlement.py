@@ -0,0 +1,112 @@
+import logging
+from dataclasses import dataclass, field
+
+from sqlalchemy import case, update
+
+from accruals import add_accruals
+from config import PROJECT_ACCOUNT_ID, WINNER_SHARE, INVITER_SHARE, PROJECT_SHARE
+from database import get_db_session
+from models import User, GameHistory
+from user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class Settlement:
+    game_id: str
+    creator: User
+    challenger: User
+    creator_score: int
+    challenger_score: int
+    bet_amount: int
+    winner: User = None
+    loser: User = None
+    win_amount: int = 0
+    inviter_amount: int = 0
+    project_amount: int = 0
+    # user_id -> 本局需要直接增加的余额（赢家奖金或平局退款）
+    credits: dict = field(default_factory=dict)
+    # 手续费和邀约收益走追加记录，不直接更新热点行：[(user_id, amount, kind, game_id), ...]
+    accruals: list = field(default_factory=list)
+
+    @property
+    def is_tie(self):
+        return self.winner is None
+
+    def score_of(self, user):
+        return self.creator_score if user.id == self.creator.id else self.challenger_score
+
+    def opponent_score_of(self, user):
+        return self.challenger_score if user.id == self.creator.id else self.creator_score
+
+def _credit(credits, user_id, amount):
+    if user_id is not None and amount:
+        credits[user_id] = credits.get(user_id, 0) + amount
+
+def compute_settlement(game_id, creator, challenger, creator_score, challenger_score, bet_amount):
+    settlement = Settlement(game_id, creator, challenger, creator_score, challenger_score, bet_amount)
+
+    if challenger_score == creator_score:
+        # 平局，双方退还下注金额
+        _credit(settlement.credits, creator.id, bet_amount)
+        _credit(settlement.credits, challenger.id, bet_amount)
+        return settlement
+
+    if challenger_score > creator_score:
+        settlement.winner, settlement.loser = challenger, creator
+    else:
+        settlement.winner, settlement.loser = creator, challenger
+
+    settlement.win_amount = bet_amount * WINNER_SHARE // 100
+    settlement.inviter_amount = bet_amount * INVITER_SHARE // 100
+    settlement.project_amount = bet_amount * PROJECT_SHARE // 100
+
+    # 赢家拿回自己的下注金额，再加上对手下注的 90%
+    _credit(settlement.credits, settlement.winner.id, bet_amount + settlement.win_amount)
+    settlement.accruals.append((settlement.winner.inviter_id, settlement.inviter_amount, 'referral', game_id))
+    settlement.accruals.append((PROJECT_ACCOUNT_ID, settlement.project_amount, 'fee', game_id))
+    return settlement
+
+async def apply_settlement(settlement):
+    # 所有余额变动和对战记录在同一个事务里提交。
+    # 先把 pending 记录改成最终状态，改不到说明对局已被结算、取消或过期，不再发放任何金额
+    balances = []
+    async with get_db_session() as session:
+        result = await session.execute(
+            update(GameHistory)
+            .where(
+                GameHistory.game_id == settlement.game_id,
+                GameHistory.status == 'pending',
+                GameHistory.player_b_id == settlement.challenger.id,
+            )
+            .values(
+                player_a_score=settlement.creator_score,
+                player_b_score=settlement.challenger_score,
+                winner_id=settlement.winner.id if settlement.winner else None,
+                win_amount=settlement.win_amount,
+                status='tie' if settlement.is_tie else 'completed',
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            logger.warning(f"Game {settlement.game_id} is no longer pending, skipping settlement")
+            return None
+
+        if settlement.credits:
+            result = await session.execute(
+                update(User)
+                .where(User.id.in_(settlement.credits))
+                .values(balance=User.balance + case(settlement.credits, value=User.id, else_=0))
+                .returning(User.id, User.balance)
+                .execution_options(synchronize_session=False)
+            )
+            balances = result.all()
+        await add_accruals(session, settlement.accruals)
+    for user_id, balance in balances:
+        user_cache.update_by_id(user_id, balance=balance)
+    logger.info(f"Game {settlement.game_id} settled: {settlement.credits}")
+    return settlement
+
+async def settle_game(game_id, creator, challenger, creator_score, challenger_score, bet_amount):
+    settlement = compute_settlement(game_id, creator, challenger, creator_score, challenger_score, bet_amount)
+    return await apply_settlement(settlement)
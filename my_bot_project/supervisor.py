@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import contextlib
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+
+from telegram import Bot, Update
+from telegram.error import NetworkError, TimedOut
+
+from config import (
+    BOT_API_BASE_URL, BOT_RUN_MODE, SHARD_POLL_TIMEOUT, SHARD_WORKERS, TELEGRAM_TOKEN,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_URL,
+)
+from webhook import WebhookServer
+
+logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 每次从 inbox 里最多连续取出的消息数
+WORKER_DRAIN_BATCH = 256
+
+def shard_key(data):
+    # 按发起操作的用户分片：message.from / callback_query.from 等，没有用户时退回到 chat，再退回到 update_id
+    for value in data.values():
+        if isinstance(value, dict):
+            sender = value.get('from') or value.get('user')
+            if sender:
+                return sender['id']
+            chat = value.get('chat')
+            if chat:
+                return chat['id']
+    return data.get('update_id', 0)
+
+def shard_of(telegram_id, workers):
+    return int(telegram_id) % workers
+
+def _drain(inbox):
+    messages = [inbox.get()]
+    try:
+        while len(messages) < WORKER_DRAIN_BATCH:
+            messages.append(inbox.get_nowait())
+    except queue.Empty:
+        pass
+    return messages
+
+async def _serve_worker(application, inbox):
+    from user_cache import user_cache
+
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
+        try:
+            while True:
+                for message in await loop.run_in_executor(None, _drain, inbox):
+                    if message is None:
+                        return
+                    if message[0] == 'update':
+                        update = Update.de_json(message[1], application.bot)
+                        if update is not None:
+                            await application.update_queue.put(update)
+                    elif message[0] == 'invalidate':
+                        user_cache.drop(message[1], message[2])
+        finally:
+            await application.stop()
+            # run_polling 会自己调用 post_shutdown，手动管理生命周期时需要补上
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+def _worker_main(index, workers, inbox, outbox):
+    # worker 进程：和单进程模式相同的 application，只是 update 来自 supervisor。
+    # Ctrl+C 由 supervisor 处理，worker 收到 inbox 里的 None 后退出
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from bot import build_application
+    from user_cache import user_cache
+
+    user_cache.publish = lambda telegram_id, user_id: outbox.put(('invalidate', index, telegram_id, user_id))
+    application = build_application(run_jobs=index == 0, updater=False, workers=workers)
+    asyncio.run(_serve_worker(application, inbox))
+
+class Supervisor:
+    # 接收 update（长轮询或 webhook），按用户 telegram_id 分发给固定的 worker 进程：
+    # 同一用户的 user_data、对局状态和用户缓存都只在一个进程里。
+    # 跨用户的数据（待挑战对局、余额）在数据库里；某个 worker 修改了用户数据时，
+    # 通过 supervisor 通知其他 worker 丢弃该用户的缓存
+
+    def __init__(self, workers=SHARD_WORKERS):
+        self.workers = workers
+        self._ctx = multiprocessing.get_context('spawn')
+        self.inboxes = [self._ctx.Queue() for _ in range(workers)]
+        self.outbox = self._ctx.Queue()
+        self.processes = [None] * workers
+        self.routed = [0] * workers
+        self.restarts = 0
+        self._relay_thread = None
+        self._offset = 0
+
+    def _spawn(self, index):
+        process = self._ctx.Process(
+            target=_worker_main, args=(index, self.workers, self.inboxes[index], self.outbox),
+            name=f'bot-worker-{index}', daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start_workers(self):
+        for index in range(self.workers):
+            self._spawn(index)
+        self._relay_thread = threading.Thread(target=self._relay, name='cache-relay', daemon=True)
+        self._relay_thread.start()
+        logger.info(f"Started {self.workers} bot workers")
+
+    def check_workers(self):
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self.restarts += 1
+                self._spawn(index)
+
+    def stop_workers(self, timeout=10):
+        for inbox in self.inboxes:
+            inbox.put(None)
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self.outbox.put(None)
+        self._relay_thread.join(timeout)
+        logger.info(f"Workers stopped, routed updates per worker: {self.routed}")
+
+    def _relay(self):
+        # 把某个 worker 的缓存失效通知转发给其他所有 worker
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                return
+            _, origin, telegram_id, user_id = message
+            for index, inbox in enumerate(self.inboxes):
+                if index != origin:
+                    inbox.put(('invalidate', telegram_id, user_id))
+
+    def route(self, data):
+        index = shard_of(shard_key(data), self.workers)
+        self.inboxes[index].put(('update', data))
+        self.routed[index] += 1
+
+    async def poll(self, bot):
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=self._offset, timeout=SHARD_POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES,
+                )
+            except TimedOut:
+                continue
+            except NetworkError as e:
+                logger.warning(f"Error fetching updates: {e}")
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                self.route(update.to_dict())
+                self._offset = update.update_id + 1
+
+    async def run(self, mode=BOT_RUN_MODE):
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+        self.start_workers()
+        bot = Bot(TELEGRAM_TOKEN, base_url=BOT_API_BASE_URL)
+        server = None
+        poller = None
+        try:
+            async with bot:
+                if mode == 'webhook':
+                    server = ShardWebhookServer(self)
+                    await server.start()
+                    if WEBHOOK_URL:
+                        await bot.set_webhook(
+                            url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                            secret_token=WEBHOOK_SECRET or None,
+                            max_connections=WEBHOOK_MAX_CONNECTIONS,
+                            allowed_updates=Update.ALL_TYPES,
+                        )
+                else:
+                    await bot.delete_webhook()
+                    poller = asyncio.create_task(self.poll(bot))
+
+                while not stop.is_set():
+                    try:
+                        await asyncio.wait_for(stop.wait(), timeout=1)
+                    except asyncio.TimeoutError:
+                        self.check_workers()
+                    if poller is not None and poller.done():
+                        poller.result()
+
+                if poller is not None:
+                    poller.cancel()
+                    with contextlib.suppress(asyncio.CancelledError):
+                        await poller
+                    # 确认已经分发出去的 update，避免重启后重复处理
+                    if self._offset:
+                        await bot.get_updates(offset=self._offset, timeout=0, limit=1)
+        finally:
+            if server is not None:
+                await server.stop()
+            self.stop_workers()
+
+class ShardWebhookServer(WebhookServer):
+    # webhook 模式下 supervisor 不解析 update，收到的 JSON 直接分发给 worker
+
+    def __init__(self, supervisor, **kwargs):
+        super().__init__(None, **kwargs)
+        self.supervisor = supervisor
+
+    def backlog(self):
+        # worker 自己通过 update 处理器限制并发，这里不做积压判断
+        return 0
+
+    def enqueue(self, data):
+        if not isinstance(data, dict) or 'update_id' not in data:
+            return False
+        self.supervisor.route(data)
+        return True
+
+def main():
+    parser = argparse.ArgumentParser(description="多进程运行机器人：按用户分片到多个 worker 进程")
+    parser.add_argument('--workers', type=int, default=SHARD_WORKERS)
+    parser.add_argument('--mode', choices=['polling', 'webhook'], default=BOT_RUN_MODE)
+    args = parser.parse_args()
+    asyncio.run(Supervisor(args.workers).run(args.mode))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+from string import Formatter
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from config import DEFAULT_LANGUAGE
+from locales import KEYBOARDS, MESSAGES, get_message
+
+class Template:
+    # 启动时解析一次：不带参数的模板渲染时直接返回原字符串，不产生新对象
+    __slots__ = ('text', 'static')
+
+    def __init__(self, text):
+        self.text = text
+        self.static = all(field is None for _, field, _, _ in Formatter().parse(text))
+
+    def render(self, *args, **kwargs):
+        if self.static:
+            return self.text
+        return self.text.format(*args, **kwargs)
+
+class TemplateRegistry:
+    # 所有语言的消息模板和固定键盘都在启动时构建好；
+    # 键盘是 PTB 的不可变对象，可以在所有请求之间共享
+
+    def __init__(self, messages=MESSAGES, keyboards=KEYBOARDS, default_language=DEFAULT_LANGUAGE):
+        self.default_language = default_language
+        self._messages = {
+            (lang, key): Template(get_message(key, lang))
+            for lang in messages
+            for key in messages['en'].keys() | messages[lang].keys()
+        }
+        self._keyboards = {}
+        self._keyboard_specs = {}
+        for lang in messages:
+            for name, rows in keyboards.items():
+                spec = tuple(
+                    tuple((self._messages[(lang, label)], callback_data) for label, callback_data in row)
+                    for row in rows
+                )
+                if all(label.static for row in spec for label, _ in row):
+                    self._keyboards[(lang, name)] = self._build(spec)
+                else:
+                    self._keyboard_specs[(lang, name)] = spec
+
+    @staticmethod
+    def _build(spec, **params):
+        return InlineKeyboardMarkup(tuple(
+            tuple(InlineKeyboardButton(label.render(**params), callback_data=callback_data) for label, callback_data in row)
+            for row in spec
+        ))
+
+    def message(self, key, lang=None):
+        lang = lang or self.default_language
+        template = self._messages.get((lang, key))
+        if template is None:
+            template = self._messages[('en', key)]
+        return template
+
+    def render(self, key, *args, lang=None, **kwargs):
+        return self.message(key, lang).render(*args, **kwargs)
+
+    def keyboard(self, name, lang=None, **params):
+        # 固定键盘直接返回共享对象；按钮文字带参数的键盘按预先解析好的模板渲染
+        lang = lang or self.default_language
+        if lang not in MESSAGES:
+            lang = 'en'
+        keyboard = self._keyboards.get((lang, name))
+        if keyboard is not None:
+            return keyboard
+        return self._build(self._keyboard_specs[(lang, name)], **params)
+
+templates = TemplateRegistry()
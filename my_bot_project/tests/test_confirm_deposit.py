@@ -0,0 +1,126 @@
+# confirm_transaction 的充值分支：立即把消息改成“已提交”并返回（不占住该用户的 update 顺序），
+# 在后台任务里等待上链，再用一次编辑报告交易 hash 或失败
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('telegram')
+pytest.importorskip('aiosqlite')
+
+os.environ.setdefault('DB_URL', 'sqlite://')
+os.environ.setdefault('ASYNC_DB_URL', 'sqlite+aiosqlite://')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot
+from wallet_sender import WalletSendError
+
+WALLET = object()
+
+class Harness:
+
+    def __init__(self, monkeypatch, send):
+        self.edits = []
+        self.tasks = []
+        self.sent = []
+        self.send = send
+        monkeypatch.setattr(bot, 'get_current_user', self.current_user)
+        monkeypatch.setattr(bot, 'edit_message_text', self.edit)
+        monkeypatch.setattr(bot, 'get_exchange_rate', self.exchange_rate)
+        monkeypatch.setattr(bot, 'deposit_wallet', lambda: WALLET)
+        monkeypatch.setattr(bot, 'deposit_ton', self.deposit_ton)
+        monkeypatch.setattr(bot, 'deposit_dice', self.deposit_dice)
+        self.update = SimpleNamespace(callback_query=SimpleNamespace(data='confirm_deposit_ton'))
+        self.context = SimpleNamespace(
+            user_data={'state': 'x'},
+            application=SimpleNamespace(create_task=self.create_task),
+        )
+
+    async def current_user(self, update, context):
+        return SimpleNamespace(id=1, telegram_id='1', balance=0)
+
+    async def edit(self, query, text, reply_markup=None, **kwargs):
+        self.edits.append(text)
+
+    async def exchange_rate(self):
+        return 2_000_000_000
+
+    async def deposit_ton(self, wallet, expected_ton):
+        self.sent.append(('ton', wallet, expected_ton))
+        return await self.send()
+
+    async def deposit_dice(self, wallet):
+        self.sent.append(('dice', wallet, None))
+        return await self.send()
+
+    def create_task(self, coroutine, update=None):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.append(task)
+        return task
+
+    async def confirm(self, action):
+        await bot.confirm_transaction(self.update, self.context, action)
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+def test_returns_before_send_completes_then_reports_hash(monkeypatch):
+    async def scenario():
+        released = asyncio.Event()
+
+        async def send():
+            await released.wait()
+            return 'abc123'
+
+        harness = Harness(monkeypatch, send)
+        await harness.confirm('deposit_ton')
+        # 处理函数已经返回，发送还在等待上链
+        assert harness.edits == ["充值已提交，正在等待链上确认……"]
+        assert harness.context.user_data == {}
+        await asyncio.sleep(0)
+        assert harness.sent == [('ton', WALLET, 2.0)]
+        assert harness.edits == ["充值已提交，正在等待链上确认……"]
+        released.set()
+        await asyncio.gather(*harness.tasks)
+        assert harness.edits[-1] == "交易已上链（abc123），确认后余额会自动更新。"
+
+    run(scenario())
+
+def test_wallet_send_error_reported(monkeypatch):
+    async def scenario():
+        async def send():
+            raise WalletSendError("seqno expired too many times")
+
+        harness = Harness(monkeypatch, send)
+        await harness.confirm('deposit_dice')
+        await asyncio.gather(*harness.tasks)
+        assert harness.edits == ["充值已提交，正在等待链上确认……", "交易失败，请重试。"]
+
+    run(scenario())
+
+def test_unexpected_error_reported(monkeypatch):
+    async def scenario():
+        async def send():
+            raise ConnectionError("toncenter unreachable")
+
+        harness = Harness(monkeypatch, send)
+        await harness.confirm('deposit_ton')
+        await asyncio.gather(*harness.tasks)
+        assert harness.edits[-1] == "交易过程中发生错误，请重试或联系客服。"
+
+    run(scenario())
+
+def test_no_deposit_wallet_configured(monkeypatch):
+    async def scenario():
+        async def send():
+            raise AssertionError("nothing should be sent")
+
+        harness = Harness(monkeypatch, send)
+        monkeypatch.setattr(bot, 'deposit_wallet', lambda: None)
+        await harness.confirm('deposit_ton')
+        assert harness.edits == ["充值暂不可用，请联系客服。"]
+        assert harness.tasks == [] and harness.sent == []
+
+    run(scenario())
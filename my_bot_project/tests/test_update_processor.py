@@ -0,0 +1,64 @@
+# PerUserUpdateProcessor：一个用户排队的 update 不能占用其他用户的并发名额
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+
+from update_processor import PerUserUpdateProcessor
+
+HANDLER_SECONDS = 0.2
+
+def make_update(update_id, telegram_id):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': telegram_id, 'type': 'private'},
+            'from': {'id': telegram_id, 'is_bot': False, 'first_name': str(telegram_id)},
+            'text': 'x',
+        },
+    }, None)
+
+async def handler(finished, key):
+    await asyncio.sleep(HANDLER_SECONDS)
+    finished.append((key, time.perf_counter()))
+
+async def latency_of_b(queued_for_a):
+    processor = PerUserUpdateProcessor(max_concurrent_updates=4, queue_limit=100)
+    finished = []
+    started = time.perf_counter()
+    tasks = [
+        asyncio.create_task(processor.process_update(make_update(n, 1), handler(finished, 'a')))
+        for n in range(queued_for_a)
+    ]
+    await asyncio.sleep(0)
+    tasks.append(asyncio.create_task(processor.process_update(make_update(1000, 2), handler(finished, 'b'))))
+    await asyncio.gather(*tasks)
+    return next(at for key, at in finished if key == 'b') - started
+
+def test_semaphore_sized_by_queue_limit():
+    processor = PerUserUpdateProcessor(max_concurrent_updates=4, queue_limit=100)
+    assert processor.max_concurrent_updates == 100
+    assert processor._semaphore._value == 100
+    assert processor.running_limit == 4
+
+def test_other_user_latency_independent_of_queue():
+    alone = asyncio.run(latency_of_b(0))
+    behind_queue = asyncio.run(latency_of_b(6))
+    assert behind_queue < alone + HANDLER_SECONDS / 2, (alone, behind_queue)
+
+def test_same_user_in_order():
+    async def run():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=4, queue_limit=100)
+        finished = []
+        await asyncio.gather(*(
+            processor.process_update(make_update(n, 1), handler(finished, n)) for n in range(5)
+        ))
+        return [key for key, _ in finished]
+
+    assert asyncio.run(run()) == list(range(5))
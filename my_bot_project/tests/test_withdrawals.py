@@ -0,0 +1,61 @@
+# HighloadWalletProvider.sign_batch：记录的 query_id / 过期时间必须和签进外部消息的一致，
+# 用假时钟模拟拼 query_id 和 tonsdk 检查之间跨过整秒
+import os
+import sys
+import time
+
+import pytest
+
+pytest.importorskip('tonsdk')
+pytest.importorskip('aiosqlite')
+
+os.environ.setdefault('DB_URL', 'sqlite://')
+os.environ.setdefault('ASYNC_DB_URL', 'sqlite+aiosqlite://')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tonsdk.crypto import mnemonic_new
+
+from withdrawals import HighloadWalletProvider, Payout
+
+DESTINATION = '0:' + '3f' * 32
+
+class SteppingClock:
+    # 第一次调用返回 start，之后每次调用前进 step 秒
+    def __init__(self, start, step):
+        self.now = start
+        self.step = step
+        self.calls = 0
+
+    def __call__(self):
+        now = self.now
+        self.now += self.step
+        self.calls += 1
+        return now
+
+@pytest.fixture
+def provider(monkeypatch):
+    provider = HighloadWalletProvider(mnemonic=' '.join(mnemonic_new()), client=None)
+    signed_query_ids = []
+    create = provider.wallet.create_transfer_message
+
+    def spy(*args, **kwargs):
+        query = create(*args, **kwargs)
+        signed_query_ids.append(query['query_id'])
+        return query
+
+    monkeypatch.setattr(provider.wallet, 'create_transfer_message', spy)
+    provider.signed_query_ids = signed_query_ids
+    return provider
+
+@pytest.mark.parametrize('step', [0, 0.002, 0.6, 2.5])
+def test_query_id_matches_signed_message(provider, monkeypatch, step):
+    # 从 x.999 秒开始：原来的实现在 tonsdk 读时钟时已经是下一秒，query_id 会被改写
+    clock = SteppingClock(1_700_000_000.999, step)
+    monkeypatch.setattr(time, 'time', clock)
+    for n in range(3):
+        signed = provider.sign_batch([Payout(DESTINATION, 1_000_000_000, None)])
+        assert provider.signed_query_ids[-1] == signed.query_id
+        assert signed.query_id >> 32 == signed.expires_at
+        assert signed.query_id & 0xffffffff == n + 1
+        assert signed.expires_at >= 1_700_000_000 + provider.timeout
+    assert clock.calls >= 6
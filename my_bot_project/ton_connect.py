@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import time
+
+import aiohttp
+from nacl.exceptions import CryptoError
+from tonconnect.bridge import Bridge
+from tonconnect.crypto import SessionCrypto
+from tonconnect.events import ConnectErrorEvent, ConnectEvent
+from tonconnect.metadata import Metadata
+from tonconnect.options import AddressRequestOption
+from tonconnect.url import get_url
+
+from config import (
+    TON_CONNECT_BRIDGE_URL, TON_CONNECT_IDS_PER_SUBSCRIPTION, TON_CONNECT_MANIFEST_URL, TON_CONNECT_RECONNECT_DELAY,
+    TON_CONNECT_WALLET_APP, WALLET_CONNECT_TTL,
+)
+
+logger = logging.getLogger(__name__)
+
+class BridgeSession:
+    # 一次待确认的钱包连接：tonconnect 的 SessionCrypto 密钥对，公钥（hex）就是 bridge 上的 client_id；
+    # 解密和解析事件用 tonconnect 的 Bridge，SSE 订阅由 BridgeListener 合并处理
+    __slots__ = ('bridge', 'client_id', 'telegram_id', 'user_id', 'chat_id', 'message_id', 'expires_at')
+
+    def __init__(self, telegram_id, user_id, chat_id, ttl, bridge_url=TON_CONNECT_BRIDGE_URL):
+        self.bridge = Bridge(bridge_url)
+        self.bridge.session = SessionCrypto()  # 即 Bridge.connect()，这里不需要 await
+        self.client_id = self.bridge.session.to_hex()
+        self.telegram_id = telegram_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.message_id = None
+        self.expires_at = time.monotonic() + ttl
+
+    def universal_link(self, wallet_app=TON_CONNECT_WALLET_APP, manifest_url=TON_CONNECT_MANIFEST_URL):
+        # ret=none：钱包批准后留在钱包里，结果由 bridge 推送给机器人
+        return get_url(wallet_app, self.client_id, Metadata(manifest_url, [AddressRequestOption()])) + '&ret=none'
+
+    async def decrypt(self, message, event_id):
+        # 返回 ConnectEvent / ConnectErrorEvent（其他事件是 dict），不是发给这个会话的消息抛出 CryptoError
+        return await self.bridge.encode_event(message, event_id)
+
+class _Subscription:
+    # 一条 SSE 连接订阅的一组 client_id
+    __slots__ = ('client_ids', 'changed', 'task', 'last_event_id')
+
+    def __init__(self):
+        self.client_ids = set()
+        self.changed = asyncio.Event()
+        self.task = None
+        self.last_event_id = None
+
+class BridgeListener:
+    # 等待钱包批准的连接共用到 bridge 的 SSE 订阅（client_id 用逗号拼在 URL 里）：
+    # - 一条订阅最多 ids_per_subscription 个 client_id（URL 长度有限制），超出时再开一条；
+    # - 每个用户同一时间只有一个待确认的会话，有效期内重复点击复用，二维码不变；
+    # - 订阅里加入新会话时断开重连，带上 last_event_id，重连期间的消息不会丢；
+    # - 钱包批准（connect）后调用 on_connect(bot, session, address)，拒绝（connect_error）时调用 on_reject(bot, session)；
+    # - 过期的会话由 expire_connections_job 定期清理，订阅里没有会话时断开
+
+    def __init__(self, bridge_url=TON_CONNECT_BRIDGE_URL, ttl=WALLET_CONNECT_TTL,
+                 ids_per_subscription=TON_CONNECT_IDS_PER_SUBSCRIPTION, reconnect_delay=TON_CONNECT_RECONNECT_DELAY):
+        self.bridge_url = bridge_url.rstrip('/')
+        self.ttl = ttl
+        self.ids_per_subscription = ids_per_subscription
+        self.reconnect_delay = reconnect_delay
+        self.bot = None
+        self.on_connect = None
+        self.on_reject = None
+        self._sessions = {}  # client_id -> BridgeSession
+        self._by_user = {}  # telegram_id -> BridgeSession
+        self._subscription_of = {}  # client_id -> _Subscription
+        self._subscriptions = []
+        self._callbacks = set()
+        self._http = None
+        self.subscriptions = 0
+        self.events = 0
+        self.approved = 0
+        self.expired = 0
+
+    def open(self, telegram_id, user_id, chat_id):
+        session = self._by_user.get(telegram_id)
+        if session is not None and session.expires_at > time.monotonic():
+            session.chat_id = chat_id
+            return session
+        if session is not None:
+            self._remove(session)
+        session = BridgeSession(telegram_id, user_id, chat_id, self.ttl, self.bridge_url)
+        self._sessions[session.client_id] = session
+        self._by_user[telegram_id] = session
+        subscription = next(
+            (item for item in reversed(self._subscriptions) if len(item.client_ids) < self.ids_per_subscription), None,
+        )
+        if subscription is None:
+            subscription = _Subscription()
+            self._subscriptions.append(subscription)
+        subscription.client_ids.add(session.client_id)
+        self._subscription_of[session.client_id] = subscription
+        subscription.changed.set()
+        if subscription.task is None or subscription.task.done():
+            subscription.task = asyncio.ensure_future(self._run(subscription))
+        return session
+
+    def close(self, telegram_id):
+        session = self._by_user.get(telegram_id)
+        if session is not None:
+            self._remove(session)
+        return session
+
+    def _remove(self, session):
+        self._sessions.pop(session.client_id, None)
+        if self._by_user.get(session.telegram_id) is session:
+            del self._by_user[session.telegram_id]
+        subscription = self._subscription_of.pop(session.client_id, None)
+        if subscription is not None:
+            subscription.client_ids.discard(session.client_id)
+            if not subscription.client_ids:
+                # 订阅里最后一个会话没了，让它断开
+                subscription.changed.set()
+                self._subscriptions.remove(subscription)
+
+    def expire(self):
+        now = time.monotonic()
+        expired = [session for session in self._sessions.values() if session.expires_at <= now]
+        for session in expired:
+            self._remove(session)
+        self.expired += len(expired)
+        return expired
+
+    def _ensure_http(self):
+        if self._http is None or self._http.closed:
+            # SSE 是长连接，不设总超时，只限制建立连接的时间
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=10))
+        return self._http
+
+    async def _run(self, subscription):
+        while subscription.client_ids:
+            subscription.changed.clear()
+            try:
+                await self._subscribe(subscription)
+            except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as e:
+                logger.warning(f"TON Connect bridge subscription failed ({e}), reconnecting in {self.reconnect_delay}s")
+                await asyncio.sleep(self.reconnect_delay)
+
+    async def _subscribe(self, subscription):
+        params = {'client_id': ','.join(subscription.client_ids)}
+        if subscription.last_event_id is not None:
+            params['last_event_id'] = subscription.last_event_id
+        self.subscriptions += 1
+        async with self._ensure_http().get(f"{self.bridge_url}/events", params=params) as response:
+            response.raise_for_status()
+            reader = asyncio.ensure_future(self._read(response, subscription))
+            changed = asyncio.ensure_future(subscription.changed.wait())
+            try:
+                await asyncio.wait({reader, changed}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                changed.cancel()
+                if not reader.done():
+                    reader.cancel()
+            if reader.done() and not reader.cancelled():
+                reader.result()
+
+    async def _read(self, response, subscription):
+        # 按 SSE 格式解析：空行结束一个事件；以冒号开头的是注释（心跳）
+        event_id = data = kind = None
+        async for raw in response.content:
+            line = raw.decode().rstrip('\r\n')
+            if not line:
+                if event_id is not None:
+                    subscription.last_event_id = event_id
+                if data is not None and kind != 'heartbeat':
+                    self._dispatch(data, event_id, subscription)
+                event_id = data = kind = None
+                continue
+            if line.startswith(':'):
+                continue
+            field, _, value = line.partition(':')
+            value = value[1:] if value.startswith(' ') else value
+            if field == 'id':
+                event_id = value
+            elif field == 'event':
+                kind = value
+            elif field == 'data':
+                data = value if data is None else f"{data}\n{value}"
+        raise ConnectionResetError("bridge closed the event stream")
+
+    async def _decrypt(self, message, event_id, subscription):
+        # 消息里可能带 to（目标 client_id），否则只能用这条订阅里的会话逐个尝试解密
+        session = self._sessions.get(message.get('to'))
+        if session is not None:
+            candidates = [session]
+        else:
+            candidates = [self._sessions[client_id] for client_id in subscription.client_ids if client_id in self._sessions]
+        for session in candidates:
+            try:
+                return session, await session.decrypt(message, event_id)
+            except (CryptoError, ValueError):
+                continue
+        return None, None
+
+    def _dispatch(self, data, event_id, subscription):
+        self.events += 1
+        try:
+            message = json.loads(data)
+        except ValueError as e:
+            logger.warning(f"Malformed TON Connect bridge message: {e}")
+            return
+        # 解密和回调（写库、发消息）放到单独的任务里：订阅重连会取消读取任务，不能把回调一起取消掉
+        task = asyncio.ensure_future(self._handle(message, int(event_id or 0), subscription))
+        self._callbacks.add(task)
+        task.add_done_callback(self._callbacks.discard)
+
+    async def _handle(self, message, event_id, subscription):
+        try:
+            session, event = await self._decrypt(message, event_id, subscription)
+        except (KeyError, TypeError, ValueError) as e:
+            logger.warning(f"Malformed TON Connect bridge message: {e}")
+            return
+        if not isinstance(event, (ConnectEvent, ConnectErrorEvent)):
+            return
+        self._remove(session)
+        try:
+            if isinstance(event, ConnectEvent) and event.address is not None:
+                self.approved += 1
+                await self.on_connect(self.bot, session, event.address.address)
+            else:
+                await self.on_reject(self.bot, session)
+        except Exception as e:
+            logger.error(f"Error handling TON Connect event for user {session.telegram_id}: {e}", exc_info=True)
+
+    async def shutdown(self):
+        subscriptions, self._subscriptions = self._subscriptions, []
+        self._sessions.clear()
+        self._by_user.clear()
+        self._subscription_of.clear()
+        for subscription in subscriptions:
+            if subscription.task is not None:
+                subscription.task.cancel()
+                try:
+                    await subscription.task
+                except asyncio.CancelledError:
+                    pass
+        if self._http is not None and not self._http.closed:
+            await self._http.close()
+
+    def metrics(self):
+        return {
+            'pending': len(self._sessions),
+            'streams': len(self._subscriptions),
+            'subscriptions': self.subscriptions,
+            'events': self.events,
+            'approved': self.approved,
+            'expired': self.expired,
+        }
+
+bridge_listener = BridgeListener()
+
+async def expire_connections_job(context):
+    # 过期的连接把二维码消息改成提示文字；会话是每个进程自己的，每个 worker 都要运行
+    for session in bridge_listener.expire():
+        if session.message_id is None:
+            continue
+        try:
+            await context.bot.edit_message_caption(
+                chat_id=session.chat_id, message_id=session.message_id, caption="连接已过期，请重新连接钱包。",
+            )
+        except Exception as e:
+            logger.debug(f"Could not mark connection of user {session.telegram_id} as expired: {e}")
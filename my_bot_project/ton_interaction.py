@@ -1,87 +1,88 @@
-from tonsdk.provider import ToncenterClient
-from tonsdk.utils import to_nano
-
-TONCENTER_API_KEY = "your_api_key_here"
-TONCENTER_ENDPOINT = "https://testnet.toncenter.com/api/v2/jsonRPC"
-ton_client = ToncenterClient(TONCENTER_ENDPOINT, TONCENTER_API_KEY)
+import payloads
+from config import DEPOSIT_WALLET_MNEMONIC
+from payloads import OP_BUY, OP_DEPOSIT, OP_SELL, OP_WITHDRAW, nano
+from rate_cache import CachedValue
+from toncenter import toncenter
+from wallet_sender import sender_for
 
 DICE_CONTRACT_ADDRESS = "EQ..."  # 替换为实际部署的合约地址
 TRADE_AMOUNT = 10000000000  # 10,000 DICE (with 9 decimals)
 SLIPPAGE_THRESHOLD = 0.05  # 5% slippage threshold
 
+async def fetch_pool_state():
+    # 池子信息和汇率放在一个 JSON-RPC 批量请求里，一次往返
+    pool_info, exchange_rate = await toncenter.run_get_methods(DICE_CONTRACT_ADDRESS, ["get_pool_info", "get_exchange_rate"])
+    return {'pool_info': pool_info, 'exchange_rate': exchange_rate[0]}
+
+# 菜单上显示的汇率/池子信息走缓存，不在每次点击时请求链上数据
+pool_state_cache = CachedValue('pool_state', fetch_pool_state)
+rate_caches = (pool_state_cache,)
+
 async def get_pool_info():
-    result = await ton_client.run_get_method(DICE_CONTRACT_ADDRESS, "get_pool_info", [])
-    return result
+    return (await pool_state_cache.get())['pool_info']
 
 async def get_exchange_rate():
-    result = await ton_client.run_get_method(DICE_CONTRACT_ADDRESS, "get_exchange_rate", [])
-    return result[0]
+    return (await pool_state_cache.get())['exchange_rate']
+
+_deposit_wallet = None
 
+def deposit_wallet():
+    # 充值消息由机器人自己的钱包签名发送（DEPOSIT_WALLET_MNEMONIC）；未配置时返回 None
+    global _deposit_wallet
+    if _deposit_wallet is None and DEPOSIT_WALLET_MNEMONIC:
+        from tonsdk.contract.wallet import Wallets, WalletVersionEnum
+
+        _, _, _, _deposit_wallet = Wallets.from_mnemonics(DEPOSIT_WALLET_MNEMONIC.split(), WalletVersionEnum.v4r2, 0)
+    return _deposit_wallet
+
+# 以下发送函数都经过钱包的 WalletSender 分配 seqno，上链后返回交易 hash
 async def deposit_ton(wallet, expected_ton):
     # 使用 TON 充值（买入 DICE）
-    message = wallet.create_transfer_message(
-        to_addr=DICE_CONTRACT_ADDRESS,
-        amount=to_nano(expected_ton + 0.1),  # 额外 0.1 TON 用于存储费
-        payload=create_buy_payload(expected_ton)
+    return await sender_for(wallet).send(
+        DICE_CONTRACT_ADDRESS,
+        nano(expected_ton + 0.1),  # 额外 0.1 TON 用于存储费
+        create_buy_payload(expected_ton),
     )
-    result = await ton_client.send_message(message)
-    return result
 
 async def deposit_dice(wallet):
     # 使用 DICE 充值（直接存入 DICE）
-    message = wallet.create_transfer_message(
-        to_addr=DICE_CONTRACT_ADDRESS,
-        amount=to_nano(0.1),  # 0.1 TON 用于 gas 费
-        payload=create_deposit_payload(TRADE_AMOUNT)
+    return await sender_for(wallet).send(
+        DICE_CONTRACT_ADDRESS,
+        nano(0.1),  # 0.1 TON 用于 gas 费
+        DEPOSIT_DICE_PAYLOAD,
     )
-    result = await ton_client.send_message(message)
-    return result
 
 async def withdraw_ton(wallet, expected_ton):
     # 提现为 TON（卖出 DICE）
-    message = wallet.create_transfer_message(
-        to_addr=DICE_CONTRACT_ADDRESS,
-        amount=to_nano(0.1),  # 0.1 TON 用于 gas 费
-        payload=create_sell_payload(TRADE_AMOUNT, expected_ton)
+    return await sender_for(wallet).send(
+        DICE_CONTRACT_ADDRESS,
+        nano(0.1),  # 0.1 TON 用于 gas 费
+        create_sell_payload(TRADE_AMOUNT, expected_ton),
     )
-    result = await ton_client.send_message(message)
-    return result
 
 async def withdraw_dice(wallet):
     # 提现为 DICE（直接提取 DICE）
-    message = wallet.create_transfer_message(
-        to_addr=DICE_CONTRACT_ADDRESS,
-        amount=to_nano(0.1),  # 0.1 TON 用于 gas 费
-        payload=create_withdraw_payload(TRADE_AMOUNT)
+    return await sender_for(wallet).send(
+        DICE_CONTRACT_ADDRESS,
+        nano(0.1),  # 0.1 TON 用于 gas 费
+        WITHDRAW_DICE_PAYLOAD,
     )
-    result = await ton_client.send_message(message)
-    return result
 
+# payload 的编码和缓存在 payloads.py；TRADE_AMOUNT 是常量，DICE 充值/提现的 payload 每次都一样，导入时构造一次
 def create_buy_payload(expected_ton):
-    from tonsdk.boc import Cell
-    cell = Cell()
-    cell.bits.write_uint(2, 32)  # op code for buy
-    cell.bits.write_coins(to_nano(expected_ton))
-    return cell.begin_parse()
+    return payloads.buy(nano(expected_ton))
 
 def create_sell_payload(amount, expected_ton):
-    from tonsdk.boc import Cell
-    cell = Cell()
-    cell.bits.write_uint(3, 32)  # op code for sell
-    cell.bits.write_coins(to_nano(amount))
-    cell.bits.write_coins(to_nano(expected_ton))
-    return cell.begin_parse()
+    return payloads.sell(nano(amount), nano(expected_ton))
 
 def create_deposit_payload(amount):
-    from tonsdk.boc import Cell
-    cell = Cell()
-    cell.bits.write_uint(4, 32)  # op code for deposit DICE
-    cell.bits.write_coins(to_nano(amount))
-    return cell.begin_parse()
-
-def create_withdraw_payload(amount):
-    from tonsdk.boc import Cell
-    cell = Cell()
-    cell.bits.write_uint(5, 32)  # op code for withdraw DICE
-    cell.bits.write_coins(to_nano(amount))
-    return cell.begin_parse()
\ No newline at end of file
+    return payloads.deposit(nano(amount))
+
+def create_withdraw_payload(amount, recipient=None):
+    # 带 recipient 时由合约转给 recipient，而不是消息的发送方（热钱包批量打款）
+    return payloads.withdraw(nano(amount), recipient)
+
+DEPOSIT_DICE_PAYLOAD = create_deposit_payload(TRADE_AMOUNT)
+WITHDRAW_DICE_PAYLOAD = create_withdraw_payload(TRADE_AMOUNT)
+payloads.boc(DEPOSIT_DICE_PAYLOAD)
+payloads.boc(WITHDRAW_DICE_PAYLOAD)
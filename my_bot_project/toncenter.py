@@ -0,0 +1,229 @@
+import asyncio
+import base64
+import itertools
+import logging
+import random
+import time
+from collections import defaultdict
+
+import aiohttp
+
+from config import (
+    TONCENTER_API_KEY, TONCENTER_CONCURRENCY, TONCENTER_ENDPOINT, TONCENTER_MAX_RETRIES, TONCENTER_RETRY_BASE,
+    TONCENTER_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# 这些 HTTP 状态码视为临时错误，可以重试
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class ToncenterError(Exception):
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+class _Retryable(Exception):
+    pass
+
+class _MethodStats:
+    __slots__ = ('calls', 'errors', 'retries', 'total_ms', 'max_ms')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+def parse_stack(stack):
+    # runGetMethod 返回的栈：数字转换成 int，其它类型原样保留
+    values = []
+    for kind, value in stack:
+        if kind == 'num':
+            values.append(int(value, 16))
+        else:
+            values.append(value)
+    return values
+
+class ToncenterClient:
+    # Toncenter JSON-RPC 客户端：
+    # - 进程内共享一个 aiohttp 会话，连接保持（keep-alive），在第一次调用时于当前事件循环里创建；
+    # - batch() 把多个调用放进一个 JSON-RPC 批量请求，一次往返；
+    # - 同时进行的请求数不超过 concurrency；
+    # - 网络错误、超时、429/5xx 按指数退避 + 随机抖动重试；
+    # - 按方法统计调用次数、错误、重试和延迟
+
+    def __init__(self, endpoint=TONCENTER_ENDPOINT, api_key=TONCENTER_API_KEY, concurrency=TONCENTER_CONCURRENCY,
+                 timeout=TONCENTER_TIMEOUT, max_retries=TONCENTER_MAX_RETRIES, retry_base=TONCENTER_RETRY_BASE):
+        self.endpoint = endpoint
+        self.api_key = api_key
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._session = None
+        self._semaphore = None
+        self._ids = itertools.count(1)
+        self._stats = defaultdict(_MethodStats)
+        self.requests = 0
+
+    def _ensure_session(self):
+        if self._session is None or self._session.closed:
+            headers = {'X-API-Key': self.api_key} if self.api_key else {}
+            self._session = aiohttp.ClientSession(
+                headers=headers,
+                connector=aiohttp.TCPConnector(limit=self.concurrency, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    def _request(self, method, params):
+        return {'jsonrpc': '2.0', 'id': next(self._ids), 'method': method, 'params': params}
+
+    async def _post(self, payload):
+        session = self._ensure_session()
+        async with self._semaphore:
+            self.requests += 1
+            async with session.post(self.endpoint, json=payload) as response:
+                if response.status in RETRY_STATUSES:
+                    raise _Retryable(f"HTTP {response.status}")
+                return await response.json(content_type=None)
+
+    async def _post_with_retry(self, payload, methods):
+        attempt = 0
+        while True:
+            try:
+                return await self._post(payload)
+            except (_Retryable, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.max_retries:
+                    raise ToncenterError(f"Toncenter request failed after {attempt + 1} attempts: {e}") from e
+                # full jitter：在 [0, base * 2^attempt] 之间随机等待，避免所有请求同时重试
+                delay = random.uniform(0, self.retry_base * 2 ** attempt)
+                attempt += 1
+                for method in methods:
+                    self._stats[method].retries += 1
+                logger.warning(f"Toncenter {','.join(methods)} failed ({e}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _record(self, methods, started, failed):
+        elapsed = (time.perf_counter() - started) * 1000
+        for method in methods:
+            stats = self._stats[method]
+            stats.calls += 1
+            stats.errors += failed
+            stats.total_ms += elapsed
+            stats.max_ms = max(stats.max_ms, elapsed)
+
+    @staticmethod
+    def _result(response):
+        if response.get('error') is not None:
+            error = response['error']
+            if isinstance(error, dict):
+                raise ToncenterError(error.get('message', str(error)), error.get('code'))
+            raise ToncenterError(str(error), response.get('code'))
+        return response['result']
+
+    async def call(self, method, params=None):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = self._result(await self._post_with_retry(self._request(method, params or {}), (method,)))
+            failed = False
+            return result
+        finally:
+            self._record((method,), started, failed)
+
+    async def batch(self, calls):
+        # calls: [(method, params), ...]，按顺序返回结果；任何一个调用出错都抛出 ToncenterError
+        requests = [self._request(method, params or {}) for method, params in calls]
+        methods = tuple(method for method, _ in calls)
+        started = time.perf_counter()
+        failed = True
+        try:
+            responses = await self._post_with_retry(requests, methods)
+            if not isinstance(responses, list):
+                # 不支持批量时服务端会返回单个错误对象
+                self._result(responses)
+                raise ToncenterError(f"Unexpected batch response: {responses}")
+            by_id = {response.get('id'): response for response in responses}
+            results = [self._result(by_id.get(request['id'], {'error': 'missing response'})) for request in requests]
+            failed = False
+            return results
+        finally:
+            self._record(methods, started, failed)
+
+    async def run_get_method(self, address, method, stack=None):
+        return parse_stack(self._get_method_result(await self.call('runGetMethod', self._get_method_params(address, method, stack))))
+
+    async def run_get_methods(self, address, methods):
+        # 同一个合约的多个 get 方法一次往返
+        results = await self.batch([('runGetMethod', self._get_method_params(address, method, None)) for method in methods])
+        return [parse_stack(self._get_method_result(result)) for result in results]
+
+    @staticmethod
+    def _get_method_params(address, method, stack):
+        return {'address': address, 'method': method, 'stack': stack or []}
+
+    @staticmethod
+    def _get_method_result(result):
+        if result.get('exit_code', 0) != 0:
+            raise ToncenterError(f"Get method failed with exit code {result['exit_code']}", result['exit_code'])
+        return result['stack']
+
+    async def transactions_after(self, address, after_lt, page=100):
+        # getTransactions 从最新的交易往回翻页，直到遇到游标（after_lt）为止；返回按 lt 升序排列的新交易
+        transactions = []
+        lt = tx_hash = None
+        while True:
+            params = {'address': address, 'limit': page, 'archival': True}
+            if after_lt:
+                params['to_lt'] = after_lt
+            if lt is not None:
+                params.update(lt=lt, hash=tx_hash)
+            batch = await self.call('getTransactions', params)
+            full_page = len(batch) >= page
+            if lt is not None:
+                # 翻页时第一条就是上一页的最后一条
+                batch = [tx for tx in batch if tx['transaction_id']['hash'] != tx_hash]
+            new = [tx for tx in batch if int(tx['transaction_id']['lt']) > after_lt]
+            transactions.extend(new)
+            if not full_page or not new or len(new) < len(batch):
+                break
+            lt, tx_hash = new[-1]['transaction_id']['lt'], new[-1]['transaction_id']['hash']
+        transactions.reverse()
+        return transactions
+
+    async def latest_lt(self, address):
+        transactions = await self.call('getTransactions', {'address': address, 'limit': 1})
+        return int(transactions[0]['transaction_id']['lt']) if transactions else 0
+
+    async def send_boc(self, boc):
+        return await self.call('sendBoc', {'boc': base64.b64encode(boc).decode()})
+
+    def metrics(self):
+        return {
+            method: {
+                'calls': stats.calls,
+                'errors': stats.errors,
+                'retries': stats.retries,
+                'avg_ms': round(stats.total_ms / stats.calls, 2),
+                'max_ms': round(stats.max_ms, 2),
+            }
+            for method, stats in self._stats.items()
+            if stats.calls
+        }
+
+toncenter = ToncenterClient()
+
+async def log_toncenter_metrics_job(context):
+    metrics = toncenter.metrics()
+    if metrics:
+        logger.info(f"Toncenter metrics: requests {toncenter.requests}, {metrics}")
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from config import UPDATE_CONCURRENCY, UPDATE_QUEUE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+class _UserQueue:
+    __slots__ = ('lock', 'depth')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.depth = 0  # 该用户正在处理和排队的 update 数量
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    # 不同用户的 update 并行处理，同一用户的 update 严格按到达顺序串行处理
+    # （handle_dice 等 handler 会读写 user_data，不能并发）。
+    #
+    # 基类的信号量限制在途 update 总数（排队 + 运行，queue_limit），
+    # 拿到用户锁之后再受 max_concurrent_updates 限制，
+    # 这样同一个用户排队的 update 不会占满全局并发名额
+
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY, queue_limit=UPDATE_QUEUE_LIMIT):
+        # 基类的 max_concurrent_updates / 信号量是在途上限（queue_limit），同时运行的上限单独保存在 running_limit
+        super().__init__(max(queue_limit, max_concurrent_updates))
+        self.running_limit = max_concurrent_updates
+        self._running = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._queues = {}
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.max_user_depth = 0
+
+    @staticmethod
+    def _key(update):
+        if isinstance(update, Update) and update.effective_user:
+            return update.effective_user.id
+        return None
+
+    async def do_process_update(self, update, coroutine):
+        key = self._key(update)
+        self.waiting += 1
+        if key is None:
+            async with self._running:
+                await self._run(coroutine)
+            return
+
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _UserQueue()
+        queue.depth += 1
+        self.max_user_depth = max(self.max_user_depth, queue.depth)
+        try:
+            async with queue.lock:
+                async with self._running:
+                    await self._run(coroutine)
+        finally:
+            queue.depth -= 1
+            if queue.depth == 0:
+                del self._queues[key]
+
+    async def _run(self, coroutine):
+        self.waiting -= 1
+        self.running += 1
+        try:
+            await coroutine
+        finally:
+            self.running -= 1
+            self.processed += 1
+
+    def metrics(self):
+        depths = [queue.depth for queue in self._queues.values()]
+        return {
+            'running': self.running,
+            'running_limit': self.running_limit,
+            'queued': self.waiting,
+            'active_users': len(depths),
+            'deepest_user_queue': max(depths, default=0),
+            'max_user_depth_seen': self.max_user_depth,
+            'processed': self.processed,
+        }
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+async def log_update_metrics_job(context):
+    processor = context.application.update_processor
+    if isinstance(processor, PerUserUpdateProcessor):
+        logger.info(f"Update processor metrics: {processor.metrics()}")
+    rate_limiter = context.bot.rate_limiter
+    if hasattr(rate_limiter, 'metrics'):
+        logger.info(f"Outbound rate limiter metrics: {rate_limiter.metrics()}")
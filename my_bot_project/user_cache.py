@@ -0,0 +1,88 @@
+import time
+from collections import OrderedDict
+
+from sqlalchemy.orm.attributes import set_committed_value
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL
+
+class UserCache:
+    # 以 telegram_id 为键的有界 LRU + TTL 用户缓存，另外维护 id -> telegram_id 的映射。
+    # 余额、钱包等写操作直接更新缓存里的对象（write-through），读路径不需要再查库
+
+    def __init__(self, maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()  # telegram_id -> (expires_at, user)
+        self._telegram_ids = {}  # user.id -> telegram_id
+        self.hits = 0
+        self.misses = 0
+        # 多进程部署时由 supervisor 的 worker 设置：本进程修改了某个用户后通知其他 worker 丢弃缓存，
+        # 签名为 publish(telegram_id, user_id)，两者之一可能为 None
+        self.publish = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, telegram_id):
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, user = entry
+        if expires_at < time.monotonic():
+            self.invalidate(telegram_id)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(telegram_id)
+        self.hits += 1
+        return user
+
+    def get_by_id(self, user_id):
+        telegram_id = self._telegram_ids.get(user_id)
+        return self.get(telegram_id) if telegram_id is not None else None
+
+    def put(self, user):
+        if user is None:
+            return None
+        self._entries[user.telegram_id] = (time.monotonic() + self.ttl, user)
+        self._entries.move_to_end(user.telegram_id)
+        self._telegram_ids[user.id] = user.telegram_id
+        while len(self._entries) > self.maxsize:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._telegram_ids.pop(evicted.id, None)
+        return user
+
+    def invalidate(self, telegram_id):
+        entry = self._entries.pop(telegram_id, None)
+        if entry is not None:
+            self._telegram_ids.pop(entry[1].id, None)
+
+    def update(self, telegram_id, **values):
+        # 只更新已缓存的对象；set_committed_value 不会把对象标记为脏数据
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            for key, value in values.items():
+                set_committed_value(entry[1], key, value)
+        if self.publish is not None:
+            self.publish(telegram_id, entry[1].id if entry is not None else None)
+
+    def update_by_id(self, user_id, **values):
+        telegram_id = self._telegram_ids.get(user_id)
+        if telegram_id is not None:
+            self.update(telegram_id, **values)
+        elif self.publish is not None:
+            # 本进程没有缓存这个用户，其他 worker 可能有
+            self.publish(None, user_id)
+
+    def drop(self, telegram_id=None, user_id=None):
+        # 处理其他 worker 发来的失效通知，不再向外广播
+        if telegram_id is None:
+            telegram_id = self._telegram_ids.get(user_id)
+        if telegram_id is not None:
+            self.invalidate(telegram_id)
+
+    def clear(self):
+        self._entries.clear()
+        self._telegram_ids.clear()
+
+user_cache = UserCache()
@@ -0,0 +1,26 @@
+from telegram import Update
+from telegram.ext import CallbackContext, ContextTypes
+
+from database import get_user_by_telegram_id
+
+class BotContext(CallbackContext):
+    # 同一个 update 的所有 handler 共享这个 context，db_user 由 load_user_context 预先填好
+
+    def __init__(self, application, chat_id=None, user_id=None):
+        super().__init__(application, chat_id=chat_id, user_id=user_id)
+        self.db_user = None
+
+bot_context_types = ContextTypes(context=BotContext)
+
+async def load_user_context(update: Update, context: BotContext) -> None:
+    # 注册在 group -1 的 TypeHandler：每个 update 只加载一次当前用户（优先走 user_cache）
+    if update.effective_user:
+        context.db_user = await get_user_by_telegram_id(str(update.effective_user.id))
+
+async def get_current_user(update: Update, context: BotContext):
+    user = getattr(context, 'db_user', None)
+    if user is None and update.effective_user:
+        # 未注册的用户或者刚刚注册（create_user 已写入缓存）的情况
+        user = await get_user_by_telegram_id(str(update.effective_user.id))
+        context.db_user = user
+    return user
@@ -0,0 +1,22 @@
+import base64
+
+def normalize_address(address):
+    # TON 地址统一成 raw 格式 "workchain:hash(hex)"：同一个钱包的 bounceable / non-bounceable、
+    # base64 / base64url 写法都得到同一个结果，可以直接按字符串比较和建索引。无法解析时返回 None
+    if not address:
+        return None
+    address = address.strip()
+    if ':' in address:
+        workchain, _, account = address.partition(':')
+        try:
+            return f"{int(workchain)}:{bytes.fromhex(account).hex()}" if len(account) == 64 else None
+        except ValueError:
+            return None
+    try:
+        data = base64.urlsafe_b64decode(address.replace('+', '-').replace('/', '_'))
+    except (ValueError, TypeError):
+        return None
+    if len(data) != 36:
+        return None
+    workchain = int.from_bytes(data[1:2], 'big', signed=True)
+    return f"{workchain}:{data[2:34].hex()}"
@@ -0,0 +1,225 @@
+import asyncio
+import base64
+import logging
+import time
+from collections import deque
+
+from tonsdk.boc import Cell
+from tonsdk.contract import Contract
+
+from config import WALLET_MAX_RESIGNS, WALLET_MESSAGE_TTL, WALLET_POLL_INTERVAL, WALLET_SENDER_WINDOW
+from toncenter import ToncenterError, toncenter
+
+logger = logging.getLogger(__name__)
+
+# 钱包 v3/v4 一条外部消息最多携带的内部消息数
+MAX_MESSAGES_PER_SEQNO = 4
+# 过期后再等这么久（秒）才认为消息不可能再上链，给节点之间的时钟差和出块留余量
+EXPIRY_GRACE = 10
+
+class WalletSendError(Exception):
+    pass
+
+class _Outgoing:
+    __slots__ = ('destination', 'amount', 'payload', 'send_mode', 'future', 'resigns')
+
+    def __init__(self, destination, amount, payload, send_mode, future):
+        self.destination = destination
+        self.amount = amount
+        self.payload = payload
+        self.send_mode = send_mode
+        self.future = future
+        self.resigns = 0
+
+class _Signed:
+    # 一个 seqno 上签好的外部消息；同一个 seqno 可能因为过期被重新签名，所有签过的 hash 都记下来
+    __slots__ = ('seqno', 'items', 'valid_until', 'boc', 'hashes', 'broadcast_at')
+
+    def __init__(self, seqno, items):
+        self.seqno = seqno
+        self.items = items
+        self.valid_until = 0
+        self.boc = None
+        self.hashes = set()
+        self.broadcast_at = 0
+
+def parse_external(tx):
+    # 钱包收到的外部消息：返回 (body hash, seqno)；不是外部消息或无法解析时返回 None
+    in_msg = tx.get('in_msg') or {}
+    body = (in_msg.get('msg_data') or {}).get('body')
+    if in_msg.get('source') or not body:
+        return None
+    try:
+        cell = Cell.one_from_boc(base64.b64decode(body))
+        payload = cell.begin_parse()
+        payload.read_bits(512)  # signature
+        payload.read_uint(32)  # wallet_id
+        payload.read_uint(32)  # valid_until
+        return cell.bytes_hash(), payload.read_uint(32)
+    except Exception:
+        return None
+
+class WalletSender:
+    # 一个钱包的所有外发消息都经过这里，由它分配 seqno：
+    # - send() 把转账放进队列，返回的 future 在消息上链后完成；
+    # - 每个 seqno 打包最多 4 个转账，最多同时有 window 个 seqno 已签名、在途，不用等上一条确认再签下一条；
+    # - 后面的 seqno 在前一条上链前会被节点拒绝，每次轮询重新广播还没上链的消息；
+    # - 通过钱包地址的交易游标确认：外部消息的 hash 属于我们签过的版本则确认；
+    #   seqno 被别的消息用掉（重放/外部签名）或过期后仍未上链，则把转账重新排队、用新的 seqno / 有效期重新签名
+
+    def __init__(self, wallet, client=toncenter, window=WALLET_SENDER_WINDOW, ttl=WALLET_MESSAGE_TTL,
+                 poll_interval=WALLET_POLL_INTERVAL, max_resigns=WALLET_MAX_RESIGNS):
+        self.wallet = wallet
+        self.address = wallet.address.to_string(True, True, True)
+        self.client = client
+        self.window = window
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self.max_resigns = max_resigns
+        self._pending = deque()
+        self._inflight = {}  # seqno -> _Signed
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.next_seqno = None
+        self.chain_seqno = None
+        self.cursor_lt = 0
+        self.confirmed = 0
+        self.resigned = 0
+        self.broadcasts = 0
+
+    def send(self, destination, amount, payload=None, send_mode=3):
+        # 返回 future：上链后结果为交易 hash，重签次数用完时抛出 WalletSendError
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Outgoing(destination, amount, payload, send_mode, future))
+        self._wakeup.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return future
+
+    async def _sync(self):
+        # 启动时从链上读取当前 seqno 和交易游标
+        self.chain_seqno = (await self.client.run_get_method(self.address, 'seqno'))[0]
+        self.next_seqno = max(self.next_seqno or 0, self.chain_seqno)
+        self.cursor_lt = await self.client.latest_lt(self.address)
+
+    async def _run(self):
+        while self._pending or self._inflight:
+            try:
+                if self.next_seqno is None:
+                    await self._sync()
+                self._sign_pending()
+                await self._broadcast()
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                await self._reconcile()
+            except Exception as e:
+                # 在途的消息仍可能上链，不能直接判失败，等下一轮继续核对
+                logger.error(f"Wallet sender for {self.address} error: {e}", exc_info=True)
+                await asyncio.sleep(self.poll_interval)
+
+    def _sign(self, signed):
+        # 钱包 v3/v4 的签名消息：wallet_id、valid_until、seqno（v4 还有 op=0），每个转账一个引用
+        signed.valid_until = int(time.time()) + self.ttl
+        message = Cell()
+        message.bits.write_uint(self.wallet.options['wallet_id'], 32)
+        message.bits.write_uint(signed.valid_until, 32)
+        message.bits.write_uint(signed.seqno, 32)
+        if 'v4' in type(self.wallet).__name__.lower():
+            message.bits.write_uint(0, 8)
+        for item in signed.items:
+            header = Contract.create_internal_message_header(item.destination, item.amount)
+            message.bits.write_uint(item.send_mode, 8)
+            message.refs.append(Contract.create_common_msg_info(header, None, item.payload))
+        external = self.wallet.create_external_message(message, signed.seqno)
+        signed.boc = external['message'].to_boc(False)
+        signed.hashes.add(external['body'].bytes_hash())
+        signed.broadcast_at = 0
+
+    def _sign_pending(self):
+        while self._pending and len(self._inflight) < self.window:
+            items = [self._pending.popleft() for _ in range(min(MAX_MESSAGES_PER_SEQNO, len(self._pending)))]
+            signed = _Signed(self.next_seqno, items)
+            self.next_seqno += 1
+            self._sign(signed)
+            self._inflight[signed.seqno] = signed
+
+    async def _broadcast(self):
+        now = time.monotonic()
+        for seqno in sorted(self._inflight):
+            signed = self._inflight[seqno]
+            if now - signed.broadcast_at < self.poll_interval:
+                continue
+            signed.broadcast_at = now
+            self.broadcasts += 1
+            try:
+                await self.client.send_boc(signed.boc)
+            except ToncenterError as e:
+                # 通常是前面的 seqno 还没上链，下一轮再发
+                logger.debug(f"Broadcast of seqno {seqno} rejected: {e}")
+
+    async def _reconcile(self):
+        for tx in await self.client.transactions_after(self.address, self.cursor_lt):
+            self.cursor_lt = int(tx['transaction_id']['lt'])
+            parsed = parse_external(tx)
+            if parsed is None:
+                continue
+            body_hash, seqno = parsed
+            self.chain_seqno = max(self.chain_seqno, seqno + 1)
+            signed = self._inflight.pop(seqno, None)
+            if signed is None:
+                continue
+            if body_hash in signed.hashes:
+                self.confirmed += 1
+                for item in signed.items:
+                    if not item.future.done():
+                        item.future.set_result(tx['transaction_id']['hash'])
+            else:
+                # seqno 被别的消息用掉了，我们的消息不可能再上链
+                logger.warning(f"Seqno {seqno} of {self.address} was used by another message, re-signing")
+                self._requeue(signed.items)
+        self.next_seqno = max(self.next_seqno, self.chain_seqno)
+
+        now = int(time.time())
+        for signed in self._inflight.values():
+            if now <= signed.valid_until + EXPIRY_GRACE:
+                continue
+            # 过期且没有上链：同一个 seqno 换新的有效期重新签名。转账全部放弃后仍签一条不带转账的消息占住这个 seqno，
+            # 后面已签名的消息才不会卡住（不能把它们挪到前面的 seqno，旧版本仍可能上链）
+            self.resigned += 1
+            signed.items = [item for item in signed.items if self._count_resign(item)]
+            self._sign(signed)
+
+    def _count_resign(self, item):
+        item.resigns += 1
+        if item.resigns > self.max_resigns:
+            if not item.future.done():
+                item.future.set_exception(WalletSendError(f"Message to {item.destination} expired {item.resigns} times"))
+            return False
+        return True
+
+    def _requeue(self, items):
+        for item in reversed(items):
+            if self._count_resign(item):
+                self._pending.appendleft(item)
+
+    def metrics(self):
+        return {
+            'pending': len(self._pending),
+            'inflight': len(self._inflight),
+            'confirmed': self.confirmed,
+            'resigned': self.resigned,
+            'broadcasts': self.broadcasts,
+        }
+
+_senders = {}
+
+def sender_for(wallet):
+    # 同一个钱包在进程内只有一个 sender，保证 seqno 不会被并发分配两次
+    address = wallet.address.to_string(True, True, True)
+    sender = _senders.get(address)
+    if sender is None:
+        sender = _senders[address] = WalletSender(wallet)
+    return sender
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import logging
+import signal
+import time
+
+from aiohttp import web
+from telegram import Update
+
+from config import (
+    WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_URL, WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS, WEBHOOK_QUEUE_LIMIT,
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class WebhookServer:
+    # 内嵌的 aiohttp 服务：收到 update 后只做解析和入队（application.update_queue），立即返回 200，
+    # 真正的处理交给 application 的 update 处理器。
+    # 同时处理的请求数由信号量限制；队列积压超过上限时返回 503，Telegram 会稍后重发
+
+    def __init__(self, application, listen=WEBHOOK_LISTEN, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+                 secret=WEBHOOK_SECRET, max_connections=WEBHOOK_MAX_CONNECTIONS, queue_limit=WEBHOOK_QUEUE_LIMIT):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.queue_limit = queue_limit
+        self._requests = asyncio.Semaphore(max_connections)
+        self._runner = None
+        self.received = 0
+        self.rejected = 0
+        self.max_handle_ms = 0.0
+
+    def make_app(self):
+        app = web.Application(client_max_size=1024 * 1024)
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        return app
+
+    async def handle_update(self, request):
+        if self.secret and request.headers.get(SECRET_HEADER) != self.secret:
+            return web.Response(status=403)
+        async with self._requests:
+            started = time.perf_counter()
+            if self.backlog() >= self.queue_limit:
+                self.rejected += 1
+                return web.Response(status=503, headers={'Retry-After': '1'})
+            try:
+                data = await request.json(loads=json.loads)
+                accepted = self.enqueue(data)
+            except Exception as e:
+                logger.warning(f"Invalid webhook payload: {e}")
+                return web.Response(status=400)
+            if not accepted:
+                return web.Response(status=400)
+            self.received += 1
+            self.max_handle_ms = max(self.max_handle_ms, (time.perf_counter() - started) * 1000)
+        return web.Response()
+
+    def backlog(self):
+        return self.application.update_queue.qsize()
+
+    def enqueue(self, data):
+        update = Update.de_json(data, self.application.bot)
+        if update is None:
+            return False
+        self.application.update_queue.put_nowait(update)
+        return True
+
+    async def handle_health(self, request):
+        return web.json_response({
+            'received': self.received,
+            'rejected': self.rejected,
+            'queued': self.backlog(),
+            'max_handle_ms': round(self.max_handle_ms, 3),
+        })
+
+    async def start(self):
+        self._runner = web.AppRunner(self.make_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+async def _run_webhook(application):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = WebhookServer(application)
+    async with application:
+        await application.start()
+        await server.start()
+        # 未配置 WEBHOOK_URL 时不注册 webhook，方便本地直接 POST 录制好的 update 测试
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET or None,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            # run_polling 会自己调用 post_shutdown，手动管理生命周期时需要补上
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+def run_webhook(application):
+    asyncio.run(_run_webhook(application))
@@ -0,0 +1,301 @@
+import itertools
+import logging
+import time
+import uuid
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, insert, select, update
+
+from config import (
+    HOT_WALLET_MNEMONIC, WITHDRAW_BATCH_SIZE, WITHDRAW_MAX_ATTEMPTS, WITHDRAW_MAX_BATCH, WITHDRAW_MAX_WAIT,
+)
+from database import debit_statement, get_db_session
+from models import Transaction, User
+from ton_interaction import DICE_CONTRACT_ADDRESS, TRADE_AMOUNT, create_withdraw_payload
+from toncenter import toncenter
+from user_cache import user_cache
+
+logger = logging.getLogger(__name__)
+
+# 一笔打款：目标地址、附带的 nanoTON、消息体（Cell 或 None）
+Payout = namedtuple('Payout', 'destination amount payload')
+
+# 签好名的一批打款：query_id、过期时间（unix 秒）、外部消息的 BOC
+SignedBatch = namedtuple('SignedBatch', 'query_id expires_at boc')
+
+# 每次提现扣除的游戏币（10,000 DICE）
+WITHDRAW_AMOUNT = TRADE_AMOUNT // 10 ** 9
+
+# DICE 提现由合约转给用户，附带的 TON 用作 gas
+DICE_PAYOUT_GAS = 100_000_000
+
+def payout_of(tx):
+    # 队列里的一条提现 -> 热钱包发出的一条消息
+    if tx.asset == 'ton':
+        return Payout(tx.destination, tx.payout, None)
+    return Payout(DICE_CONTRACT_ADDRESS, DICE_PAYOUT_GAS, create_withdraw_payload(tx.payout, tx.destination))
+
+class HighloadWalletProvider:
+    # 热钱包使用 highload wallet v2：一条外部消息最多携带 254 个转账，不需要等待 seqno，
+    # 每批用不同的 query_id 防重放。query_id 高 32 位是过期时间、低 32 位是序号，自己拼好再传给 tonsdk：
+    # tonsdk 遇到小于 (now + timeout) << 32 的 query_id 时移位写错了，第二批起就会溢出 64 位。
+    # 过期时间比 tonsdk 的阈值多留 expiry_margin 秒，拼好 query_id 到 tonsdk 检查之间时钟跨秒也不会触发改写
+
+    max_messages = 254
+    timeout = 60
+    expiry_margin = 5
+    # 过期后再等一会儿才查询 processed?，让已经在途的消息有时间上链
+    settle_delay = 15
+
+    def __init__(self, mnemonic=HOT_WALLET_MNEMONIC, client=toncenter):
+        self.mnemonic = mnemonic
+        self.client = client
+        self._wallet = None
+        self._query_ids = itertools.count(1)
+
+    @property
+    def wallet(self):
+        if self._wallet is None:
+            from tonsdk.contract.wallet import Wallets, WalletVersionEnum
+
+            _, _, _, self._wallet = Wallets.from_mnemonics(self.mnemonic.split(), WalletVersionEnum.hv2, 0)
+        return self._wallet
+
+    def sign_batch(self, payouts):
+        recipients = [
+            {'address': payout.destination, 'amount': payout.amount, 'payload': payout.payload, 'send_mode': 3}
+            for payout in payouts
+        ]
+        expires_at = int(time.time()) + self.timeout + self.expiry_margin
+        query_id = expires_at << 32 | next(self._query_ids) & 0xffffffff
+        query = self.wallet.create_transfer_message(recipients, query_id, self.timeout)
+        if query['query_id'] != query_id:
+            # 签进消息的 query_id 和记录的不一致，之后就查不到它是否执行过，不能发送
+            raise RuntimeError(f"tonsdk rewrote query_id {query_id:#x} to {query['query_id']:#x}")
+        return SignedBatch(query_id, expires_at, query['message'].to_boc(False))
+
+    async def broadcast(self, signed):
+        # 同一个 BOC 可以重复广播：钱包按 query_id 防重放，最多执行一次
+        await self.client.send_boc(signed.boc)
+
+    async def processed(self, query_id):
+        # highload v2 的 processed?：-1 已执行，0 没有执行，1 记录已被清理（过期超过 64 秒），无法判断时返回 None
+        address = self.wallet.address.to_string(True, True, True)
+        state = (await self.client.run_get_method(address, 'processed?', [['num', hex(query_id)]]))[0]
+        return {-1: True, 0: False}.get(state)
+
+class WithdrawalQueue:
+    # 提现请求先扣款并写入一条 status='pending' 的 Transaction，由后台任务攒批打款：
+    # 待处理的数量达到 batch_size，或最早的一条等待超过 max_wait 秒时，取出最多 max_batch 条一起发送。
+    # 每条记录的状态：pending -> sending（已分配 batch_id）-> broadcast（已签名，query_id 和过期时间已写入记录）-> sent。
+    # 广播成功也不代表钱包执行了，只有钱包的 processed? 确认执行过才记为 sent；广播前先把 query_id 落库，
+    # 进程重启后也能核对。同一个 query_id 在过期前可以重复广播同一个 BOC（BOC 只在内存里，重启后不再重播，等过期核对）；
+    # 过期后 processed? 确定没有执行的才退回 pending 重试，超过 max_attempts 次记为 failed 并退款；
+    # 链上已经无法判断的记为 unresolved，留给人工核对
+
+    def __init__(self, provider=None, batch_size=WITHDRAW_BATCH_SIZE, max_batch=WITHDRAW_MAX_BATCH,
+                 max_wait=WITHDRAW_MAX_WAIT, max_attempts=WITHDRAW_MAX_ATTEMPTS):
+        self.provider = provider or HighloadWalletProvider()
+        self.batch_size = batch_size
+        self.max_batch = min(max_batch, self.provider.max_messages)
+        self.max_wait = max_wait
+        self.max_attempts = max_attempts
+        self._signed = {}  # batch_id -> SignedBatch：本进程广播过、还没确认的批次，用于过期前重播
+        self.batches = 0
+        self.sent = 0
+        self.failed = 0
+        self.rebroadcasts = 0
+        self.unresolved = 0
+
+    async def enqueue(self, user, asset, amount, payout):
+        # 扣款和写入提现记录在同一个事务里；余额不足返回 None，否则返回扣款后的余额
+        async with get_db_session() as session:
+            result = await session.execute(debit_statement(user.telegram_id, amount))
+            balance = result.scalar()
+            if balance is None:
+                return None
+            await session.execute(insert(Transaction).values(
+                user_id=user.id, amount=amount, type='withdraw', status='pending', asset=asset,
+                destination=user.wallet_address_raw or user.wallet_address, payout=payout, attempts=0,
+            ))
+        user_cache.update(user.telegram_id, balance=balance)
+        return balance
+
+    async def _claim(self):
+        # 满足触发条件时取出一批 pending 记录标记为 sending，返回 (batch_id, 记录)
+        async with get_db_session() as session:
+            result = await session.execute(
+                select(Transaction)
+                .where(Transaction.type == 'withdraw', Transaction.status == 'pending')
+                .order_by(Transaction.id)
+                .limit(self.max_batch)
+                .with_for_update(skip_locked=True)
+            )
+            items = result.scalars().all()
+            if not items:
+                return None, []
+            if len(items) < self.batch_size and items[0].created_at > datetime.now() - timedelta(seconds=self.max_wait):
+                return None, []
+            batch_id = uuid.uuid4().hex
+            await session.execute(
+                update(Transaction)
+                .where(Transaction.id.in_([tx.id for tx in items]))
+                .values(status='sending', batch_id=batch_id, attempts=Transaction.attempts + 1)
+                .execution_options(synchronize_session=False)
+            )
+        return batch_id, items
+
+    async def _mark(self, batch_id, current, **values):
+        # 把一批里仍处于 current 状态的记录改成 values，返回改动的条数
+        async with get_db_session() as session:
+            result = await session.execute(
+                update(Transaction)
+                .where(Transaction.batch_id == batch_id, Transaction.status == current)
+                .values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            return result.rowcount
+
+    async def _release(self, batch_id):
+        # 确定没有上链的批次：还能重试的退回 pending，次数用完的记为 failed 并把扣的余额加回去
+        balances = []
+        async with get_db_session() as session:
+            result = await session.execute(
+                select(Transaction.user_id, Transaction.amount, Transaction.attempts)
+                .where(Transaction.batch_id == batch_id, Transaction.status.in_(['sending', 'broadcast']))
+                .with_for_update()
+            )
+            refunds = defaultdict(int)
+            failed = 0
+            for user_id, amount, attempts in result.all():
+                if attempts >= self.max_attempts:
+                    refunds[user_id] += amount
+                    failed += 1
+            await session.execute(
+                update(Transaction)
+                .where(Transaction.batch_id == batch_id, Transaction.status.in_(['sending', 'broadcast']))
+                .values(
+                    status=case((Transaction.attempts >= self.max_attempts, 'failed'), else_='pending'),
+                    batch_id=None, query_id=None, expires_at=None,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if refunds:
+                result = await session.execute(
+                    update(User)
+                    .where(User.id.in_(refunds))
+                    .values(balance=User.balance + case(dict(refunds), value=User.id, else_=0))
+                    .returning(User.id, User.balance)
+                    .execution_options(synchronize_session=False)
+                )
+                balances = result.all()
+        for user_id, balance in balances:
+            user_cache.update_by_id(user_id, balance=balance)
+        return failed
+
+    async def flush(self):
+        # 广播一批；没有达到触发条件或广播失败时返回 0
+        batch_id, items = await self._claim()
+        if not items:
+            return 0
+        try:
+            signed = self.provider.sign_batch([payout_of(tx) for tx in items])
+        except Exception as e:
+            # 还没签名就失败，肯定没有上链，可以直接退回
+            failed = await self._release(batch_id)
+            self.failed += failed
+            logger.error(f"Withdrawal batch {batch_id} ({len(items)} items) could not be signed, {failed} given up: {e}")
+            return 0
+        # 先落库再广播：记录里没有 query_id 的批次一定没有发出去
+        await self._mark(batch_id, 'sending', status='broadcast', query_id=str(signed.query_id), expires_at=signed.expires_at)
+        self._signed[batch_id] = signed
+        self.batches += 1
+        try:
+            await self.provider.broadcast(signed)
+        except Exception as e:
+            logger.warning(f"Withdrawal batch {batch_id} ({len(items)} items) broadcast failed, will rebroadcast: {e}")
+            return 0
+        logger.info(f"Withdrawal batch {batch_id} broadcast with {len(items)} payouts")
+        return len(items)
+
+    async def reconcile(self):
+        # 核对已广播的批次：processed? 确认执行的记为 sent；没有执行、未过期的重播同一个 BOC；
+        # 过期 settle_delay 秒后仍没有执行的退回，无法判断的记为 unresolved
+        async with get_db_session() as session:
+            result = await session.execute(
+                select(Transaction.batch_id, Transaction.query_id, Transaction.expires_at, func.count())
+                .where(Transaction.type == 'withdraw', Transaction.status == 'broadcast')
+                .group_by(Transaction.batch_id, Transaction.query_id, Transaction.expires_at)
+            )
+            batches = result.all()
+            # sending 的记录在落库 query_id 之前就中断了，从没广播过，超时后可以直接退回
+            result = await session.execute(
+                select(Transaction.batch_id)
+                .where(Transaction.type == 'withdraw', Transaction.status == 'sending',
+                       Transaction.updated_at < datetime.now() - timedelta(seconds=self.provider.timeout))
+                .distinct()
+            )
+            abandoned = result.scalars().all()
+        for batch_id in abandoned:
+            failed = await self._release(batch_id)
+            self.failed += failed
+            logger.warning(f"Withdrawal batch {batch_id} was never broadcast, released ({failed} given up)")
+        for batch_id, query_id, expires_at, count in batches:
+            now = time.time()
+            try:
+                processed = await self.provider.processed(int(query_id))
+                if not processed and now < expires_at + self.provider.settle_delay:
+                    signed = self._signed.get(batch_id)
+                    if signed is not None and now < expires_at:
+                        self.rebroadcasts += 1
+                        await self.provider.broadcast(signed)
+                    continue
+            except Exception as e:
+                logger.warning(f"Withdrawal batch {batch_id} still unconfirmed: {e}")
+                continue
+            self._signed.pop(batch_id, None)
+            if processed:
+                self.sent += await self._mark(batch_id, 'broadcast', status='sent')
+                logger.info(f"Withdrawal batch {batch_id} confirmed on chain with {count} payouts")
+            elif processed is None:
+                self.unresolved += await self._mark(batch_id, 'broadcast', status='unresolved')
+                logger.error(f"Withdrawal batch {batch_id} query {int(query_id):#x} cannot be checked on chain, "
+                             f"marked 'unresolved'")
+            else:
+                failed = await self._release(batch_id)
+                self.failed += failed
+                logger.error(f"Withdrawal batch {batch_id} ({count} items) expired unsent, {failed} given up")
+
+    async def unresolved_batches(self):
+        # 链上无法判断是否执行过的批次：可能已经打款，不能自动重发，需要人工核对
+        async with get_db_session() as session:
+            result = await session.execute(
+                select(Transaction.batch_id, Transaction.query_id, func.count())
+                .where(Transaction.type == 'withdraw', Transaction.status == 'unresolved')
+                .group_by(Transaction.batch_id, Transaction.query_id)
+            )
+            return result.all()
+
+    def metrics(self):
+        return {
+            'batches': self.batches,
+            'sent': self.sent,
+            'failed': self.failed,
+            'unconfirmed': len(self._signed),
+            'rebroadcasts': self.rebroadcasts,
+            'unresolved': self.unresolved,
+        }
+
+withdrawal_queue = WithdrawalQueue()
+
+async def flush_withdrawals_job(context):
+    try:
+        await withdrawal_queue.reconcile()
+        while await withdrawal_queue.flush() >= withdrawal_queue.max_batch:
+            pass
+        for batch_id, query_id, count in await withdrawal_queue.unresolved_batches():
+            logger.warning(f"Withdrawal batch {batch_id} (query {int(query_id):#x}) has {count} unresolved payouts, "
+                           f"check on chain")
+    except Exception as e:
+        logger.error(f"Error flushing withdrawals: {e}", exc_info=True)